@@ -8,39 +8,31 @@ import math
 from math import ceil
 from bisect import bisect_left
 from .models import RADIATOR_MODELS
+from .modules.expertSystem.knowledge_base import KnowledgeBase
+from .modules.expertSystem.expressions import compile_action
+from .modules.expertSystem.templates import TemplateRenderer
+from .modules.expertSystem.expert_engine import (
+    calculate_boiler, recommend_towel_rack_from_catalog, format_towel_rack_recommendation
+)
 
 knowledge_base = None
+template_renderer = TemplateRenderer()
 
 def init_knowledge_base(kb):
-    """Inicializa la base de conocimiento"""
+    """Inicializa la base de conocimiento (lista de nodos o KnowledgeBase ya compilada)"""
     global knowledge_base
-    knowledge_base = kb
+    knowledge_base = kb if isinstance(kb, KnowledgeBase) else KnowledgeBase(kb, EXPRESSION_FUNCTIONS)
+    template_renderer.clear()
 
 def get_node_by_id(node_id):
     """Busca un nodo por su ID en la base de conocimiento"""
     if knowledge_base is None:
         raise RuntimeError("Knowledge base not initialized")
-    for node in knowledge_base:
-        if node.get('id') == node_id:
-            return node
-    return None
+    return knowledge_base.get(node_id)
 
-def replace_variables(text: str, context: Dict[str, Any]) -> str:
-    """Reemplaza variables en el texto usando el contexto"""
-    if not isinstance(text, str):
-        return text
-        
-    for key, val in context.items():
-        if isinstance(val, (int, float, str)):
-            text = text.replace("{{"+key+"}}", str(val))
-    
-    try:
-        from jinja2 import Template
-        template = Template(text)
-        return template.render(**context)
-    except Exception as e:
-        print(f"Error en template Jinja2: {e}")
-        return text
+def replace_variables(text: str, context: Dict[str, Any], key=None) -> str:
+    """Reemplaza variables en el texto usando el contexto (plantilla cacheada por `key`, ej: (id_nodo, campo))"""
+    return template_renderer.render(text, context, key)
 
 def filter_radiators(radiator_type: str, installation: str, style: str, color: str, heat_load: float) -> List[Dict[str, Any]]:
     """Filtra radiadores según las preferencias del usuario"""
@@ -113,69 +105,31 @@ def format_radiator_recommendations(models: List[Dict[str, Any]], heat_load: flo
     return "\n\n".join(result) if result else "No se pudieron generar recomendaciones."
 
 def perform_calculation(node: Dict[str, Any], context: Dict[str, Any]) -> None:
-    """Ejecuta los cálculos definidos en un nodo"""
-    params = node.get("parametros", {})
-    for key, val in params.items():
-        context[key] = val
+    """Ejecuta los cálculos definidos en un nodo (acciones precompiladas en la KB)"""
+    if knowledge_base is None:
+        raise RuntimeError("Knowledge base not initialized")
+    knowledge_base.run_calculation(node, context)
 
-    for action in node.get("acciones", []):
-        exec_expression(action, context)
+def advance_node(node: Dict[str, Any], context: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Ejecuta la cadena de nodos de cálculo a partir de `node` y devuelve el primer nodo a mostrar"""
+    if knowledge_base is None:
+        raise RuntimeError("Knowledge base not initialized")
+    return knowledge_base.advance(node, context)
 
-def calculate_boiler(total_heat_load: float, has_hot_water: bool = False) -> Dict[str, Any]:
-    """
-    Calcula la potencia de caldera necesaria según la documentación del sistema experto
-    
-    Args:
-        total_heat_load: Carga térmica total en kcal/h
-        has_hot_water: Si requiere agua caliente sanitaria
-    
-    Returns:
-        Diccionario con potencia recomendada y tipo de caldera
-    """
-    safety_factor = 1.2
-    hot_water_extra = 5000 if has_hot_water else 0  # kcal/h adicionales para ACS
-    
-    required_power = (total_heat_load * safety_factor) + hot_water_extra
-    
-    # Redondear a potencias estándar: 18000, 24000, 30000, 35000, 45000 kcal/h
-    standard_powers = [18000, 24000, 30000, 35000, 45000]
-    
-    selected_power = standard_powers[-1]  # Por defecto la máxima
-    for power in standard_powers:
-        if power >= required_power:
-            selected_power = power
-            break
-    
-    boiler_type = "Caldera mixta (calefacción + ACS)" if has_hot_water else "Caldera estándar (solo calefacción)"
-    
-    return {
-        'potencia_requerida': required_power,
-        'potencia_recomendada': selected_power,
-        'tipo_caldera': boiler_type,
-        'factor_seguridad': safety_factor
-    }
+# Funciones auxiliares disponibles en las acciones de la KB (se enlazan al compilar)
+EXPRESSION_FUNCTIONS = {
+    'filter_radiators': filter_radiators,
+    'format_radiator_recommendations': format_radiator_recommendations,
+    'calculate_boiler': calculate_boiler,
+    'recommend_towel_rack_from_catalog': recommend_towel_rack_from_catalog,
+    'format_towel_rack_recommendation': format_towel_rack_recommendation,
+    'ceil': ceil,
+}
 
 def exec_expression(expr: str, context: Dict[str, Any]) -> None:
-    """Ejecuta una expresión matemática y guarda el resultado en el contexto"""
+    """Ejecuta una expresión suelta (fuera de la KB) y guarda el resultado en el contexto"""
     try:
-        # Agregar funciones especiales al contexto
-        local_context = {
-            'filter_radiators': filter_radiators,
-            'format_radiator_recommendations': format_radiator_recommendations,
-            'calculate_boiler': calculate_boiler,
-            'ceil': ceil,
-            'context': context  # Pasamos el contexto completo
-        }
-        
-        # Dividir la expresión en variable y valor
-        var, val_expr = [x.strip() for x in expr.split("=", 1)]
-        
-        # Reemplazar context['variable'] por simplemente variable
-        val_expr = val_expr.replace("context['", "").replace("']", "")
-        
-        # Evaluar la expresión con las variables del contexto
-        val = eval(val_expr, {"__builtins__": None}, {**context, **local_context})
-        context[var] = val
+        compile_action(expr, EXPRESSION_FUNCTIONS)(context)
     except Exception as e:
         print(f"Error evaluando expresión '{expr}': {e}")
         raise
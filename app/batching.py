@@ -0,0 +1,112 @@
+"""
+batching.py - Micro-batching asíncrono de consultas
+
+Bajo carga concurrente, cada chat vectoriza su consulta por separado y el
+modelo de embeddings procesa lotes de 1. `MicroBatcher` junta las consultas
+que llegan dentro de una ventana corta (pocos milisegundos) o hasta un tamaño
+máximo, las procesa con una única llamada por lotes (un solo `encode` y un
+solo `index.search`) y devuelve a cada llamador su resultado.
+
+Configuración por variables de entorno:
+    SOLDASUR_BATCH_WINDOW_MS    Ventana de espera para juntar consultas (5)
+    SOLDASUR_BATCH_MAX          Máximo de consultas por lote (32)
+"""
+
+import asyncio
+import os
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+DEFAULT_WINDOW_MS = 5.0
+DEFAULT_MAX_BATCH = 32
+
+
+class MicroBatcher:
+    """
+    Agrupa llamadas concurrentes en lotes.
+
+    `batch_fn` recibe la lista de elementos del lote y devuelve una lista de
+    resultados en el mismo orden. Se ejecuta en el threadpool para no
+    bloquear el event loop. Si falla, todos los llamadores del lote reciben
+    la excepción.
+    """
+
+    def __init__(self, batch_fn: Callable[[List[Any]], Sequence[Any]],
+                 window_ms: Optional[float] = None,
+                 max_batch_size: Optional[int] = None):
+        """
+        Args:
+            batch_fn: Función que procesa un lote completo
+            window_ms: Milisegundos que se espera a más consultas (por defecto SOLDASUR_BATCH_WINDOW_MS)
+            max_batch_size: Tamaño con el que el lote sale sin esperar (por defecto SOLDASUR_BATCH_MAX)
+        """
+        self.batch_fn = batch_fn
+        self.window = (window_ms if window_ms is not None
+                       else float(os.getenv('SOLDASUR_BATCH_WINDOW_MS', DEFAULT_WINDOW_MS))) / 1000
+        self.max_batch_size = (max_batch_size if max_batch_size is not None
+                               else int(os.getenv('SOLDASUR_BATCH_MAX', DEFAULT_MAX_BATCH)))
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()  # Referencias a los lotes en curso (evita que el GC los cancele)
+        self.batches = 0
+        self.items = 0
+        self.max_seen = 0
+
+    async def submit(self, item: Any) -> Any:
+        """
+        Encola un elemento y espera su resultado.
+
+        Args:
+            item: Elemento a procesar (ej: la consulta)
+
+        Returns:
+            Resultado correspondiente a `item`
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        """Despacha las consultas pendientes como un lote"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        self.batches += 1
+        self.items += len(batch)
+        self.max_seen = max(self.max_seen, len(batch))
+        try:
+            results = list(await run_in_threadpool(self.batch_fn, [item for item, _ in batch]))
+            if len(results) != len(batch):
+                # Sin esto `zip` truncaría y las consultas sobrantes quedarían esperando para siempre
+                raise ValueError(f"batch_fn devolvió {len(results)} resultados para {len(batch)} elementos")
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de lotes procesados"""
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'avg_batch_size': round(self.items / self.batches, 2) if self.batches else 0.0,
+            'max_batch_size': self.max_seen,
+            'window_ms': self.window * 1000,
+        }
@@ -0,0 +1,192 @@
+"""
+cache.py - Caché LRU con expiración (TTL) y contabilidad de memoria
+
+Estructura compartida por los almacenes en memoria del proyecto (sesiones,
+respuestas, embeddings). Es segura para usar desde el threadpool de FastAPI.
+"""
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterator, Optional, Tuple
+
+
+def deep_sizeof(obj: Any) -> int:
+    """
+    Estima el tamaño en memoria de un objeto y todo lo que contiene.
+
+    Recorre dicts, listas, tuplas y sets (sin contar dos veces el mismo objeto).
+
+    Args:
+        obj: Objeto a medir
+
+    Returns:
+        Tamaño aproximado en bytes
+    """
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack:
+        current = stack.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        total += sys.getsizeof(current)
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            stack.extend(current)
+    return total
+
+
+class LRUCache:
+    """
+    Caché LRU acotada por cantidad de entradas y/o bytes, con TTL deslizante.
+
+    Cada acceso con `get` renueva la entrada (pasa a ser la más reciente y
+    reinicia su TTL). Las entradas vencidas se descartan al accederlas y en
+    cada escritura.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, ttl: Optional[float] = None,
+                 max_bytes: Optional[int] = None,
+                 sizeof: Optional[Callable[[Any], int]] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            max_entries: Máximo de entradas (None = sin límite)
+            ttl: Segundos sin acceso tras los cuales una entrada vence (None = no vence)
+            max_bytes: Máximo de memoria estimada (requiere `sizeof`)
+            sizeof: Función que estima el tamaño de un valor en bytes
+            clock: Reloj monotónico (inyectable para pruebas)
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.clock = clock
+        # clave → (valor, último acceso, bytes)
+        self._data: "OrderedDict[Hashable, Tuple[Any, float, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _expired(self, last_access: float, now: float) -> bool:
+        return self.ttl is not None and now - last_access > self.ttl
+
+    def _remove(self, key: Hashable) -> Any:
+        value, _, size = self._data.pop(key)
+        self._bytes -= size
+        return value
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Obtiene un valor y lo marca como recién usado"""
+        with self._lock:
+            entry = self._data.get(key)
+            now = self.clock()
+            if entry is None:
+                self.misses += 1
+                return default
+            if self._expired(entry[1], now):
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data[key] = (entry[0], now, entry[2])
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Guarda (o reemplaza) un valor y aplica los límites"""
+        with self._lock:
+            size = self.sizeof(value) if self.sizeof else 0
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, self.clock(), size)
+            self._bytes += size
+            self.purge_expired()
+            self._enforce_limits(keep=key)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Elimina una entrada y devuelve su valor"""
+        with self._lock:
+            if key not in self._data:
+                return default
+            return self._remove(key)
+
+    def _enforce_limits(self, keep: Hashable) -> None:
+        """Desaloja las entradas menos usadas hasta cumplir los límites"""
+        while self._data:
+            over_entries = self.max_entries is not None and len(self._data) > self.max_entries
+            over_bytes = self.max_bytes is not None and self._bytes > self.max_bytes
+            if not (over_entries or over_bytes):
+                break
+            oldest = next(iter(self._data))
+            if oldest == keep and len(self._data) == 1:
+                break  # Nunca desalojar la entrada recién escrita si es la única
+            self._remove(oldest)
+            self.evictions += 1
+
+    def purge_expired(self) -> int:
+        """
+        Descarta las entradas vencidas.
+
+        Returns:
+            Cantidad de entradas descartadas
+        """
+        if self.ttl is None:
+            return 0
+        with self._lock:
+            now = self.clock()
+            removed = 0
+            # El orden LRU coincide con el orden de último acceso
+            while self._data:
+                key, (_, last_access, _) = next(iter(self._data.items()))
+                if not self._expired(last_access, now):
+                    break
+                self._remove(key)
+                removed += 1
+            self.expirations += removed
+            return removed
+
+    def clear(self) -> None:
+        """Vacía la caché (los contadores se conservan)"""
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def keys(self) -> Iterator[Hashable]:
+        """Claves vigentes, de la menos a la más recientemente usada"""
+        with self._lock:
+            return iter(list(self._data.keys()))
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and not self._expired(entry[1], self.clock())
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @property
+    def bytes(self) -> int:
+        """Memoria estimada ocupada por los valores"""
+        return self._bytes
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de uso de la caché"""
+        with self._lock:
+            return {
+                'entries': len(self._data),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
@@ -0,0 +1,130 @@
+"""
+embedding_cache.py - Caché LRU de embeddings de consultas
+
+Las mismas consultas cortas se vectorizan una y otra vez: preguntas
+frecuentes del chat y, sobre todo, los `rag_query`/`pregunta` fijos de los
+nodos de la base de conocimiento que usa el enriquecimiento del flujo
+experto. Esta caché guarda texto normalizado → vector float32 (L2-normalizado)
+y es compartida por `RAGEngineV2` y `query/query.py`.
+
+La clave incluye el nombre del modelo: cada stack usa el suyo y sus vectores
+no son intercambiables.
+
+Configuración por variables de entorno:
+    SOLDASUR_EMBEDDING_CACHE_SIZE   Máximo de vectores en memoria (4096; 0 = desactivada)
+"""
+
+import os
+import threading
+import unicodedata
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from app.cache import LRUCache
+
+DEFAULT_CACHE_SIZE = 4096
+
+
+def normalize_query_text(text: str) -> str:
+    """Normaliza una consulta para usarla como clave (Unicode NFC, espacios colapsados)"""
+    return " ".join(unicodedata.normalize('NFC', text or "").split())
+
+
+class EmbeddingCache:
+    """
+    LRU de embeddings de consultas indexado por (modelo, texto normalizado).
+
+    Los vectores se guardan como arrays de sólo lectura: quien los reciba y
+    necesite modificarlos debe copiarlos.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_CACHE_SIZE):
+        """
+        Args:
+            max_entries: Máximo de vectores guardados (0 = no cachear)
+        """
+        self.enabled = max_entries > 0
+        self._cache = LRUCache(max_entries=max_entries or None, sizeof=lambda v: v.nbytes)
+
+    @classmethod
+    def from_env(cls) -> "EmbeddingCache":
+        """Crea la caché con el tamaño configurado en SOLDASUR_EMBEDDING_CACHE_SIZE"""
+        size = os.getenv('SOLDASUR_EMBEDDING_CACHE_SIZE')
+        return cls(int(size) if size else DEFAULT_CACHE_SIZE)
+
+    def encode(self, model: Any, model_name: str, texts: Iterable[str]) -> np.ndarray:
+        """
+        Devuelve los embeddings L2-normalizados de `texts`, vectorizando sólo los que faltan.
+
+        Los faltantes se vectorizan juntos en una sola llamada a `model.encode`.
+
+        Args:
+            model: Modelo con `encode(lista_de_textos)`
+            model_name: Nombre del modelo (parte de la clave)
+            texts: Consultas
+
+        Returns:
+            Array float32 de forma (len(texts), dimensión)
+        """
+        keys = [normalize_query_text(t) for t in texts]
+        vectors: List[Optional[np.ndarray]] = [
+            self._cache.get((model_name, key)) if self.enabled else None for key in keys
+        ]
+
+        missing = {}  # texto normalizado → posiciones (sin repetir el encode)
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                missing.setdefault(keys[i], []).append(i)
+
+        if missing:
+            encoded = np.array(model.encode(list(missing), show_progress_bar=False),
+                               dtype='float32')
+            norms = np.linalg.norm(encoded, axis=1, keepdims=True)
+            encoded /= np.where(norms == 0, 1, norms)
+            for key, vector in zip(missing, encoded):
+                vector.setflags(write=False)
+                if self.enabled:
+                    self._cache.put((model_name, key), vector)
+                for i in missing[key]:
+                    vectors[i] = vector
+
+        if not vectors:
+            return np.empty((0, 0), dtype='float32')
+        return np.stack(vectors)
+
+    def seed(self, model: Any, model_name: str, texts: Iterable[str]) -> int:
+        """
+        Precarga la caché con consultas conocidas (ej: las de la base de conocimiento).
+
+        Returns:
+            Cantidad de textos distintos precargados
+        """
+        unique = list(dict.fromkeys(t for t in texts if t and t.strip()))
+        if unique and self.enabled:
+            self.encode(model, model_name, unique)
+        return len(unique)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de uso de la caché"""
+        return self._cache.stats()
+
+
+_embedding_cache: Optional[EmbeddingCache] = None
+_embedding_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Caché de embeddings compartida por todo el proceso"""
+    global _embedding_cache
+    if _embedding_cache is None:
+        with _embedding_cache_lock:
+            if _embedding_cache is None:
+                _embedding_cache = EmbeddingCache.from_env()
+    return _embedding_cache
@@ -0,0 +1,264 @@
+"""
+embeddings.py - Backends de embeddings intercambiables
+
+El modelo de sentence-transformers (uno solo, compartido por el RAG e
+ingest/query a través de index_service.py) es, después del LLM, el mayor
+costo de CPU por consulta.
+Este módulo define una interfaz común y dos implementaciones:
+
+- `SentenceTransformerBackend` ("torch"): el encoder original.
+- `OnnxInt8Backend` ("onnx-int8"): el mismo modelo exportado a ONNX con
+  cuantización dinámica int8 y ejecutado con ONNX Runtime en CPU. La
+  exportación se hace una sola vez y queda en `models/onnx/<modelo>/`.
+
+Los vectores de ambos backends son muy parecidos pero no idénticos: el
+índice y las consultas deben usar el mismo. Por eso `cache_key` incluye el
+backend y se usa como nombre de modelo en los índices persistidos y en la
+caché de embeddings. Para medir la diferencia y la ganancia ver
+`scripts/benchmark_embeddings.py`.
+
+Configuración por variables de entorno:
+    SOLDASUR_EMBEDDING_BACKEND   "torch" (por defecto) u "onnx-int8"
+    SOLDASUR_ONNX_DIR            Carpeta de los modelos exportados (models/onnx)
+
+Requisitos del backend ONNX (opcionales):
+    pip install onnx onnxruntime
+"""
+
+import json
+import os
+import re
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+DEFAULT_BACKEND = "torch"
+DEFAULT_ONNX_DIR = Path(__file__).resolve().parents[1] / "models" / "onnx"
+BACKENDS = ("torch", "onnx-int8")
+
+
+def _l2_normalize(embeddings: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.where(norms == 0, 1, norms)
+
+
+class EmbeddingBackend(ABC):
+    """
+    Interfaz de un backend de embeddings.
+
+    `encode` acepta los mismos argumentos que usa el proyecto de
+    `SentenceTransformer.encode`, así que un backend puede reemplazar al modelo
+    en cualquier lugar que hoy lo recibe.
+    """
+
+    name = "base"
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+
+    @property
+    def cache_key(self) -> str:
+        """Identificador de los vectores que produce (modelo + backend)"""
+        return self.model_name if self.name == "torch" else f"{self.model_name}@{self.name}"
+
+    @property
+    @abstractmethod
+    def dimension(self) -> int:
+        """Dimensión de los vectores"""
+
+    @abstractmethod
+    def encode(self, texts: Sequence[str], batch_size: int = 32,
+               show_progress_bar: bool = False,
+               normalize_embeddings: bool = False) -> np.ndarray:
+        """
+        Vectoriza textos.
+
+        Args:
+            texts: Textos a vectorizar
+            batch_size: Textos por pasada del modelo
+            show_progress_bar: Mostrar progreso (sólo backends que lo soportan)
+            normalize_embeddings: Devolver vectores con norma L2 = 1
+
+        Returns:
+            Array float32 de forma (len(texts), dimensión)
+        """
+
+
+class SentenceTransformerBackend(EmbeddingBackend):
+    """Encoder original de sentence-transformers (torch)"""
+
+    name = "torch"
+
+    def __init__(self, model_name: str, device: str = "cpu"):
+        super().__init__(model_name)
+        # Import diferido: sentence-transformers carga torch (segundos)
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name, device=device)
+
+    @property
+    def dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts: Sequence[str], batch_size: int = 32,
+               show_progress_bar: bool = False,
+               normalize_embeddings: bool = False) -> np.ndarray:
+        return np.asarray(self.model.encode(
+            list(texts), batch_size=batch_size, show_progress_bar=show_progress_bar,
+            normalize_embeddings=normalize_embeddings
+        ), dtype='float32')
+
+
+def _model_slug(model_name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "__", model_name)
+
+
+def export_onnx_int8(model_name: str, output_dir: Path, opset: int = 17) -> Path:
+    """
+    Exporta un modelo de sentence-transformers a ONNX y lo cuantiza a int8.
+
+    Se exporta el pipeline completo (transformer + pooling + capas densas /
+    normalización si las tiene), de modo que la salida es directamente el
+    embedding de la oración.
+
+    Args:
+        model_name: Modelo de sentence-transformers
+        output_dir: Carpeta de salida (modelo, tokenizer y manifiesto)
+        opset: Versión de opset de ONNX
+
+    Returns:
+        Ruta del modelo cuantizado
+    """
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from sentence_transformers import SentenceTransformer
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    st_model = SentenceTransformer(model_name, device="cpu").eval()
+
+    class _SentenceEncoder(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask):
+            features = self.model({'input_ids': input_ids, 'attention_mask': attention_mask})
+            return features['sentence_embedding']
+
+    sample = st_model.tokenizer(["exportar modelo"], return_tensors="pt")
+    fp32_path = output_dir / "model.onnx"
+    with torch.no_grad():
+        torch.onnx.export(
+            _SentenceEncoder(st_model),
+            (sample['input_ids'], sample['attention_mask']),
+            str(fp32_path),
+            input_names=['input_ids', 'attention_mask'],
+            output_names=['sentence_embedding'],
+            dynamic_axes={
+                'input_ids': {0: 'batch', 1: 'sequence'},
+                'attention_mask': {0: 'batch', 1: 'sequence'},
+                'sentence_embedding': {0: 'batch'},
+            },
+            opset_version=opset,
+        )
+
+    int8_path = output_dir / "model.int8.onnx"
+    quantize_dynamic(str(fp32_path), str(int8_path), weight_type=QuantType.QInt8)
+    fp32_path.unlink()
+
+    st_model.tokenizer.save_pretrained(str(output_dir))
+    manifest = {
+        'model': model_name,
+        'dimension': st_model.get_sentence_embedding_dimension(),
+        'max_seq_length': st_model.max_seq_length,
+        'opset': opset,
+        'quantization': 'dynamic-int8',
+    }
+    (output_dir / "manifest.json").write_text(json.dumps(manifest, indent=2), encoding='utf-8')
+    return int8_path
+
+
+class OnnxInt8Backend(EmbeddingBackend):
+    """Modelo exportado a ONNX con cuantización dinámica int8 (ONNX Runtime, CPU)"""
+
+    name = "onnx-int8"
+
+    def __init__(self, model_name: str, model_dir: Optional[Path] = None,
+                 num_threads: Optional[int] = None):
+        """
+        Args:
+            model_name: Modelo de sentence-transformers de origen
+            model_dir: Carpeta del modelo exportado (se exporta si no existe)
+            num_threads: Hilos de ONNX Runtime (por defecto los que elija el runtime)
+        """
+        super().__init__(model_name)
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        base_dir = Path(os.getenv('SOLDASUR_ONNX_DIR', DEFAULT_ONNX_DIR))
+        self.model_dir = Path(model_dir) if model_dir else base_dir / _model_slug(model_name)
+        model_path = self.model_dir / "model.int8.onnx"
+        manifest_path = self.model_dir / "manifest.json"
+        if not model_path.exists() or not manifest_path.exists():
+            print(f"  Exportando {model_name} a ONNX int8 en {self.model_dir}...")
+            export_onnx_int8(model_name, self.model_dir)
+
+        self.manifest = json.loads(manifest_path.read_text(encoding='utf-8'))
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(str(model_path), options,
+                                            providers=['CPUExecutionProvider'])
+        self.tokenizer = AutoTokenizer.from_pretrained(str(self.model_dir))
+        self.max_seq_length = self.manifest.get('max_seq_length') or 128
+
+    @property
+    def dimension(self) -> int:
+        return self.manifest['dimension']
+
+    def encode(self, texts: Sequence[str], batch_size: int = 32,
+               show_progress_bar: bool = False,
+               normalize_embeddings: bool = False) -> np.ndarray:
+        texts = list(texts)
+        if not texts:
+            return np.empty((0, self.dimension), dtype='float32')
+        outputs: List[np.ndarray] = []
+        for start in range(0, len(texts), batch_size):
+            tokens = self.tokenizer(
+                texts[start:start + batch_size], padding=True, truncation=True,
+                max_length=self.max_seq_length, return_tensors='np'
+            )
+            (embeddings,) = self.session.run(None, {
+                'input_ids': tokens['input_ids'].astype('int64'),
+                'attention_mask': tokens['attention_mask'].astype('int64'),
+            })
+            outputs.append(embeddings)
+        result = np.concatenate(outputs).astype('float32')
+        return _l2_normalize(result) if normalize_embeddings else result
+
+
+def create_embedding_backend(model_name: str, backend: Optional[str] = None) -> EmbeddingBackend:
+    """
+    Crea el backend de embeddings configurado.
+
+    Si el backend ONNX no está disponible (faltan onnxruntime/transformers o
+    falla la exportación) se informa y se usa torch.
+
+    Args:
+        model_name: Modelo de sentence-transformers
+        backend: "torch" u "onnx-int8" (por defecto SOLDASUR_EMBEDDING_BACKEND)
+
+    Returns:
+        Backend listo para vectorizar
+    """
+    backend = (backend or os.getenv('SOLDASUR_EMBEDDING_BACKEND', DEFAULT_BACKEND)).lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend de embeddings desconocido: '{backend}'")
+    if backend == "onnx-int8":
+        try:
+            return OnnxInt8Backend(model_name)
+        except Exception as e:
+            print(f"  Backend ONNX no disponible ({e}); se usa torch")
+    return SentenceTransformerBackend(model_name)
+
@@ -1,20 +1,43 @@
 # app/main.py
 from fastapi import FastAPI, Query, HTTPException
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, Dict, Any, List
+from contextlib import asynccontextmanager
 import json
 import math
+import threading
+import time
 from math import ceil
 from bisect import bisect_left
 from app.models import RADIATOR_MODELS
-from query.query import search_filtered
-from app.modules.chatbot.llm_wrapper import answer
-from app.app import replace_variables, filter_radiators, perform_calculation, format_radiator_recommendations, exec_expression
-from app.app import init_knowledge_base, get_node_by_id  # modificar import
+from app.app import replace_variables, filter_radiators, format_radiator_recommendations, exec_expression, advance_node
+from app.app import init_knowledge_base, get_node_by_id, EXPRESSION_FUNCTIONS  # modificar import
+from app.modules.expertSystem.knowledge_base import KnowledgeBase, TraversalError
+from app.session_store import create_session_store
+from app.providers import get_llm, get_product_search_batch, llm_provider, warmup
+from app.batching import MicroBatcher
 
-app = FastAPI(title="PEISA - SOLDASUR S.A", description="Asistente para cálculos de calefacción")
+# Duración de cada fase de arranque en segundos (se informa en /health)
+startup_timings: Dict[str, float] = {}
+
+def _timed(phase: str, start: float) -> None:
+    startup_timings[phase] = round(time.perf_counter() - start, 3)
+    print(f"  [{phase}] listo en {startup_timings[phase]:.3f}s")
+
+def _background_warmup() -> None:
+    """Precarga LLM e índice de productos sin demorar la disponibilidad del flujo experto"""
+    startup_timings.update(warmup())
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # El flujo experto ya está listo; los componentes pesados se cargan en segundo plano
+    threading.Thread(target=_background_warmup, name="warmup", daemon=True).start()
+    yield
+
+app = FastAPI(title="PEISA - SOLDASUR S.A", description="Asistente para cálculos de calefacción",
+              lifespan=lifespan)
 
 # Modelos Pydantic para request/response
 class StartConversationRequest(BaseModel):
@@ -37,19 +60,21 @@ class ConversationResponse(BaseModel):
     is_final: Optional[bool] = None
     error: Optional[str] = None
 
-# Cargar la base de conocimiento
+# Cargar y compilar la base de conocimiento (índice por ID, aristas validadas, acciones compiladas)
+_start = time.perf_counter()
 try:
-    with open("app/peisa_advisor_knowledge_base.json", "r", encoding="utf-8") as f:
-        knowledge_base = json.load(f)
-        init_knowledge_base(knowledge_base)  # Inicializar la base de conocimiento
+    knowledge_base = KnowledgeBase.from_file("app/peisa_advisor_knowledge_base.json", EXPRESSION_FUNCTIONS)
 except FileNotFoundError:
     print("Advertencia: No se encontró el archivo peisa_advisor_knowledge_base.json")
-    knowledge_base = []
-    init_knowledge_base(knowledge_base)
+    knowledge_base = KnowledgeBase([])
+init_knowledge_base(knowledge_base)
+_timed("knowledge_base", _start)
 
 
-# Contexto de la conversación
-conversations = {}
+# Contexto de la conversación (almacén acotado: LRU + TTL + tope de memoria)
+_start = time.perf_counter()
+conversations = create_session_store()
+_timed("sessions", _start)
 
 # Servir archivos estáticos (CSS, JS, imágenes)
 # app.mount("/app/static", StaticFiles(directory="static"), name="static")
@@ -67,11 +92,11 @@ async def home():
 async def start_conversation(request: StartConversationRequest):
     """Inicia una nueva conversación"""
     conversation_id = request.conversation_id
-    conversations[conversation_id] = {
+    conv = {
         'current_node': 'inicio',
         'context': {}
     }
-    return await get_next_message(conversation_id)
+    return await get_next_message(conversation_id, conv)
 
 @app.post("/reply", response_model=ConversationResponse)
 async def handle_reply(request: ReplyRequest):
@@ -80,10 +105,10 @@ async def handle_reply(request: ReplyRequest):
     option_index = request.option_index
     input_values = request.input_values or {}
     
-    if conversation_id not in conversations:
+    conv = conversations.get(conversation_id)
+    if conv is None:
         raise HTTPException(status_code=404, detail="Conversación no encontrada")
     
-    conv = conversations[conversation_id]
     node = get_node_by_id(conv['current_node'])
     
     if not node:
@@ -122,29 +147,35 @@ async def handle_reply(request: ReplyRequest):
     # Debug: Mostrar el contexto completo
     print("Contexto completo:", conv['context'])
     
-    return await get_next_message(conversation_id)
+    return await get_next_message(conversation_id, conv)
 
-async def get_next_message(conversation_id: str) -> ConversationResponse:
-    """Obtiene el siguiente mensaje de la conversación"""
-    conv = conversations[conversation_id]
+async def get_next_message(conversation_id: str, conv: Dict[str, Any]) -> ConversationResponse:
+    """Obtiene el siguiente mensaje de la conversación y guarda su estado"""
     node = get_node_by_id(conv['current_node'])
     
     if not node:
         raise HTTPException(status_code=404, detail="Nodo no encontrado")
     
+    # Ejecutar en un bucle la cadena de nodos de cálculo hasta el próximo nodo a mostrar
+    try:
+        node = advance_node(node, conv['context'])
+    except TraversalError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    if not node:
+        raise HTTPException(status_code=404, detail="Nodo no encontrado")
+    conv['current_node'] = node['id']
+    conversations[conversation_id] = conv
+    
     response = ConversationResponse(
         conversation_id=conversation_id,
         node_id=node['id']
     )
     
     # Procesar según el tipo de nodo
-    if node.get('tipo') == 'calculo':
-        perform_calculation(node, conv['context'])
-        conv['current_node'] = node['siguiente']
-        return await get_next_message(conversation_id)
-    elif 'pregunta' in node:
+    if 'pregunta' in node:
         response.type = 'question'
-        response.text = replace_variables(node['pregunta'], conv['context'])
+        response.text = replace_variables(node['pregunta'], conv['context'], (node['id'], 'pregunta'))
         
         if 'opciones' in node:
             response.options = [opt['texto'] for opt in node['opciones']]
@@ -160,7 +191,7 @@ async def get_next_message(conversation_id: str) -> ConversationResponse:
                 ]
     elif node.get('tipo') == 'respuesta':
         response.type = 'response'
-        response.text = replace_variables(node['texto'], conv['context'])
+        response.text = replace_variables(node['texto'], conv['context'], (node['id'], 'texto'))
         
         if 'opciones' in node:
             response.options = [opt['texto'] for opt in node['opciones']]
@@ -183,14 +214,53 @@ async def get_next_message(conversation_id: str) -> ConversationResponse:
 @app.get("/health")
 async def health_check():
     """Endpoint de verificación de salud del servicio"""
-    return {"status": "ok", "service": "PEISA - SOLDASUR S.A"}
+    # No forzar la carga del LLM sólo para informar la salud
+    llm = llm_provider.get() if llm_provider.loaded else None
+    return {
+        "status": "ok",
+        "service": "PEISA - SOLDASUR S.A",
+        "sessions": conversations.stats(),
+        "llm_cache": llm.response_cache.stats() if llm and llm.response_cache else None,
+        "startup": startup_timings,
+        "search_batching": search_batcher.stats(),
+    }
+
+def _search_batch(items: List[tuple]) -> List[List[Dict[str, Any]]]:
+    """Busca un lote de (pregunta, top_k) en el índice de productos"""
+    return get_product_search_batch()([q for q, _ in items], [k for _, k in items])
+
+# Las búsquedas concurrentes se vectorizan juntas (un encode + un index.search por lote)
+search_batcher = MicroBatcher(_search_batch)
 
 @app.get("/ask")
-def ask(question: str = Query(..., min_length=5)):
-    top_items = search_filtered(question, top_k=3)
-    respuesta = answer(question, top_items)
+async def ask(question: str = Query(..., min_length=5)):
+    top_items = await search_batcher.submit((question, 3))
+    respuesta = await get_llm().agenerate(question, top_items)
     return {"respuesta": respuesta, "productos": top_items}
 
+def _sse(data: Dict[str, Any], event: Optional[str] = None) -> str:
+    """Formatea un evento Server-Sent Events"""
+    payload = json.dumps(data, ensure_ascii=False)
+    return (f"event: {event}\n" if event else "") + f"data: {payload}\n\n"
+
+@app.get("/ask/stream")
+async def ask_stream(question: str = Query(..., min_length=5)):
+    """Versión en streaming (SSE) de /ask: productos primero, luego la respuesta token a token"""
+    top_items = await search_batcher.submit((question, 3))
+    llm = get_llm()
+
+    async def events():
+        yield _sse({"productos": top_items}, event="productos")
+        async for chunk in llm.astream(question, top_items):
+            yield _sse({"delta": chunk})
+        yield _sse({}, event="fin")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 if __name__ == '__main__':
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
@@ -0,0 +1,183 @@
+"""
+chunking.py - Textos y fragmentos (pasajes) de producto para el índice vectorial
+
+Un producto se indexa como varios vectores:
+    - un resumen (`product_to_text`): modelo, familia, tipo, categoría,
+      descripción y datos numéricos
+    - un pasaje por cada característica técnica (`technical_features`),
+      ventaja (`advantages`) y especificación (`specifications`) que trae el
+      scraper, prefijado con el modelo para que el pasaje tenga contexto
+
+Los pasajes repetidos (una especificación que repite una característica) se
+descartan, y si un producto tiene más pasajes que el máximo se agrupan los
+consecutivos: la cantidad de vectores por producto queda acotada en
+`MAX_CHUNKS_PER_PRODUCT`. La búsqueda toma la máxima similitud de los
+fragmentos de cada producto (ver `ProductIndexService.search_passages`) y
+el pasaje ganador queda disponible para citarlo en la respuesta.
+"""
+
+import math
+import re
+from typing import Any, Dict, List, Optional, Sequence
+
+MAX_CHUNKS_PER_PRODUCT = 8   # resumen + hasta 7 pasajes
+
+PASSAGE_LABELS = {
+    'technical_features': 'Característica',
+    'advantages': 'Ventaja',
+}
+
+
+def field_value(product: Dict[str, Any], key: str) -> Any:
+    """Lee un campo aceptando la variante en inglés de los CSV (`type_en`, ...)"""
+    value = product.get(key)
+    if value is None or value == "":
+        value = product.get(f"{key}_en")
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def product_key(product: Dict[str, Any]) -> str:
+    """
+    Clave estable de un producto entre ingestas: `id` / `sku` si el origen lo
+    trae, si no la URL de la ficha, y como último recurso familia + tipo + modelo.
+    """
+    for key in ('id', 'sku', 'url'):
+        value = field_value(product, key)
+        if value not in (None, ""):
+            return f"{key}:{str(value).strip()}"
+    return "model:" + "|".join(str(field_value(product, key) or "").strip().lower()
+                               for key in ('family', 'type', 'model'))
+
+
+def product_keys(products: Sequence[Dict[str, Any]],
+                 seen: Optional[Dict[str, int]] = None) -> List[str]:
+    """
+    Clave de cada producto; las repetidas se desambiguan por orden de aparición (`#2`, ...).
+
+    Args:
+        products: Productos en orden
+        seen: Conteo de claves ya vistas, para llamar por lotes (se actualiza)
+    """
+    keys, seen = [], seen if seen is not None else {}
+    for product in products:
+        key = product_key(product)
+        seen[key] = seen.get(key, 0) + 1
+        keys.append(key if seen[key] == 1 else f"{key}#{seen[key]}")
+    return keys
+
+
+def to_number(value: Any) -> Optional[float]:
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(number) else number
+
+
+def _format_number(value: Any) -> str:
+    """17000.0 → "17000", 18.5 → "18.5" """
+    number = to_number(value) or 0.0
+    return str(int(number)) if number.is_integer() else str(number)
+
+
+def product_to_text(product: Dict[str, Any]) -> str:
+    """
+    Convierte un producto (del catálogo JSON o de una fila CSV) al texto de su resumen.
+    """
+    parts = [
+        f"Producto: {field_value(product, 'model') or ''}",
+        f"Familia: {field_value(product, 'family') or ''}",
+        f"Tipo: {field_value(product, 'type') or ''}",
+    ]
+    category = " / ".join(str(c) for c in (field_value(product, 'category'),
+                                           field_value(product, 'subcategory')) if c)
+    if category:
+        parts.append(f"Categoría: {category}")
+    parts.append(f"Descripción: {field_value(product, 'description') or ''}")
+
+    if to_number(product.get('power_w')):
+        parts.append(f"Potencia: {_format_number(product['power_w'])} W")
+    if to_number(product.get('liters')):
+        parts.append(f"Capacidad: {_format_number(product['liters'])} litros")
+    if to_number(product.get('max_pressure_bar')):
+        parts.append(f"Presión máxima: {_format_number(product['max_pressure_bar'])} bar")
+
+    return " ".join(parts)
+
+
+def _dedup_key(text: str) -> str:
+    return " ".join(re.findall(r"\w+", text.lower()))
+
+
+def product_passages(product: Dict[str, Any]) -> List[Dict[str, str]]:
+    """
+    Pasajes de un producto, sin repetidos: [{'kind': ..., 'passage': ...}]
+
+    `kind` es el campo de origen (technical_features, advantages, specifications).
+    """
+    passages, seen = [], set()
+
+    def add(kind: str, text: Any) -> None:
+        text = str(text or "").strip()
+        key = _dedup_key(text)
+        if key and key not in seen:
+            seen.add(key)
+            passages.append({'kind': kind, 'passage': text})
+
+    for kind in ('technical_features', 'advantages'):
+        value = product.get(kind)
+        for item in (value if isinstance(value, (list, tuple)) else [value] if value else []):
+            add(kind, item)
+
+    specifications = product.get('specifications')
+    if isinstance(specifications, dict):
+        for name, value in specifications.items():
+            add('specifications', f"{name}: {value}" if value else name)
+    return passages
+
+
+def product_chunks(product: Dict[str, Any],
+                   max_chunks: int = MAX_CHUNKS_PER_PRODUCT) -> List[Dict[str, str]]:
+    """
+    Fragmentos a vectorizar de un producto (el primero es siempre el resumen).
+
+    Args:
+        product: Producto del catálogo
+        max_chunks: Máximo de fragmentos (los pasajes sobrantes se agrupan)
+
+    Returns:
+        Lista de {'kind', 'passage', 'text'}: `text` es lo que se vectoriza y
+        `passage` lo que se cita
+    """
+    model = field_value(product, 'model') or ''
+    chunks = [{'kind': 'summary', 'passage': field_value(product, 'description') or '',
+               'text': product_to_text(product)}]
+
+    passages = product_passages(product)
+    budget = max(0, max_chunks - 1)
+    if not budget:
+        return chunks
+    group_size = max(1, math.ceil(len(passages) / budget))
+    for start in range(0, len(passages), group_size):
+        group = passages[start:start + group_size]
+        kinds = list(dict.fromkeys(p['kind'] for p in group))
+        passage = " ".join(p['passage'] for p in group)
+        label = PASSAGE_LABELS.get(kinds[0], '') if len(kinds) == 1 else ''
+        prefix = f"{model} – {label}: " if label else f"{model} – "
+        chunks.append({'kind': "+".join(kinds), 'passage': passage, 'text': prefix + passage})
+    return chunks
+
+
+def chunk_catalog(products: Sequence[Dict[str, Any]],
+                  max_chunks: int = MAX_CHUNKS_PER_PRODUCT) -> List[Dict[str, Any]]:
+    """
+    Fragmentos de todos los productos, en orden, con la posición del producto padre.
+
+    Returns:
+        Lista de {'product', 'kind', 'passage', 'text'}
+    """
+    return [dict(chunk, product=position)
+            for position, product in enumerate(products)
+            for chunk in product_chunks(product, max_chunks)]
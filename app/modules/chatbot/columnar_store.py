@@ -0,0 +1,212 @@
+"""
+columnar_store.py - Snapshot columnar de los metadatos de productos
+
+Materializar un resultado de búsqueda (`type, family, model, ...`) no debe
+requerir SQLite. El servicio de índice escribe, junto a `products.db`, un
+snapshot columnar inmutable por versión del índice
+(`embeddings/products-<hash>.columns`):
+
+    - columnas numéricas: arrays float64 (NaN = sin dato)
+    - columnas de texto: offsets int64 (n + 1) + bytes UTF-8 concatenados,
+      y una máscara de nulos
+
+Todo va en un solo archivo (encabezado JSON + bloques alineados a 64 bytes)
+que se abre con `np.memmap`: leer un resultado es indexar arrays, y los
+workers que abren la misma versión comparten las páginas vía el page cache.
+
+Formato:
+    [8 bytes: magic "SDCOLS01"][8 bytes: largo del encabezado, little-endian]
+    [encabezado JSON: filas, columnas → (tipo, offset, largo)][bloques]
+"""
+
+import json
+import os
+import shutil
+import struct
+import tempfile
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+MAGIC = b"SDCOLS01"
+ALIGNMENT = 64
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+class ColumnarWriter:
+    """
+    Escribe un snapshot por lotes, sin tener todos los productos en memoria.
+
+    Cada bloque (columna numérica, offsets, bytes, nulos) se va agregando a un
+    archivo de partes; `close` los junta en el snapshot final (temporal +
+    renombre atómico).
+
+    Uso:
+        writer = ColumnarWriter(directorio, TEXT_COLUMNS, NUMERIC_COLUMNS, field_value, to_number)
+        writer.append(lote)
+        writer.close(ruta)
+    """
+
+    def __init__(self, directory: Path, text_fields: Sequence[str], numeric_fields: Sequence[str],
+                 value: Callable[[Dict[str, Any], str], Any],
+                 number: Callable[[Any], Optional[float]]):
+        """
+        Args:
+            directory: Carpeta del snapshot (las partes se escriben ahí mismo)
+            text_fields / numeric_fields: Columnas a incluir
+            value: Lee un campo de un producto (ej: `field_value`)
+            number: Convierte un valor a float o None (ej: `to_number`)
+        """
+        self.text_fields, self.numeric_fields = list(text_fields), list(numeric_fields)
+        self.value, self.number = value, number
+        self.rows = 0
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        self._parts_dir = tempfile.mkdtemp(prefix=".columns-", suffix=".tmp", dir=directory)
+        self._blocks: Dict[str, Tuple[str, Any]] = {}   # nombre → (dtype, archivo de partes)
+        for field in self.numeric_fields:
+            self._open(field, '<f8')
+        self._text_bytes = {field: 0 for field in self.text_fields}
+        for field in self.text_fields:
+            self._open(f"{field}.offsets", '<i8').write(np.zeros(1, dtype='<i8').tobytes())
+            self._open(f"{field}.bytes", 'u1')
+            self._open(f"{field}.null", 'u1')
+
+    def _open(self, name: str, dtype: str):
+        handle = open(os.path.join(self._parts_dir, name), 'wb')
+        self._blocks[name] = (dtype, handle)
+        return handle
+
+    def _write(self, name: str, array: np.ndarray) -> None:
+        dtype, handle = self._blocks[name]
+        handle.write(np.ascontiguousarray(array, dtype=dtype).tobytes())
+
+    def append(self, products: Sequence[Dict[str, Any]]) -> None:
+        """Agrega un lote de productos (en el orden del índice)"""
+        for field in self.numeric_fields:
+            values = [self.number(p.get(field)) for p in products]
+            self._write(field, np.array([np.nan if v is None else v for v in values], dtype='<f8'))
+        for field in self.text_fields:
+            raw = [self.value(p, field) for p in products]
+            encoded = [b"" if v is None else str(v).encode('utf-8') for v in raw]
+            offsets = self._text_bytes[field] + np.cumsum([len(e) for e in encoded], dtype='<i8')
+            if len(offsets):
+                self._text_bytes[field] = int(offsets[-1])
+            self._write(f"{field}.offsets", offsets)
+            self._write(f"{field}.bytes", np.frombuffer(b"".join(encoded), dtype='u1'))
+            self._write(f"{field}.null", np.array([v is None for v in raw], dtype='u1'))
+        self.rows += len(products)
+
+    def close(self, path: Path) -> None:
+        """Arma el snapshot en `path` y borra las partes"""
+        try:
+            columns, offset = {}, 0
+            for name, (dtype, handle) in self._blocks.items():
+                handle.close()
+                nbytes = os.path.getsize(handle.name)
+                columns[name] = {'dtype': dtype, 'offset': offset,
+                                 'length': nbytes // np.dtype(dtype).itemsize}
+                offset = _align(offset + nbytes)
+            header = json.dumps({
+                'rows': self.rows,
+                'text_fields': self.text_fields,
+                'numeric_fields': self.numeric_fields,
+                'columns': columns,
+            }).encode('utf-8')
+            data_start = _align(16 + len(header))
+
+            path = Path(path)
+            tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            with open(tmp, 'wb') as f:
+                f.write(MAGIC + struct.pack('<Q', len(header)) + header)
+                for name, (_, handle) in self._blocks.items():
+                    f.seek(data_start + columns[name]['offset'])
+                    with open(handle.name, 'rb') as part:
+                        shutil.copyfileobj(part, f)
+                f.truncate(data_start + offset)
+            os.replace(tmp, path)
+        finally:
+            self.discard()
+
+    def discard(self) -> None:
+        """Borra las partes sin escribir el snapshot"""
+        for _, handle in self._blocks.values():
+            handle.close()
+        shutil.rmtree(self._parts_dir, ignore_errors=True)
+
+
+def write_columns(path: Path, products: Sequence[Dict[str, Any]],
+                  text_fields: Sequence[str], numeric_fields: Sequence[str],
+                  value: Callable[[Dict[str, Any], str], Any],
+                  number: Callable[[Any], Optional[float]]) -> None:
+    """
+    Escribe el snapshot de una lista de productos (escritura atómica).
+
+    Args:
+        path: Archivo de salida
+        products: Productos en el orden del índice
+        text_fields / numeric_fields: Columnas a incluir
+        value: Lee un campo de un producto (ej: `field_value`)
+        number: Convierte un valor a float o None (ej: `to_number`)
+    """
+    writer = ColumnarWriter(Path(path).parent, text_fields, numeric_fields, value, number)
+    writer.append(products)
+    writer.close(path)
+
+
+class ColumnarStore:
+    """Snapshot columnar mapeado en memoria (sólo lectura, seguro entre hilos)"""
+
+    def __init__(self, path: Path):
+        """
+        Args:
+            path: Archivo escrito por `write_columns`
+        """
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            magic, header_length = f.read(8), struct.unpack('<Q', f.read(8))[0]
+            if magic != MAGIC:
+                raise ValueError(f"{self.path} no es un snapshot columnar")
+            header = json.loads(f.read(header_length))
+        data_start = _align(16 + header_length)
+
+        self.rows: int = header['rows']
+        self.text_fields: List[str] = header['text_fields']
+        self.numeric_fields: List[str] = header['numeric_fields']
+        self._columns: Dict[str, np.ndarray] = {}
+        for name, spec in header['columns'].items():
+            if spec['length'] == 0:
+                self._columns[name] = np.empty(0, dtype=spec['dtype'])
+                continue
+            self._columns[name] = np.memmap(self.path, dtype=spec['dtype'], mode='r',
+                                            offset=data_start + spec['offset'],
+                                            shape=(spec['length'],))
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def numeric(self, field: str) -> np.ndarray:
+        """Columna numérica completa (float64, NaN = sin dato)"""
+        return self._columns[field]
+
+    def text(self, field: str, position: int) -> Optional[str]:
+        """Valor de una columna de texto en una posición (None si era nulo)"""
+        if self._columns[f"{field}.null"][position]:
+            return None
+        offsets = self._columns[f"{field}.offsets"]
+        start, end = int(offsets[position]), int(offsets[position + 1])
+        return bytes(self._columns[f"{field}.bytes"][start:end]).decode('utf-8')
+
+    def value(self, field: str, position: int) -> Any:
+        """Valor de cualquier columna en una posición (None si no hay dato)"""
+        if field in self.numeric_fields:
+            number = float(self._columns[field][position])
+            return None if np.isnan(number) else number
+        return self.text(field, position)
+
+    def row(self, position: int, fields: Sequence[str]) -> Tuple[Any, ...]:
+        """Valores de varias columnas en una posición"""
+        return tuple(self.value(field, position) for field in fields)
@@ -0,0 +1,659 @@
+"""
+index_service.py - Servicio único de índice de productos
+
+Antes convivían dos stacks de embeddings: `ingest.py`/`query.py`
+(distiluse + products.faiss + products.db) y `RAGEngineV2` (MiniLM + índice
+en memoria desde products_catalog.json). Un worker que atendía `/ask` y el
+chat RAG cargaba dos modelos y dos índices.
+
+`ProductIndexService` los reemplaza por:
+    - un modelo de embeddings (backend de app/embeddings.py)
+    - un índice persistido y direccionado por contenido (PersistedProductIndex;
+      flat, HNSW o IVF-PQ según el tamaño del corpus, ver index_tiers.py)
+    - un almacén de metadatos SQLite (`embeddings/products-<hash>.db`)
+    - un snapshot columnar de los metadatos, mapeado en memoria, para
+      materializar resultados sin SQL (`embeddings/products-<hash>.columns`,
+      ver columnar_store.py)
+
+Cada producto se indexa como varios fragmentos (resumen + pasajes, ver
+chunking.py); `chunk_parent[id FAISS]` es la posición del producto, que es la
+misma en memoria y en SQLite: `products[i]` ↔ rowid `i + 1`. Los ids FAISS
+son estables entre ingestas (ver product_index.py): un catálogo actualizado
+sólo agrega los fragmentos nuevos y deja lápidas (`chunk_parent = -1`) en los
+reemplazados o borrados. Índice, metadatos y snapshot de una versión se
+confirman juntos con el manifiesto. Lo usan `main.ask` (vía
+`query.search_filtered`), `RAGEngineV2` y las CLIs `query.py` / `ingest.py`,
+todos a través de la instancia compartida `get_product_index_service()`.
+
+Configuración por variables de entorno:
+    SOLDASUR_EMBEDDING_MODEL    Modelo de embeddings (paraphrase-multilingual-MiniLM-L12-v2)
+    SOLDASUR_INDEX_DIR          Carpeta del índice y los metadatos (embeddings/)
+"""
+
+import json
+import os
+import queue
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+from app.embedding_cache import get_embedding_cache
+from app.embeddings import EmbeddingBackend, create_embedding_backend
+from app.modules.chatbot.chunking import (MAX_CHUNKS_PER_PRODUCT, chunk_catalog, field_value,
+                                         product_keys, to_number)
+from app.modules.chatbot.columnar_store import ColumnarStore, ColumnarWriter
+from app.modules.chatbot.index_tiers import search_parameters
+from app.modules.chatbot.lexical_index import BM25Index, model_key, product_document
+from app.modules.chatbot.product_filters import ProductFilters
+from app.modules.chatbot.product_index import (ContentHash, PersistedProductIndex, product_hash,
+                                               text_hash)
+from app.modules.chatbot.streaming_ingest import DEFAULT_ENCODE_BATCH, PipelineStats, frame_records
+
+ROOT_DIR = Path(__file__).resolve().parents[3]
+DEFAULT_MODEL = "paraphrase-multilingual-MiniLM-L12-v2"
+DEFAULT_INDEX_DIR = ROOT_DIR / "embeddings"
+DEFAULT_CATALOG = ROOT_DIR / "data" / "products_catalog.json"
+INDEX_NAME = "products"
+
+# Columnas del almacén de metadatos (las que lee query.py) además del JSON completo
+TEXT_COLUMNS = ("type", "family", "model", "description", "dimentions", "category", "url")
+NUMERIC_COLUMNS = ("power_w", "liters", "max_pressure_bar")
+
+
+def load_products(path) -> List[Dict[str, Any]]:
+    """
+    Lee productos desde el catálogo JSON o desde un CSV.
+
+    Args:
+        path: Ruta a un .json (lista de productos) o .csv (una fila por producto)
+
+    Returns:
+        Lista de productos como diccionarios
+    """
+    path = Path(path)
+    if path.suffix.lower() == ".csv":
+        import pandas as pd
+        return frame_records(pd.read_csv(path))
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class MetadataWriter:
+    """
+    Escribe el almacén de metadatos de una versión por lotes, en un temporal
+    que `close` renombra atómicamente. Tabla `products` (rowid = posición + 1,
+    clave estable, columnas de filtrado y JSON completo) y tabla `meta`.
+    """
+
+    def __init__(self, directory: Path):
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        self.path = Path(directory) / f"{INDEX_NAME}-staging.{os.getpid()}.{threading.get_ident()}.tmp"
+        if self.path.exists():
+            self.path.unlink()
+        self.count = 0
+        self._conn = sqlite3.connect(str(self.path))
+        self._conn.execute(
+            "CREATE TABLE products (rowid INTEGER PRIMARY KEY, key TEXT UNIQUE NOT NULL, "
+            + ", ".join(f"{c} TEXT" for c in TEXT_COLUMNS) + ", "
+            + ", ".join(f"{c} REAL" for c in NUMERIC_COLUMNS) + ", data TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def append(self, products: Sequence[Dict[str, Any]], keys: Sequence[str]) -> None:
+        columns = TEXT_COLUMNS + NUMERIC_COLUMNS
+        self._conn.executemany(
+            f"INSERT INTO products (rowid, key, {', '.join(columns)}, data) "
+            f"VALUES ({', '.join('?' * (len(columns) + 3))})",
+            [
+                (self.count + i + 1, keys[i],
+                 *(None if field_value(p, c) is None else str(field_value(p, c))
+                   for c in TEXT_COLUMNS),
+                 *(to_number(p.get(c)) for c in NUMERIC_COLUMNS),
+                 json.dumps(p, ensure_ascii=False, default=str))
+                for i, p in enumerate(products)
+            ]
+        )
+        self.count += len(products)
+
+    def close(self, path: Path, version: str, model_name: str) -> None:
+        try:
+            self._conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", [
+                ('catalog_hash', version),
+                ('model', model_name),
+                ('count', str(self.count)),
+            ])
+            self._conn.commit()
+        finally:
+            self._conn.close()
+        os.replace(self.path, path)
+
+    def discard(self) -> None:
+        self._conn.close()
+        if self.path.exists():
+            self.path.unlink()
+
+
+class IndexSnapshot:
+    """
+    Una versión cargada del índice: todo lo que hace falta para buscar y
+    materializar resultados. `ProductIndexService._set` la reemplaza entera,
+    de una sola vez.
+
+    Las posiciones de producto y los ids de fragmento que devuelve una
+    búsqueda valen para el snapshot que la resolvió: quien materializa
+    resultados toma el snapshot una vez (`ProductIndexService.snapshot`),
+    busca con él y lee los productos de él.
+    """
+
+    def __init__(self, index=None, filters: Optional[ProductFilters] = None,
+                 params: Optional[Dict[str, Any]] = None,
+                 chunk_parent: Optional[np.ndarray] = None, live: Optional[np.ndarray] = None,
+                 products: Optional[List[Dict[str, Any]]] = None,
+                 chunks: Optional[List[Dict[str, Any]]] = None,
+                 chunk_rows: Optional[np.ndarray] = None, columns: Optional[ColumnarStore] = None,
+                 lexical: Optional[BM25Index] = None,
+                 model_names: Optional[Dict[str, List[int]]] = None, version: Optional[str] = None):
+        self.index = index
+        self.filters = filters
+        self.params = params or {}  # Nivel del índice y parámetros de búsqueda
+        # Producto de cada id FAISS (-1: lápida) e ids vivos (None si no hay lápidas)
+        self.chunk_parent = chunk_parent if chunk_parent is not None else np.empty(0, dtype='int64')
+        self.live = live
+        self.products = products or []
+        self.chunks = chunks or []
+        # id FAISS → posición en `chunks` (-1: lápida)
+        self.chunk_rows = chunk_rows if chunk_rows is not None else np.empty(0, dtype='int64')
+        self.columns = columns
+        self.lexical = lexical
+        self.model_names = model_names or {}  # clave de modelo → posiciones
+        self.version = version
+
+
+class ProductIndexService:
+    """
+    Modelo + índice FAISS + metadatos de productos, compartidos por todo el proceso.
+
+    El modelo se carga recién cuando hace falta vectorizar: abrir un índice
+    ya persistido no lo necesita.
+    """
+
+    def __init__(self, model_name: Optional[str] = None, directory: Optional[Path] = None,
+                 backend: Optional[str] = None):
+        """
+        Args:
+            model_name: Modelo de embeddings (por defecto SOLDASUR_EMBEDDING_MODEL)
+            directory: Carpeta del índice y los metadatos (por defecto SOLDASUR_INDEX_DIR)
+            backend: Backend de embeddings (por defecto SOLDASUR_EMBEDDING_BACKEND)
+        """
+        self.model_name = model_name or os.getenv('SOLDASUR_EMBEDDING_MODEL', DEFAULT_MODEL)
+        self.directory = Path(directory or os.getenv('SOLDASUR_INDEX_DIR', DEFAULT_INDEX_DIR))
+        self.backend = backend or os.getenv('SOLDASUR_EMBEDDING_BACKEND', 'torch')
+        self.index_store = PersistedProductIndex(self.embedding_key, self.directory, INDEX_NAME)
+
+        self.products: List[Dict[str, Any]] = []
+        self.texts: List[str] = []  # Texto vectorizado de cada fragmento
+        self.chunks: List[Dict[str, Any]] = []  # Fragmentos: producto, tipo, pasaje
+        self._chunk_rows = np.empty(0, dtype='int64')  # id FAISS → posición en `chunks` (-1: lápida)
+        self.index = None
+        self.filters: Optional[ProductFilters] = None
+        self.lexical: Optional[BM25Index] = None
+        self.model_names: Dict[str, List[int]] = {}  # clave de modelo → posiciones
+        self.columns: Optional[ColumnarStore] = None  # Metadatos columnares de la versión actual
+        self._snapshot = IndexSnapshot()  # Lo mismo, de una sola versión (ver `snapshot`)
+        self.version: Optional[str] = None  # Hash del contenido indexado
+        self._model: Optional[EmbeddingBackend] = None
+        self._lock = threading.RLock()
+
+    @property
+    def embedding_key(self) -> str:
+        """Identificador de los vectores (modelo + backend), igual que `EmbeddingBackend.cache_key`"""
+        return self.model_name if self.backend == "torch" else f"{self.model_name}@{self.backend}"
+
+    @property
+    def model(self) -> EmbeddingBackend:
+        """Modelo de embeddings (se carga en el primer uso)"""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = create_embedding_backend(self.model_name, self.backend)
+                    if self._model.cache_key != self.embedding_key:
+                        # El backend pedido no estaba disponible: re-etiquetar los vectores
+                        self.backend = self._model.name
+                        self.index_store.model_name = self._model.cache_key
+        return self._model
+
+    @property
+    def loaded(self) -> bool:
+        return self.index is not None
+
+    @property
+    def db_path(self) -> Optional[Path]:
+        """Base de metadatos de la versión cargada"""
+        return self.metadata_path(self.version) if self.version else None
+
+    def metadata_path(self, version: str) -> Path:
+        return self.directory / f"{INDEX_NAME}-{version[:16]}.db"
+
+    def columns_path(self, version: str) -> Path:
+        return self.directory / f"{INDEX_NAME}-{version[:16]}.columns"
+
+    # ── Carga y construcción ────────────────────────────────────────────────
+
+    def ensure_loaded(self, source=None) -> None:
+        """
+        Deja el servicio listo para buscar.
+
+        Abre el índice y los metadatos persistidos si existen; si no, los
+        construye desde `source` (por defecto data/products_catalog.json).
+        """
+        if self.loaded:
+            return
+        with self._lock:
+            if self.loaded:
+                return
+            if not self.load():
+                self.sync(load_products(source or DEFAULT_CATALOG))
+
+    def load(self) -> bool:
+        """
+        Abre índice y metadatos persistidos, sin cargar el modelo.
+
+        Returns:
+            True si había un índice consistente con los metadatos
+        """
+        manifest = self.index_store._read_manifest()
+        if not manifest or manifest.get('model') != self.embedding_key:
+            return False
+        db_path = self.metadata_path(manifest['catalog_hash'])
+        if not db_path.exists():
+            return False
+        try:
+            conn = sqlite3.connect(str(db_path))
+            try:
+                meta = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+                rows = conn.execute("SELECT data FROM products ORDER BY rowid").fetchall()
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return False
+        if meta.get('catalog_hash') != manifest['catalog_hash'] or str(len(rows)) != meta.get('count'):
+            return False
+
+        # Con el contenido sin cambios sync sólo mapea el índice y no toca los metadatos
+        self.sync([json.loads(data) for (data,) in rows])
+        return True
+
+    def sync(self, products: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Indexa una lista de productos (catálogo o CSV).
+
+        Compara con la versión anterior por clave estable de producto y hash
+        de cada fragmento: sólo vectoriza los fragmentos nuevos o modificados
+        y sólo escribe metadatos si cambió el contenido. Los archivos de la
+        versión nueva se escriben antes que el manifiesto que la confirma.
+
+        Args:
+            products: Productos en el orden en que se indexan
+
+        Returns:
+            Estadísticas: productos, fragmentos, vectorizados, quitados, tipo de construcción
+        """
+        with self._lock:
+            if self.backend != "torch":
+                self.model  # si el backend pedido no está disponible, los vectores se etiquetan como torch
+            products = list(products)
+            chunks = chunk_catalog(products)
+            texts = [chunk['text'] for chunk in chunks]
+            keys = product_keys(products)
+            content = ContentHash(self.index_store.model_name)
+            self._add_content(content, products, chunks)
+            version = content.hexdigest()
+            if not self.metadata_path(version).exists():
+                writer = MetadataWriter(self.directory)
+                writer.append(products, keys)
+                writer.close(self.metadata_path(version), version, self.index_store.model_name)
+            if not self.columns_path(version).exists():
+                writer = ColumnarWriter(self.directory, TEXT_COLUMNS, NUMERIC_COLUMNS,
+                                        field_value, to_number)
+                writer.append(products)
+                writer.close(self.columns_path(version))
+            index = self.index_store.load_or_build(
+                texts, self, keys=[keys[chunk['product']] for chunk in chunks], version=version,
+                files=self._version_files(version))
+            self._set(products, chunks, index, self.index_store.ids, version)
+            return {
+                'products': len(products),
+                'chunks': len(chunks),
+                'embedded': self.index_store.last_embedded,
+                'removed': self.index_store.last_removed,
+                'build': self.index_store.last_build,
+                'version': version,
+            }
+
+    def sync_stream(self, batches: Iterable[Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]],
+                    encode_batch: int = DEFAULT_ENCODE_BATCH,
+                    stats: Optional[PipelineStats] = None) -> Dict[str, Any]:
+        """
+        Indexa productos por lotes (ver streaming_ingest.csv_batches), con memoria acotada.
+
+        Mientras un hilo vectoriza los fragmentos nuevos de un lote y los
+        agrega al índice, este hilo sigue leyendo el lote siguiente y escribe
+        sus filas en SQLite y en el snapshot columnar. Como en `sync`, sólo se
+        vectoriza lo nuevo o modificado y la versión se confirma con el
+        manifiesto al final. El estado en memoria no se carga: la próxima
+        búsqueda abre la versión nueva (`load`).
+
+        Args:
+            batches: Lotes (productos, fragmentos con `product` = posición en el lote)
+            encode_batch: Textos por llamada al modelo
+            stats: Acumula las etapas "prepare", "store", "encode", "index" y "commit"
+
+        Returns:
+            Estadísticas como las de `sync`
+        """
+        stats = stats or PipelineStats()
+        with self._lock:
+            # El modelo se carga acá: el hilo que vectoriza no puede tomar el lock del servicio
+            # (y si el backend pedido no está disponible, los vectores se etiquetan como torch)
+            self.model
+            update = self.index_store.update(self)
+            content = ContentHash(self.index_store.model_name)
+            metadata = MetadataWriter(self.directory)
+            columns = ColumnarWriter(self.directory, TEXT_COLUMNS, NUMERIC_COLUMNS,
+                                     field_value, to_number)
+            pending: "queue.Queue[Optional[List[str]]]" = queue.Queue(maxsize=2)
+            errors: List[BaseException] = []
+
+            def encoder() -> None:
+                while True:
+                    texts = pending.get()
+                    if texts is None:
+                        return
+                    if errors:
+                        continue    # vaciar la cola para que el lector no se bloquee
+                    try:
+                        for start in range(0, len(texts), encode_batch):
+                            batch = texts[start:start + encode_batch]
+                            with stats.stage("encode", len(batch)):
+                                vectors = update.encode(batch)
+                            with stats.stage("index", len(batch)):
+                                update.append(vectors)
+                    except BaseException as e:
+                        errors.append(e)
+
+            worker = threading.Thread(target=encoder, name="ingest-encoder", daemon=True)
+            worker.start()
+            products_count = chunks_count = 0
+            seen: Dict[str, int] = {}
+            try:
+                for products, chunks in batches:
+                    with stats.stage("prepare", len(chunks)):
+                        keys = product_keys(products, seen)
+                        hashes = self._add_content(content, products, chunks)
+                        missing = update.match([keys[chunk['product']] for chunk in chunks], hashes)
+                    if missing:
+                        pending.put([chunks[i]['text'] for i in missing])
+                    with stats.stage("store", len(products)):
+                        metadata.append(products, keys)
+                        columns.append(products)
+                    products_count += len(products)
+                    chunks_count += len(chunks)
+                    if errors:
+                        break
+            except BaseException:
+                errors.append(None)     # el hilo del modelo descarta lo pendiente
+                raise
+            finally:
+                pending.put(None)
+                worker.join()
+                if errors:
+                    metadata.discard()
+                    columns.discard()
+            if errors:
+                raise errors[0]
+
+            version = content.hexdigest()
+            with stats.stage("commit", chunks_count):
+                metadata.close(self.metadata_path(version), version, self.index_store.model_name)
+                columns.close(self.columns_path(version))
+                update.commit(version, self._version_files(version))
+            self.index = None   # `ensure_loaded` abre la versión nueva
+            return {
+                'products': products_count,
+                'chunks': chunks_count,
+                'embedded': self.index_store.last_embedded,
+                'removed': self.index_store.last_removed,
+                'build': self.index_store.last_build,
+                'version': version,
+            }
+
+    @staticmethod
+    def _add_content(content: ContentHash, products: Sequence[Dict[str, Any]],
+                     chunks: Sequence[Dict[str, Any]]) -> List[str]:
+        """
+        Agrega un lote a la versión del contenido (lo vectorizado y el resto de
+        los datos de cada producto).
+
+        Returns:
+            Hash del texto de cada fragmento
+        """
+        hashes = [text_hash(chunk['text']) for chunk in chunks]
+        by_product: List[List[str]] = [[] for _ in products]
+        for chunk, h in zip(chunks, hashes):
+            by_product[chunk['product']].append(h)
+        for product, chunk_hashes in zip(products, by_product):
+            content.add(chunk_hashes, product_hash(product))
+        return hashes
+
+    def _version_files(self, version: str) -> Dict[str, str]:
+        return {'metadata': self.metadata_path(version).name,
+                'columns': self.columns_path(version).name}
+
+    def _set(self, products, chunks, index, ids: np.ndarray, version: str) -> None:
+        # Las búsquedas en curso siguen con las referencias viejas
+        filters = ProductFilters(products)
+        lexical = BM25Index([product_document(p) for p in products])
+        model_names: Dict[str, List[int]] = {}
+        for position, product in enumerate(products):
+            key = model_key(product.get('model'))
+            if key:
+                model_names.setdefault(key, []).append(position)
+        chunk_rows = np.full(index.ntotal, -1, dtype='int64')
+        chunk_rows[ids] = np.arange(len(chunks))
+        chunk_parent = np.full(index.ntotal, -1, dtype='int64')
+        chunk_parent[ids] = [chunk['product'] for chunk in chunks]
+        live = chunk_parent >= 0 if len(ids) < index.ntotal else None
+        columns = ColumnarStore(self.columns_path(version))
+        self._snapshot = IndexSnapshot(index, filters, dict(self.index_store.params), chunk_parent,
+                                       live, products, chunks, chunk_rows, columns, lexical,
+                                       model_names, version)
+        self.products, self.chunks, self.version = products, chunks, version
+        self._chunk_rows, self.columns = chunk_rows, columns
+        self.texts = [chunk['text'] for chunk in chunks]
+        self.index, self.filters = index, filters
+        self.lexical, self.model_names = lexical, model_names
+
+    # ── Búsqueda ────────────────────────────────────────────────────────────
+
+    def encode(self, texts: Sequence[str], show_progress_bar: bool = False, **kwargs) -> np.ndarray:
+        """Vectoriza textos con el modelo del servicio (interfaz de `EmbeddingBackend`)"""
+        return self.model.encode(list(texts), show_progress_bar=show_progress_bar, **kwargs)
+
+    def snapshot(self) -> IndexSnapshot:
+        """Versión cargada del índice, para buscar y materializar resultados de la misma versión"""
+        self.ensure_loaded()
+        return self._snapshot
+
+    def embed_queries(self, texts: Sequence[str]) -> np.ndarray:
+        """Embeddings L2-normalizados de consultas, vía la caché compartida"""
+        return get_embedding_cache().encode(self.model, self.index_store.model_name, texts)
+
+    def seed_queries(self, texts: Sequence[str]) -> int:
+        """Precarga la caché de embeddings con consultas conocidas"""
+        return get_embedding_cache().seed(self.model, self.index_store.model_name, texts)
+
+    def search(self, embeddings: np.ndarray, k: int, type_contains: Optional[str] = None,
+               family_contains: Optional[str] = None, min_power: Optional[float] = None,
+               snapshot: Optional[IndexSnapshot] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Busca los `k` productos más cercanos a cada embedding que cumplen los filtros.
+
+        Returns:
+            (distancias, posiciones de producto), forma (n, k); ver `search_passages`
+        """
+        distances, positions, _ = self.search_passages(
+            embeddings, k, type_contains, family_contains, min_power, snapshot)
+        return distances, positions
+
+    def search_passages(self, embeddings: np.ndarray, k: int, type_contains: Optional[str] = None,
+                        family_contains: Optional[str] = None, min_power: Optional[float] = None,
+                        snapshot: Optional[IndexSnapshot] = None
+                        ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Busca los `k` productos más cercanos a cada embedding, con el fragmento que los trajo.
+
+        La similitud de un producto es la máxima entre sus fragmentos. Como un
+        producto tiene a lo sumo `MAX_CHUNKS_PER_PRODUCT` fragmentos, buscar
+        `k` × ese máximo fragmentos alcanza para tener los `k` mejores productos.
+
+        El filtro se aplica dentro de FAISS (`IDSelectorBitmap` sobre los
+        fragmentos de los productos que lo cumplen): con el índice flat el
+        resultado es exacto (nunca faltan resultados que cumplen el filtro);
+        con HNSW / IVF-PQ tiene el recall calibrado del nivel. Las lápidas
+        se excluyen con el mismo selector, haya filtros o no.
+        Las posiciones sin resultado valen -1.
+
+        Args:
+            embeddings: Consultas, forma (n, dimensión)
+            k: Productos por consulta
+            type_contains / family_contains / min_power: ver `ProductFilters.mask`
+            snapshot: Versión del índice (por defecto la cargada, ver `snapshot`); las
+                      posiciones se resuelven con `snapshot.products` / `snapshot.columns`
+
+        Returns:
+            (distancias, posiciones de producto, ids de fragmento), forma (n, k)
+        """
+        snapshot = snapshot or self.snapshot()
+        index, filters, params = snapshot.index, snapshot.filters, snapshot.params
+        chunk_parent, live = snapshot.chunk_parent, snapshot.live
+        chunk_k = min(index.ntotal, k * MAX_CHUNKS_PER_PRODUCT)
+        mask = filters.mask(type_contains, family_contains, min_power)
+        if mask is None and live is None:
+            D, I = index.search(embeddings, chunk_k)
+        elif mask is not None and not mask.any():
+            D, I = (np.full((len(embeddings), chunk_k), -np.inf, dtype='float32'),
+                    np.full((len(embeddings), chunk_k), -1, dtype='int64'))
+        else:
+            if mask is None:
+                chunk_mask = live
+            else:
+                chunk_mask = mask[chunk_parent]
+                if live is not None:
+                    chunk_mask &= live
+            bitmap = np.packbits(chunk_mask, bitorder='little')
+            selector = faiss.IDSelectorBitmap(len(chunk_mask), faiss.swig_ptr(bitmap))
+            try:
+                D, I = index.search(embeddings, chunk_k, params=search_parameters(params, selector))
+            except (RuntimeError, TypeError):
+                # Tipo de índice sin soporte de selectores: post-filtrado con pool adaptativo
+                D, I = self._search_adaptive(index, embeddings, chunk_k, chunk_mask)
+        return self._max_sim(D, I, chunk_parent, k)
+
+    @staticmethod
+    def _max_sim(D: np.ndarray, I: np.ndarray, chunk_parent: np.ndarray,
+                 k: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Agrupa fragmentos por producto: cada producto queda con su mejor fragmento"""
+        distances = np.full((len(D), k), -np.inf, dtype='float32')
+        positions = np.full((len(D), k), -1, dtype='int64')
+        chunk_ids = np.full((len(D), k), -1, dtype='int64')
+        for row in range(len(D)):
+            seen = set()
+            for score, chunk_id in zip(D[row], I[row]):
+                if chunk_id < 0:
+                    continue
+                parent = int(chunk_parent[chunk_id])
+                if parent < 0 or parent in seen:
+                    continue    # lápida, o ya vino con un fragmento más similar (resultados ordenados)
+                column = len(seen)
+                seen.add(parent)
+                distances[row, column] = score
+                positions[row, column] = parent
+                chunk_ids[row, column] = chunk_id
+                if len(seen) == k:
+                    break
+        return distances, positions, chunk_ids
+
+    @staticmethod
+    def _search_adaptive(index, embeddings: np.ndarray, k: int,
+                         mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Duplica el pool de vecinos hasta que cada consulta tenga `k` resultados que cumplen `mask`"""
+        wanted = min(k, int(mask.sum()))
+        pool = min(index.ntotal, max(4 * k, 32))
+        while True:
+            D, I = index.search(embeddings, pool)
+            keep = (I >= 0) & mask[np.clip(I, 0, None)]
+            if pool >= index.ntotal or (keep.sum(axis=1) >= wanted).all():
+                break
+            pool = min(index.ntotal, pool * 2)
+
+        distances = np.full((len(embeddings), k), -np.inf, dtype='float32')
+        positions = np.full((len(embeddings), k), -1, dtype='int64')
+        for row in range(len(embeddings)):
+            hits = np.flatnonzero(keep[row])[:k]
+            distances[row, :len(hits)] = D[row, hits]
+            positions[row, :len(hits)] = I[row, hits]
+        return distances, positions
+
+    def match_model(self, text: str, snapshot: Optional[IndexSnapshot] = None) -> List[int]:
+        """Posiciones de los productos cuyo modelo es exactamente `text` (normalizado)"""
+        snapshot = snapshot or self.snapshot()
+        return list(snapshot.model_names.get(model_key(text), ()))
+
+    def lexical_search(self, text: str, k: int,
+                       snapshot: Optional[IndexSnapshot] = None) -> List[Tuple[int, float]]:
+        """Los `k` productos con mayor puntaje BM25 para `text` (posición, puntaje)"""
+        snapshot = snapshot or self.snapshot()
+        return snapshot.lexical.search(text, k)
+
+    def passage(self, chunk_id: int,
+                snapshot: Optional[IndexSnapshot] = None) -> Optional[Dict[str, Any]]:
+        """Fragmento por id FAISS: {'product', 'kind', 'passage', 'text'}"""
+        snapshot = snapshot or self._snapshot
+        chunks, rows = snapshot.chunks, snapshot.chunk_rows
+        row = int(rows[chunk_id]) if 0 <= chunk_id < len(rows) else -1
+        return chunks[row] if 0 <= row < len(chunks) else None
+
+    def get(self, position: int,
+            snapshot: Optional[IndexSnapshot] = None) -> Optional[Dict[str, Any]]:
+        """Producto en una posición del índice (None si está fuera de rango)"""
+        products = (snapshot or self._snapshot).products
+        return products[position] if 0 <= position < len(products) else None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'model': self.index_store.model_name,
+            'products': len(self.products),
+            'chunks': len(self.chunks),
+            'tombstones': (self.index.ntotal - len(self.chunks)) if self.index is not None else 0,
+            'version': self.version,
+            'index': self.index_store.params,
+            'model_loaded': self._model is not None,
+        }
+
+
+_service: Optional[ProductIndexService] = None
+_service_lock = threading.Lock()
+
+
+def get_product_index_service() -> ProductIndexService:
+    """Instancia del servicio compartida por todo el proceso"""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = ProductIndexService()
+    return _service
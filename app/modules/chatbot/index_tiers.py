@@ -0,0 +1,202 @@
+"""
+index_tiers.py - Niveles de índice ANN para el índice de productos
+
+`IndexFlatIP` es fuerza bruta: perfecto para el catálogo (decenas de
+productos), pero no para repuestos, accesorios y manuales (decenas a cientos
+de miles de fragmentos). Se definen tres niveles:
+
+    flat    IndexFlatIP            exacto; hasta ~20k vectores
+    hnsw    IndexHNSWFlat          grafo; recall alto, memoria = vectores + grafo
+    ivfpq   IndexIVFPQ + refine    listas invertidas + cuantización de producto
+                                   para los candidatos, re-ranking exacto con los
+                                   vectores originales (mapeados en memoria)
+
+`choose_tier` elige el nivel por tamaño del corpus y recall objetivo.
+`build_index` entrena (IVF-PQ, con una muestra), agrega los vectores y
+calibra los parámetros de búsqueda (`efSearch` / `nprobe` + `k_factor`)
+contra la verdad exacta hasta alcanzar el recall objetivo. Los parámetros quedan en el
+manifiesto del índice persistido (ver product_index.py) y se reaplican al
+cargarlo. Para comparar niveles: `python scripts/benchmark_index.py`.
+
+Configuración por variables de entorno:
+    SOLDASUR_INDEX_TIER            "auto" (por defecto), "flat", "hnsw" o "ivfpq"
+    SOLDASUR_INDEX_TARGET_RECALL   Recall@10 objetivo de los niveles aproximados (0.95)
+"""
+
+import math
+import os
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import faiss
+import numpy as np
+
+TIERS = ("flat", "hnsw", "ivfpq")
+DEFAULT_TARGET_RECALL = 0.95
+FLAT_MAX = 20_000        # hasta acá la fuerza bruta tarda ~1 ms por consulta
+HNSW_MAX = 1_000_000     # arriba de esto la memoria de HNSW (vectores completos) pesa
+
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = (16, 32, 64, 128, 256, 512, 1024)
+PQ_NBITS = 8
+REFINE_K_FACTORS = (2, 4, 8, 16)   # candidatos PQ por resultado que se re-rankean exacto
+
+CALIBRATION_QUERIES = 200
+CALIBRATION_K = 10
+
+
+def target_recall_from_env() -> float:
+    value = os.getenv('SOLDASUR_INDEX_TARGET_RECALL')
+    return float(value) if value else DEFAULT_TARGET_RECALL
+
+
+def choose_tier(count: int, target_recall: Optional[float] = None,
+                tier: Optional[str] = None) -> str:
+    """
+    Nivel de índice para un corpus.
+
+    Args:
+        count: Cantidad de vectores
+        target_recall: Recall@10 objetivo (por defecto SOLDASUR_INDEX_TARGET_RECALL)
+        tier: Nivel forzado (por defecto SOLDASUR_INDEX_TIER; "auto" = elegir)
+
+    Returns:
+        "flat", "hnsw" o "ivfpq"
+    """
+    tier = (tier or os.getenv('SOLDASUR_INDEX_TIER', 'auto')).lower()
+    if tier != "auto":
+        if tier not in TIERS:
+            raise ValueError(f"Nivel de índice desconocido: '{tier}'")
+        return tier
+    target_recall = target_recall_from_env() if target_recall is None else target_recall
+    if count <= FLAT_MAX or target_recall >= 0.999:
+        return "flat"
+    if count <= HNSW_MAX or target_recall >= 0.98:
+        return "hnsw"
+    return "ivfpq"
+
+
+def _pq_subquantizers(dimension: int) -> int:
+    """Sub-cuantizadores de PQ: la mayor cantidad que deja ≥ 4 dimensiones por subvector"""
+    for m in (64, 48, 32, 24, 16, 12, 8, 4, 2, 1):
+        if dimension % m == 0 and dimension // m >= 4:
+            return m
+    return 1
+
+
+def exact_neighbors(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """Vecinos exactos por producto interno (verdad de referencia)"""
+    _, indices = faiss.knn(queries, vectors, k, metric=faiss.METRIC_INNER_PRODUCT)
+    return indices
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    """Fracción de los vecinos exactos que aparecen en el resultado"""
+    k = truth.shape[1]
+    hits = sum(len(set(f[:k]) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def calibration_queries(vectors: np.ndarray, count: int = CALIBRATION_QUERIES,
+                        seed: int = 0) -> np.ndarray:
+    """
+    Consultas de calibración: vectores del corpus con ruido (y re-normalizados),
+    para no premiar al índice por encontrar el propio vector.
+    """
+    rng = np.random.default_rng(seed)
+    sample = vectors[rng.choice(len(vectors), min(count, len(vectors)), replace=False)]
+    noisy = sample + rng.normal(0, 0.5 / math.sqrt(vectors.shape[1]), sample.shape).astype('float32')
+    faiss.normalize_L2(noisy)
+    return noisy
+
+
+def apply_params(index: faiss.Index, params: Dict[str, Any]) -> None:
+    """Reaplica el parámetro de búsqueda calibrado a un índice cargado de disco"""
+    if params.get('tier') == "hnsw" and params.get('efSearch'):
+        index.hnsw.efSearch = int(params['efSearch'])
+    elif params.get('tier') == "ivfpq" and params.get('nprobe'):
+        faiss.extract_index_ivf(index).nprobe = int(params['nprobe'])
+        index.k_factor = float(params.get('k_factor', REFINE_K_FACTORS[0]))
+
+
+def search_parameters(params: Dict[str, Any], selector) -> faiss.SearchParameters:
+    """Parámetros de búsqueda con filtro (`IDSelector`) para el nivel del índice"""
+    if params.get('tier') == "hnsw":
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=int(params.get('efSearch', 16)))
+    if params.get('tier') == "ivfpq":
+        return faiss.IndexRefineSearchParameters(
+            k_factor=float(params.get('k_factor', REFINE_K_FACTORS[0])),
+            base_index_params=faiss.SearchParametersIVF(sel=selector,
+                                                        nprobe=int(params.get('nprobe', 1))))
+    return faiss.SearchParameters(sel=selector)
+
+
+def build_index(vectors: np.ndarray, tier: str, target_recall: Optional[float] = None,
+                seed: int = 0) -> Tuple[faiss.Index, Dict[str, Any]]:
+    """
+    Construye un índice del nivel dado sobre vectores L2-normalizados.
+
+    Args:
+        vectors: Array float32 (n, dimensión)
+        tier: "flat", "hnsw" o "ivfpq"
+        target_recall: Recall@10 objetivo para calibrar los niveles aproximados
+        seed: Semilla de la muestra de entrenamiento y de calibración
+
+    Returns:
+        (índice, parámetros para el manifiesto)
+    """
+    vectors = np.ascontiguousarray(vectors, dtype='float32')
+    count, dimension = vectors.shape
+    target_recall = target_recall_from_env() if target_recall is None else target_recall
+    params: Dict[str, Any] = {'tier': tier}
+
+    if tier == "flat":
+        index = faiss.IndexFlatIP(dimension)  # Inner Product (cosine similarity)
+        index.add(vectors)
+        return index, params
+
+    if tier == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.add(vectors)
+        params.update(M=HNSW_M, efConstruction=HNSW_EF_CONSTRUCTION)
+        candidates = [{'efSearch': ef} for ef in HNSW_EF_SEARCH]
+    elif tier == "ivfpq":
+        # ~4·√n listas, y al menos 39 vectores de entrenamiento por lista
+        nlist = max(1, min(int(4 * math.sqrt(count)), count // 39))
+        m = _pq_subquantizers(dimension)
+        nbits = PQ_NBITS if count >= 4 * (1 << PQ_NBITS) else max(1, int(math.log2(count / 4)))
+        quantizer = faiss.IndexFlatIP(dimension)
+        ivfpq = faiss.IndexIVFPQ(quantizer, dimension, nlist, m, nbits, faiss.METRIC_INNER_PRODUCT)
+        rng = np.random.default_rng(seed)
+        sample_size = min(count, max(64 * nlist, 1 << 14))
+        sample = vectors[rng.choice(count, sample_size, replace=False)]
+        start = time.perf_counter()
+        ivfpq.train(sample)
+        # El error de PQ limita el recall: los candidatos se re-rankean con los vectores exactos
+        index = faiss.IndexRefineFlat(ivfpq)
+        index.add(vectors)
+        params.update(nlist=nlist, m=m, nbits=nbits, train_size=sample_size,
+                      train_seconds=round(time.perf_counter() - start, 2))
+        nprobes = [p for p in (1, 2, 4, 8, 16, 32, 64, 128, 256, 512) if p < nlist] + [nlist]
+        candidates = [{'k_factor': kf, 'nprobe': p} for kf in REFINE_K_FACTORS for p in nprobes]
+    else:
+        raise ValueError(f"Nivel de índice desconocido: '{tier}'")
+
+    # Calibración: los parámetros de búsqueda más baratos que alcanzan el recall objetivo
+    queries = calibration_queries(vectors, seed=seed)
+    k = min(CALIBRATION_K, count)
+    truth = exact_neighbors(vectors, queries, k)
+    recall = 0.0
+    for candidate in candidates:
+        apply_params(index, dict(candidate, tier=tier))
+        _, found = index.search(queries, k)
+        recall = recall_at_k(found, truth)
+        params.update(candidate)
+        if recall >= target_recall:
+            break
+    params[f'recall@{k}'] = round(recall, 4)
+    if recall < target_recall:
+        print(f"  Índice {tier}: recall@{k} {recall:.3f} por debajo del objetivo {target_recall}")
+    return index, params
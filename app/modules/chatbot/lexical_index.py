@@ -0,0 +1,121 @@
+"""
+lexical_index.py - Índice léxico BM25 del catálogo de productos
+
+Los nombres de modelo ("Prima Tec Smart", "Broen Plus 700", "Diva") suelen
+escribirse tal cual, y los embeddings densos no siempre los ponen primeros.
+Este módulo agrega, junto al índice FAISS:
+
+    - `BM25Index`: índice invertido en memoria sobre modelo, descripción,
+      características técnicas y ventajas.
+    - `model_key`: clave normalizada de un nombre de modelo, para el camino
+      rápido de coincidencia exacta (sin pasar por el transformer).
+    - `reciprocal_rank_fusion`: fusión de rankings densos y léxicos (RRF).
+"""
+
+import math
+import re
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+RRF_K = 60  # Constante de RRF (Cormack et al.): amortigua el peso de los primeros puestos
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Minúsculas, sin acentos, separado en palabras alfanuméricas"""
+    text = unicodedata.normalize('NFKD', str(text or "")).encode('ascii', 'ignore').decode('ascii')
+    return _TOKEN_RE.findall(text.lower())
+
+
+def model_key(text: str) -> str:
+    """Clave de un nombre de modelo: "Prima Tec Smart", "prima tec smart!" → "prima tec smart" """
+    return " ".join(tokenize(text))
+
+
+def product_document(product: Dict[str, Any]) -> List[str]:
+    """Tokens indexados de un producto (el modelo pesa doble: es lo que más se busca literal)"""
+    parts = [product.get('model'), product.get('model'), product.get('description')]
+    for key in ('technical_features', 'advantages'):
+        value = product.get(key)
+        if isinstance(value, (list, tuple)):
+            parts.extend(value)
+        elif value:
+            parts.append(value)
+    return tokenize(" ".join(str(p) for p in parts if p))
+
+
+class BM25Index:
+    """Índice invertido con puntaje Okapi BM25"""
+
+    def __init__(self, documents: Sequence[Sequence[str]], k1: float = 1.5, b: float = 0.75):
+        """
+        Args:
+            documents: Tokens de cada documento (posición = id FAISS)
+            k1: Saturación de la frecuencia del término
+            b: Normalización por largo del documento
+        """
+        self.size = len(documents)
+        lengths = np.array([len(d) for d in documents], dtype='float32')
+        avg_length = float(lengths.mean()) if self.size and lengths.mean() > 0 else 1.0
+        # Denominador fijo por documento: k1 * (1 - b + b * largo / largo medio)
+        self._norms = k1 * (1 - b + b * lengths / avg_length)
+        self.k1 = k1
+
+        postings: Dict[str, Dict[int, int]] = {}
+        for doc_id, tokens in enumerate(documents):
+            for term, tf in Counter(tokens).items():
+                postings.setdefault(term, {})[doc_id] = tf
+        # término → (ids, frecuencias, idf)
+        self.postings: Dict[str, Tuple[np.ndarray, np.ndarray, float]] = {}
+        for term, docs in postings.items():
+            df = len(docs)
+            idf = math.log(1 + (self.size - df + 0.5) / (df + 0.5))
+            self.postings[term] = (np.fromiter(docs.keys(), dtype='int64'),
+                                   np.fromiter(docs.values(), dtype='float32'), idf)
+
+    def scores(self, query: str) -> np.ndarray:
+        """Puntaje BM25 de cada documento para una consulta"""
+        scores = np.zeros(self.size, dtype='float32')
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            ids, tf, idf = posting
+            scores[ids] += idf * tf * (self.k1 + 1) / (tf + self._norms[ids])
+        return scores
+
+    def search(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """
+        Los `k` documentos con mayor puntaje (sólo los que comparten algún término).
+
+        Returns:
+            Lista de (posición, puntaje) ordenada de mayor a menor
+        """
+        scores = self.scores(query)
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        order = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return [(int(i), float(scores[i])) for i in order]
+
+
+def reciprocal_rank_fusion(rankings: Iterable[Sequence[int]], k: int = RRF_K) -> List[Tuple[int, float]]:
+    """
+    Fusiona rankings con Reciprocal Rank Fusion: puntaje = Σ 1 / (k + puesto).
+
+    Args:
+        rankings: Listas de posiciones, cada una ordenada de mejor a peor
+        k: Constante de RRF
+
+    Returns:
+        Lista de (posición, puntaje fusionado) ordenada de mayor a menor
+    """
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
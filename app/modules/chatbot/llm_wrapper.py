@@ -1,14 +1,23 @@
 # app/llm_wrapper.py - Wrapper mejorado para Ollama con Mistral
 import ollama
 import os
-from typing import List, Dict, Optional
+import re
+import threading
+from typing import List, Dict, Optional, AsyncIterator, Tuple
 import json
 
+from fastapi.concurrency import run_in_threadpool
+
+from app.modules.chatbot.response_cache import ResponseCache, response_cache_key
+
 class OllamaLLM:
     """Wrapper para interactuar con Ollama usando el modelo Mistral"""
     
-    def __init__(self, model: str = "llama3.2:3b"):
+    def __init__(self, model: str = "llama3.2:3b",
+                 response_cache: Optional[ResponseCache] = None):
         self.model = model
+        # Caché de respuestas (por defecto según SOLDASUR_LLM_CACHE*)
+        self.response_cache = response_cache if response_cache is not None else ResponseCache.from_env()
         # Configurar host de Ollama; respeta OLLAMA_HOST si está definida
         self.ollama_host = os.getenv('OLLAMA_HOST', 'http://127.0.0.1:11434')
         try:
@@ -16,6 +25,11 @@ class OllamaLLM:
         except Exception:
             # Fallback simple al módulo si falla la creación del cliente
             self.client = None
+        try:
+            # Cliente asíncrono: no bloquea el event loop de FastAPI mientras genera
+            self.async_client = ollama.AsyncClient(host=self.ollama_host)
+        except Exception:
+            self.async_client = None
         self.system_prompt = """Eres Soldy, VENDEDOR EXPERTO de SOLDASUR (productos marca PEISA). Tu ÚNICA misión es VENDER productos del catálogo recomendando LA SOLUCIÓN PERFECTA para cada cliente.
 
 - NUESTRO TRABAJO:
@@ -94,11 +108,30 @@ IMPORTANTE:
             temperature: Creatividad de la respuesta (0.0-1.0)
             max_tokens: Máximo de tokens en la respuesta
         """
+        return self.generate_with_status(question, context, temperature, max_tokens)[0]
+    
+    def generate_with_status(self,
+                             question: str,
+                             context: Optional[List[Dict]] = None,
+                             temperature: float = 0.2,
+                             max_tokens: int = 150) -> Tuple[str, bool]:
+        """
+        Como `generate`, pero indica además si se usó la respuesta de respaldo.
+        
+        Returns:
+            (respuesta, True si es la de respaldo porque Ollama falló)
+        """
         try:
             # Si preguntan por precio, responder sin pasar por el LLM
-            if self._is_price_question(question):
+            if self.is_price_question(question):
                 safe = self._price_refusal_response(context)
-                return self._ensure_final_period(safe)
+                return self._ensure_final_period(safe), False
+
+            options = self._generation_options(temperature, max_tokens)
+            cache_key = self._cache_key(question, context, options)
+            cached = self._cached_response(cache_key)
+            if cached is not None:
+                return cached, False
 
             # Construir el prompt con contexto
             prompt = self._build_prompt(question, context)
@@ -110,35 +143,183 @@ IMPORTANTE:
                 model=self.model,
                 prompt=prompt,
                 system=self.system_prompt,
-                options={
-                    'temperature': temperature,
-                    # Límite de tokens (por defecto 80 para respuestas breves)
-                    'num_predict': max_tokens,
-                    'top_p': 0.5,  # Más determinismo
-                    'top_k': 20,   # Bajo para máximo control
-                    'repeat_penalty': 1.3,  # Penaliza repeticiones
-                    'num_ctx': 1024  # Contexto limitado para foco
-                }
+                options=options
             )
             
-            answer = response['response'].strip()
-            
-            # POST-PROCESAMIENTO: Truncar a primera oración completa
-            answer = self._truncate_to_brief(answer)
-            # Sanitizar menciones de precios
-            answer = self._sanitize_prices(answer)
-            # Asegurar punto final
-            answer = self._ensure_final_period(answer)
-            
-            # Log para debugging
-            word_count = len(answer.split())
-            print(f"Ollama respondió: {word_count} palabras, {len(answer)} caracteres")
-            
-            return answer
+            return self._store_response(cache_key, self._postprocess(response['response'])), False
             
         except Exception as e:
             print(f"Error en Ollama: {e}")
-            return self._fallback_response(question, context)
+            return self._fallback_response(question, context), True
+    
+    async def agenerate(self,
+                        question: str,
+                        context: Optional[List[Dict]] = None,
+                        temperature: float = 0.2,
+                        max_tokens: int = 150) -> str:
+        """
+        Versión asíncrona de `generate` (usa ollama.AsyncClient).
+        
+        Mientras Ollama genera, el event loop queda libre para atender otros chats.
+        """
+        answer, _ = await self.agenerate_with_status(question, context, temperature, max_tokens)
+        return answer
+    
+    async def agenerate_with_status(self,
+                                    question: str,
+                                    context: Optional[List[Dict]] = None,
+                                    temperature: float = 0.2,
+                                    max_tokens: int = 150) -> Tuple[str, bool]:
+        """
+        Versión asíncrona de `generate_with_status`.
+        
+        Returns:
+            (respuesta, True si es la de respaldo porque Ollama falló)
+        """
+        if self.async_client is None:
+            # El cliente sincrónico bloquea toda la generación: corre en un hilo aparte
+            return await run_in_threadpool(self.generate_with_status, question, context,
+                                           temperature, max_tokens)
+        try:
+            if self.is_price_question(question):
+                return self._ensure_final_period(self._price_refusal_response(context)), False
+
+            options = self._generation_options(temperature, max_tokens)
+            cache_key = self._cache_key(question, context, options)
+            cached = self._cached_response(cache_key)
+            if cached is not None:
+                return cached, False
+
+            response = await self.async_client.generate(
+                model=self.model,
+                prompt=self._build_prompt(question, context),
+                system=self.system_prompt,
+                options=options
+            )
+            return self._store_response(cache_key, self._postprocess(response['response'])), False
+
+        except Exception as e:
+            print(f"Error en Ollama: {e}")
+            return self._fallback_response(question, context), True
+    
+    async def astream(self,
+                      question: str,
+                      context: Optional[List[Dict]] = None,
+                      temperature: float = 0.2,
+                      max_tokens: int = 150) -> AsyncIterator[str]:
+        """
+        Genera la respuesta token a token (fragmentos de texto ya post-procesados).
+        
+        Los fragmentos concatenados son exactamente `_postprocess` del texto
+        completo (mismo truncado, sanitización de precios y punto final que
+        `generate`): sólo se emite lo que ya no puede cambiar. Cuando el
+        truncado deja la respuesta determinada se corta la generación en Ollama.
+        """
+        if self.is_price_question(question):
+            yield self._ensure_final_period(self._price_refusal_response(context))
+            return
+        if self.async_client is None:
+            yield await run_in_threadpool(self.generate, question, context, temperature, max_tokens)
+            return
+
+        options = self._generation_options(temperature, max_tokens)
+        cache_key = self._cache_key(question, context, options)
+        cached = self._cached_response(cache_key)
+        if cached is not None:
+            yield cached
+            return
+
+        processor = _StreamPostProcessor(self)
+        parts = []
+        failed = False
+        stream = None
+        try:
+            stream = await self.async_client.generate(
+                model=self.model,
+                prompt=self._build_prompt(question, context),
+                system=self.system_prompt,
+                options=options,
+                stream=True
+            )
+            async for part in stream:
+                text = processor.feed(part.get('response', ''))
+                if text:
+                    parts.append(text)
+                    yield text
+                if processor.done:
+                    break
+        except Exception as e:
+            print(f"Error en Ollama (stream): {e}")
+            failed = True
+            if not parts:
+                yield self._fallback_response(question, context)
+                return
+        finally:
+            # Cerrar la respuesta HTTP: si se cortó antes, Ollama deja de generar
+            if stream is not None:
+                await stream.aclose()
+
+        tail = processor.finish()
+        if tail:
+            parts.append(tail)
+            yield tail
+        if not failed and processor.exact:
+            # Sólo se cachean respuestas completas (iguales a las de `generate`)
+            self._store_response(cache_key, "".join(parts))
+        print(f"Ollama respondió (stream): {processor.word_count} palabras")
+    
+    def _cache_key(self, question: str, context: Optional[List[Dict]], options: Dict) -> Optional[str]:
+        """Clave de caché de una generación (None si la caché está desactivada)"""
+        if self.response_cache is None:
+            return None
+        # El bloque de productos tal como va en el prompt (modelos, descripciones, pasajes...)
+        return response_cache_key(question, self.model, options,
+                                  self._context_block(context), self.system_prompt)
+    
+    def _cached_response(self, cache_key: Optional[str]) -> Optional[str]:
+        """Busca una respuesta cacheada"""
+        if cache_key is None:
+            return None
+        return self.response_cache.get(cache_key)
+    
+    def _store_response(self, cache_key: Optional[str], answer: str) -> str:
+        """Guarda una respuesta generada en la caché y la devuelve"""
+        if cache_key is not None and answer:
+            self.response_cache.put(cache_key, answer)
+        return answer
+    
+    def _generation_options(self, temperature: float, max_tokens: int) -> Dict:
+        """Opciones de generación de Ollama con control ESTRICTO de longitud"""
+        return {
+            'temperature': temperature,
+            # Límite de tokens (por defecto 80 para respuestas breves)
+            'num_predict': max_tokens,
+            'top_p': 0.5,  # Más determinismo
+            'top_k': 20,   # Bajo para máximo control
+            'repeat_penalty': 1.3,  # Penaliza repeticiones
+            'num_ctx': 1024  # Contexto limitado para foco
+        }
+    
+    def _postprocess(self, answer: str) -> str:
+        """Post-procesa una respuesta completa del LLM"""
+        answer = self._finish_answer(answer)
+        
+        # Log para debugging
+        word_count = len(answer.split())
+        print(f"Ollama respondió: {word_count} palabras, {len(answer)} caracteres")
+        
+        return answer
+    
+    def _finish_answer(self, answer: str) -> str:
+        """Truncado, sanitización de precios y punto final (sin log)"""
+        answer = answer.strip()
+        
+        # POST-PROCESAMIENTO: Truncar a primera oración completa
+        answer = self._truncate_to_brief(answer)
+        # Sanitizar menciones de precios
+        answer = self._sanitize_prices(answer)
+        # Asegurar punto final
+        return self._ensure_final_period(answer)
     
     def _truncate_to_brief(self, text: str, max_words: int = 70) -> str:
         """
@@ -217,7 +398,7 @@ IMPORTANTE:
             sanitized = re.sub(p, 'precio a consultar', sanitized, flags=re.IGNORECASE)
         return sanitized
 
-    def _is_price_question(self, text: str) -> bool:
+    def is_price_question(self, text: str) -> bool:
         """Detecta si el usuario está preguntando por precios o costos."""
         if not text:
             return False
@@ -242,6 +423,16 @@ IMPORTANTE:
     
     def _build_prompt(self, question: str, context: Optional[List[Dict]] = None) -> str:
         """Construye el prompt con contexto del catálogo"""
+        prompt_parts = [self._context_block(context)]
+        
+        # Agregar la pregunta
+        prompt_parts.append(f"\nCONSULTA DEL CLIENTE:\n{question}")
+        prompt_parts.append("\nTU RESPUESTA (2-4 oraciones, 40-60 palabras, recomienda productos específicos del catálogo):")
+        
+        return "\n".join(prompt_parts)
+    
+    def _context_block(self, context: Optional[List[Dict]] = None) -> str:
+        """Bloque del prompt con los productos del catálogo (todo lo que no es la pregunta)"""
         prompt_parts = []
         
         # Agregar contexto de productos si existe
@@ -258,6 +449,10 @@ IMPORTANTE:
                     desc_short = desc[:200] + '...' if len(desc) > 200 else desc
                     prompt_parts.append(f"   Descripción: {desc_short}")
                 
+                # Pasaje del catálogo que coincidió con la consulta (para citarlo)
+                if product.get('matched_passage'):
+                    prompt_parts.append(f"   Dato relevante: {product['matched_passage'][:200]}")
+                
                 # Ventajas (primeras 3)
                 advantages = product.get('advantages', [])
                 if advantages:
@@ -270,10 +465,6 @@ IMPORTANTE:
         else:
             prompt_parts.append("NO HAY PRODUCTOS EN EL CONTEXTO - Responde de forma general y sugiere que el cliente especifique su necesidad.\n")
         
-        # Agregar la pregunta
-        prompt_parts.append(f"\nCONSULTA DEL CLIENTE:\n{question}")
-        prompt_parts.append("\nTU RESPUESTA (2-4 oraciones, 40-60 palabras, recomienda productos específicos del catálogo):")
-        
         return "\n".join(prompt_parts)
     
     def _fallback_response(self, question: str, context: Optional[List[Dict]] = None) -> str:
@@ -302,9 +493,138 @@ IMPORTANTE:
             print(f"Error en chat: {e}")
             return "Disculpa, hubo un error procesando tu mensaje."
 
-# Instancia global
-llm = OllamaLLM()
+class _StreamPostProcessor:
+    """
+    Post-procesamiento incremental de una respuesta en streaming.
+    
+    Lo emitido, concatenado, es exactamente `OllamaLLM._postprocess` del texto
+    completo. `_truncate_to_brief` sólo recorta si la respuesta supera
+    `max_words`, y entonces se queda con las primeras `max_sentences`
+    oraciones de al menos `min_sentence_words` palabras (o, si esas no entran,
+    con las primeras `max_words` palabras). Mientras no se sabe cuál de los
+    dos casos aplica, sólo se emiten las oraciones iniciales que aparecen
+    igual en ambos; el cierre de la última se retiene hasta el final para
+    normalizarlo con `_ensure_final_period`. Cuando el recorte queda
+    determinado se emite todo y se marca `done` (el resto de la generación
+    ya no cambia la respuesta).
+    """
+    
+    _TERMINATORS = '.?!'
+    _CLOSING = re.compile(r"[.?!\"”’')\]]+$")
+    # "el precio aprox." + " $100": la sanitización de precios cruza el fin de oración
+    _PRICE_LEAD = re.compile(r"\b(precio|costo|vale|sale|cuesta|presupuesto)\s*aprox\.$", re.IGNORECASE)
+    
+    def __init__(self, llm: OllamaLLM, max_words: int = 70, max_sentences: int = 3,
+                 min_sentence_words: int = 5):
+        self.llm = llm
+        self.max_words = max_words
+        self.max_sentences = max_sentences
+        self.min_sentence_words = min_sentence_words
+        self.word_count = 0
+        self.done = False
+        self.exact = True  # False si lo emitido se apartó de `_postprocess` (no debería pasar)
+        self._raw = ""
+        self._emitted = ""
+    
+    def feed(self, chunk: str) -> str:
+        """Agrega un fragmento del LLM y devuelve el texto listo para emitir"""
+        if self.done or not chunk:
+            return ""
+        self._raw += chunk
+        text = ' '.join(self._raw.split())
+        if len(text.split()) > self.max_words:
+            truncated = self._truncated(text)
+            if truncated is not None:
+                self.done = True
+                return self._emit(self._finish(truncated))
+        return self._emit(self._stable_prefix(text))
+    
+    def finish(self) -> str:
+        """Emite lo que quedó pendiente (con el punto final normalizado)"""
+        if not self.done:
+            self.done = True
+            out = self._emit(self.llm._finish_answer(self._raw))
+        else:
+            out = ""
+        self.word_count = len(self._emitted.split())
+        return out
+    
+    def _sentences(self, text: str) -> List[tuple]:
+        """Oraciones completas cortadas como en `_truncate_to_brief`: (oración, fin en `text`)"""
+        sentences, start = [], 0
+        for i, char in enumerate(text):
+            if char in self._TERMINATORS:
+                sentences.append((text[start:i + 1].strip(), i + 1))
+                start = i + 1
+        return sentences
+    
+    def _truncated(self, text: str) -> Optional[str]:
+        """
+        Resultado de `_truncate_to_brief` para una respuesta que ya superó
+        `max_words` (None si todavía depende de lo que falta generar).
+        """
+        kept = [sentence for sentence, _ in self._sentences(text)
+                if len(sentence.split()) >= self.min_sentence_words][:self.max_sentences]
+        joined = ' '.join(kept)
+        if len(joined.split()) > self.max_words:
+            return ' '.join(text.split()[:self.max_words])
+        if len(kept) == self.max_sentences:
+            return joined
+        return None
+    
+    def _stable_prefix(self, text: str) -> str:
+        """Oraciones iniciales que estarán en la respuesta final, se recorte o no"""
+        end = 0
+        for sentence, stop in self._sentences(text)[:self.max_sentences]:
+            if (len(sentence.split()) < self.min_sentence_words  # el recorte la descartaría
+                    or text[stop:stop + 1] != ' '               # "24.5": el recorte separa, el original no
+                    or self._PRICE_LEAD.search(sentence)):
+                break
+            end = stop
+        if not end:
+            return ""
+        text = self.llm._sanitize_prices(text[:end])
+        closing = self._CLOSING.search(text)
+        return text[:closing.start()] if closing else text
+    
+    def _finish(self, text: str) -> str:
+        """Sanitización y punto final, como `_finish_answer` tras `_truncate_to_brief`"""
+        text = self.llm._ensure_final_period(text)
+        return self.llm._ensure_final_period(self.llm._sanitize_prices(text))
+    
+    def _emit(self, target: str) -> str:
+        """Devuelve lo que `target` agrega a lo ya emitido"""
+        if self._emitted.startswith(target):
+            return ""
+        common = os.path.commonprefix([self._emitted, target])
+        if len(common) < len(self._emitted):
+            # Lo emitido no se puede corregir: se completa desde donde coincide
+            print("Aviso: el post-procesamiento en streaming difiere del de generate()")
+            self.exact = False
+        out = target[len(common):]
+        self._emitted += out
+        return out
+
+
+# Instancia global (se crea en el primer uso, ver app/providers.py)
+_llm: Optional[OllamaLLM] = None
+_llm_lock = threading.Lock()
+
+def get_llm() -> OllamaLLM:
+    """Devuelve la instancia global de OllamaLLM, creándola la primera vez"""
+    global _llm
+    if _llm is None:
+        with _llm_lock:
+            if _llm is None:
+                _llm = OllamaLLM()
+    return _llm
+
+def __getattr__(name: str):
+    # Compatibilidad: `from llm_wrapper import llm` sigue funcionando
+    if name == 'llm':
+        return get_llm()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def answer(question: str, context: List[Dict] = None) -> str:
     """Función de compatibilidad con versión anterior"""
-    return llm.generate(question, context)
+    return get_llm().generate(question, context)
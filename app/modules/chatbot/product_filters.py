@@ -0,0 +1,96 @@
+"""
+product_filters.py - Metadatos de filtrado para la búsqueda vectorial
+
+`query.search_filtered` filtra por tipo ("caldera") y potencia mínima. Antes
+se recuperaban 80 vecinos y se filtraban en Python: un filtro selectivo podía
+devolver menos de `top_k` resultados y uno poco selectivo desperdiciaba
+trabajo.
+
+`ProductFilters` precalcula, por posición del índice:
+    - un bitmap (máscara booleana) por tipo y por familia
+    - un array de potencias ordenado (potencia mínima = búsqueda binaria)
+
+La máscara resultante se pasa a FAISS como `IDSelectorBitmap`
+(ver `ProductIndexService.search`): la búsqueda sólo considera los
+productos que cumplen el filtro y el resultado es exacto.
+"""
+
+import math
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+def _key(value: Any) -> str:
+    return str(value or "").strip().lower()
+
+
+def _power(product: Dict[str, Any]) -> float:
+    try:
+        value = float(product.get('power_w'))
+    except (TypeError, ValueError):
+        return math.nan
+    return value
+
+
+class ProductFilters:
+    """Bitmaps por tipo/familia y potencias ordenadas de una lista de productos"""
+
+    def __init__(self, products: Sequence[Dict[str, Any]]):
+        """
+        Args:
+            products: Productos en el orden del índice (posición = id FAISS)
+        """
+        self.size = len(products)
+        self.type_masks = self._masks(_key(p.get('type')) for p in products)
+        self.family_masks = self._masks(_key(p.get('family')) for p in products)
+
+        power = np.array([_power(p) for p in products], dtype='float64')
+        known = np.flatnonzero(~np.isnan(power))          # sin potencia: nunca cumple un mínimo
+        order = np.argsort(power[known], kind='stable')
+        self.power_ids = known[order]
+        self.power_sorted = power[known][order]
+
+    def _masks(self, keys) -> Dict[str, np.ndarray]:
+        masks: Dict[str, np.ndarray] = {}
+        for position, key in enumerate(keys):
+            if key not in masks:
+                masks[key] = np.zeros(self.size, dtype=bool)
+            masks[key][position] = True
+        return masks
+
+    def _contains(self, masks: Dict[str, np.ndarray], term: str) -> np.ndarray:
+        """Unión de los bitmaps cuya clave contiene `term` ("caldera" → "caldera mural", ...)"""
+        term = _key(term)
+        mask = np.zeros(self.size, dtype=bool)
+        for key, key_mask in masks.items():
+            if term in key:
+                mask |= key_mask
+        return mask
+
+    def mask(self, type_contains: Optional[str] = None, family_contains: Optional[str] = None,
+             min_power: Optional[float] = None) -> Optional[np.ndarray]:
+        """
+        Máscara de los productos que cumplen todos los filtros dados.
+
+        Args:
+            type_contains: Texto que debe contener el tipo (sin distinguir mayúsculas)
+            family_contains: Texto que debe contener la familia
+            min_power: Potencia mínima en W
+
+        Returns:
+            Array booleano por posición, o None si no hay ningún filtro
+        """
+        masks: List[np.ndarray] = []
+        if type_contains:
+            masks.append(self._contains(self.type_masks, type_contains))
+        if family_contains:
+            masks.append(self._contains(self.family_masks, family_contains))
+        if min_power:
+            start = np.searchsorted(self.power_sorted, min_power, side='left')
+            power_mask = np.zeros(self.size, dtype=bool)
+            power_mask[self.power_ids[start:]] = True
+            masks.append(power_mask)
+        if not masks:
+            return None
+        return np.logical_and.reduce(masks)
@@ -0,0 +1,410 @@
+"""
+product_index.py - Índice de embeddings de productos persistido en disco
+
+Evita re-vectorizar todo el catálogo en cada arranque de un worker. El índice
+FAISS se guarda en `embeddings/` junto a un manifiesto que registra:
+    - modelo de embeddings y dimensión
+    - versión del contenido (hash de los textos vectorizados y de los productos)
+    - qué fragmento ocupa cada id FAISS: (clave estable del producto, hash del
+      texto), o null si es una lápida (fragmento borrado o reemplazado)
+    - los archivos de la versión (índice, metadatos, snapshot columnar)
+
+Al arrancar o reindexar:
+    - Si nada cambió, el índice se carga mapeado en memoria (sin vectorizar).
+    - Si cambiaron algunos productos ("upsert"), sólo se vectorizan los
+      fragmentos nuevos o modificados y se agregan al final del índice; los
+      reemplazados o borrados quedan como lápidas (la búsqueda los excluye con
+      el mismo `IDSelector` de los filtros). Cuando las lápidas superan
+      `COMPACT_RATIO` del índice, o cambia el nivel, se reconstruye reutilizando
+      los vectores vivos ("incremental").
+    - Si cambió el modelo, se vectoriza todo ("full").
+
+El manifiesto es el punto de confirmación: se escribe (con reemplazo atómico)
+después de todos los archivos que nombra, así que un lector siempre ve una
+versión completa. Los archivos de la versión anterior se conservan hasta la
+siguiente, para los procesos que todavía la están abriendo.
+
+El tipo de índice (flat / HNSW / IVF-PQ) se elige por tamaño del corpus y sus
+parámetros calibrados se guardan en el manifiesto (ver index_tiers.py). Todos
+los niveles conservan los vectores exactos, así que una reconstrucción
+nunca re-vectoriza lo que no cambió.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+from app.modules.chatbot.index_tiers import apply_params, build_index, choose_tier
+
+MANIFEST_VERSION = 2
+COMPACT_RATIO = 0.2   # fracción de lápidas que dispara la reconstrucción
+DEFAULT_INDEX_DIR = Path(__file__).resolve().parents[3] / "embeddings"
+DEFAULT_INDEX_NAME = "rag_products"
+
+
+def text_hash(text: str) -> str:
+    """Hash SHA-256 del texto de un producto"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def product_hash(product: Dict[str, Any]) -> str:
+    """Hash SHA-256 de todos los datos de un producto (no sólo lo que se vectoriza)"""
+    return text_hash(json.dumps(product, sort_keys=True, ensure_ascii=False, default=str))
+
+
+def catalog_hash(model_name: str, text_hashes: Sequence[str]) -> str:
+    """Hash del contenido vectorizado: modelo + textos de producto en orden"""
+    digest = hashlib.sha256(model_name.encode('utf-8'))
+    for h in text_hashes:
+        digest.update(h.encode('ascii'))
+    return digest.hexdigest()
+
+
+class ContentHash:
+    """
+    Versión del contenido, calculable por lotes: modelo + por cada producto,
+    el hash de cada uno de sus fragmentos y el de todos sus datos.
+    """
+
+    def __init__(self, model_name: str):
+        self._digest = hashlib.sha256(model_name.encode('utf-8'))
+
+    def add(self, chunk_hashes: Sequence[str], product_digest: str) -> None:
+        for h in chunk_hashes:
+            self._digest.update(h.encode('ascii'))
+        self._digest.update(product_digest.encode('ascii'))
+
+    def hexdigest(self) -> str:
+        return self._digest.hexdigest()
+
+
+def _read_index(path: Path) -> faiss.Index:
+    """Lee un índice FAISS mapeado en memoria (o completo si el tipo no lo admite)"""
+    flags = getattr(faiss, 'IO_FLAG_MMAP_IFC', faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+    try:
+        return faiss.read_index(str(path), flags)
+    except RuntimeError:
+        return faiss.read_index(str(path))
+
+
+def _write_atomic(path: Path, write) -> None:
+    """Escribe en un temporal y lo renombra: otro worker nunca ve un archivo a medias"""
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    write(tmp)
+    os.replace(tmp, path)
+
+
+class PersistedProductIndex:
+    """
+    Índice de productos (producto interno sobre embeddings L2-normalizados) con caché en disco.
+
+    Uso:
+        store = PersistedProductIndex(model_name)
+        index = store.load_or_build(product_texts, model)
+        store.ids    # id FAISS de cada texto
+    """
+
+    def __init__(self, model_name: str, directory: Optional[Path] = None,
+                 name: str = DEFAULT_INDEX_NAME, tier: Optional[str] = None,
+                 target_recall: Optional[float] = None):
+        """
+        Args:
+            model_name: Nombre del modelo de embeddings (parte de la clave de caché)
+            directory: Carpeta donde se guardan índice y manifiesto
+            name: Prefijo de los archivos
+            tier: Nivel de índice (por defecto SOLDASUR_INDEX_TIER, "auto")
+            target_recall: Recall@10 objetivo (por defecto SOLDASUR_INDEX_TARGET_RECALL)
+        """
+        self.model_name = model_name
+        self.directory = Path(directory) if directory else DEFAULT_INDEX_DIR
+        self.name = name
+        self.tier = tier
+        self.target_recall = target_recall
+        # Parámetros del índice actual (nivel, efSearch / nprobe, recall calibrado)
+        self.params: Dict[str, Any] = {}
+        self.manifest_path = self.directory / f"{name}.manifest.json"
+        # Id FAISS de cada texto de la última carga (los ids sin texto son lápidas)
+        self.ids = np.empty(0, dtype='int64')
+        # Resultado de la última carga: 'cached', 'upsert', 'incremental' o 'full'
+        self.last_build = None
+        self.last_embedded = 0
+        self.last_removed = 0
+
+    def _index_path(self, version: str) -> Path:
+        return self.directory / f"{self.name}-{version[:16]}.faiss"
+
+    def _read_manifest(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if manifest.get('version') != MANIFEST_VERSION:
+            return None
+        return manifest
+
+    def _read_previous(self, manifest: Optional[Dict[str, Any]],
+                       writable: bool = False) -> Optional[faiss.Index]:
+        """Índice de la versión del manifiesto (None si no existe o cambió el modelo)"""
+        if not manifest or manifest.get('model') != self.model_name:
+            return None
+        path = self.directory / manifest['files']['index']
+        if not path.exists():
+            return None
+        try:
+            index = faiss.read_index(str(path)) if writable else _read_index(path)
+        except RuntimeError as e:
+            print(f"  Índice persistido ilegible, se reconstruye: {e}")
+            return None
+        return index if index.ntotal == len(manifest['entries']) else None
+
+    def load_or_build(self, product_texts: List[str], model, keys: Optional[Sequence[str]] = None,
+                      version: Optional[str] = None,
+                      files: Optional[Dict[str, str]] = None) -> faiss.Index:
+        """
+        Devuelve el índice de los textos dados, actualizándolo en disco si cambiaron.
+
+        Args:
+            product_texts: Texto de cada fragmento, en el orden del catálogo
+            model: Modelo con `encode(textos)` (sólo se usa si hay que vectorizar)
+            keys: Clave estable del producto de cada texto (por defecto, sólo el texto
+                  identifica al fragmento)
+            version: Versión del contenido (por defecto, el hash de los textos)
+            files: Otros archivos de la versión, ya escritos en la carpeta
+                   ({'metadata': 'products-….db', ...}); se confirman con el manifiesto
+
+        Returns:
+            Índice FAISS; `self.ids[i]` es el id del texto `i`
+        """
+        hashes = [text_hash(t) for t in product_texts]
+        keys = list(keys) if keys is not None else [""] * len(hashes)
+        version = version or catalog_hash(self.model_name, hashes)
+        manifest = self._read_manifest()
+        tier = choose_tier(len(hashes), self.target_recall, self.tier)
+
+        if (manifest and manifest.get('catalog_hash') == version
+                and manifest.get('index', {}).get('tier', 'flat') == tier):
+            index = self._read_previous(manifest)
+            if index is not None:
+                self.ids = IndexUpdate.match_entries(manifest['entries'], keys, hashes)
+                self.params = manifest.get('index', {'tier': 'flat'})
+                apply_params(index, self.params)
+                self.last_build, self.last_embedded, self.last_removed = 'cached', 0, 0
+                return index
+
+        update = self.update(model, manifest)
+        update.add(product_texts, keys, hashes)
+        return update.commit(version, files)
+
+    def update(self, model, manifest: Optional[Dict[str, Any]] = None) -> "IndexUpdate":
+        """Actualización por lotes de la versión del manifiesto (ver `IndexUpdate`)"""
+        return IndexUpdate(self, model, manifest if manifest is not None else self._read_manifest())
+
+    def _save(self, index: Optional[faiss.Index], index_file: str,
+              entries: List[Optional[List[str]]], version: str,
+              files: Optional[Dict[str, str]], previous: Optional[Dict[str, Any]]) -> None:
+        """
+        Guarda índice (si cambió) y manifiesto; el manifiesto va último porque
+        confirma la versión. Los errores de disco no son fatales.
+        """
+        files = dict(files or {}, index=index_file)
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            if index is not None:
+                _write_atomic(self.directory / index_file,
+                              lambda p: faiss.write_index(index, str(p)))
+            manifest = {
+                'version': MANIFEST_VERSION,
+                'model': self.model_name,
+                'dimension': index.d if index is not None else previous['dimension'],
+                'catalog_hash': version,
+                'generation': (previous or {}).get('generation', 0) + 1,
+                'count': sum(1 for e in entries if e is not None),
+                'tombstones': sum(1 for e in entries if e is None),
+                'entries': entries,
+                'index': self.params,
+                'files': files,
+                'previous_files': (previous or {}).get('files', {}),
+            }
+            _write_atomic(self.manifest_path,
+                          lambda p: p.write_text(json.dumps(manifest), encoding='utf-8'))
+        except OSError as e:
+            print(f"  No se pudo guardar el índice en {self.directory}: {e}")
+            return
+
+        # Borrar los archivos de versiones anteriores a la previa
+        keep = set(files.values()) | set(manifest['previous_files'].values())
+        for path in self.directory.glob(f"{self.name}-*"):
+            if path.name not in keep and not path.name.endswith('.tmp'):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+
+
+class IndexUpdate:
+    """
+    Actualización incremental del índice, por lotes.
+
+    `match` asigna a cada fragmento el id FAISS de un fragmento vivo igual de
+    la versión anterior (misma clave y hash de texto) o un id nuevo al final;
+    `append` agrega, en ese mismo orden, los vectores de los fragmentos nuevos.
+    Así el pipeline de ingesta puede vectorizar un lote en otro hilo mientras
+    arma el siguiente (`match` y `append` se llaman siempre desde un mismo
+    hilo cada uno). `commit` deja lápidas en lo que no volvió a aparecer,
+    reconstruye si hace falta (demasiadas lápidas o cambio de nivel) y
+    confirma la versión con el manifiesto.
+
+    Uso:
+        update = store.update(model)
+        for texts, keys in lotes:
+            update.add(texts, keys)
+        index = update.commit(version, files)
+    """
+
+    def __init__(self, store: PersistedProductIndex, model, manifest: Optional[Dict[str, Any]]):
+        self.store = store
+        self.model = model
+        # Sólo se reutiliza una versión anterior del mismo modelo con el índice en disco
+        usable = (manifest and manifest.get('model') == store.model_name
+                  and (store.directory / manifest['files']['index']).exists())
+        self.manifest = manifest if usable else None
+        self.previous_entries: List[Optional[List[str]]] = manifest['entries'] if usable else []
+        # (clave, hash) → ids vivos de la versión anterior todavía sin asignar
+        self._available: Dict[Tuple[str, str], List[int]] = {}
+        for faiss_id in range(len(self.previous_entries) - 1, -1, -1):
+            if self.previous_entries[faiss_id] is not None:
+                self._available.setdefault(tuple(self.previous_entries[faiss_id]), []).append(faiss_id)
+        self.entries: List[Optional[List[str]]] = [None] * len(self.previous_entries)
+        self._ids: List[np.ndarray] = []
+        self.index: Optional[faiss.Index] = None   # Índice en memoria si hubo que agregar vectores
+        self.embedded = 0
+
+    @staticmethod
+    def match_entries(entries: List[Optional[List[str]]], keys: Sequence[str],
+                      hashes: Sequence[str]) -> np.ndarray:
+        """Id FAISS de cada texto en una versión ya confirmada (-1 si no está)"""
+        available: Dict[Tuple[str, str], List[int]] = {}
+        for faiss_id in range(len(entries) - 1, -1, -1):
+            if entries[faiss_id] is not None:
+                available.setdefault(tuple(entries[faiss_id]), []).append(faiss_id)
+        ids = np.full(len(hashes), -1, dtype='int64')
+        for i, entry in enumerate(zip(keys, hashes)):
+            pool = available.get(entry)
+            if pool:
+                ids[i] = pool.pop()
+        return ids
+
+    def match(self, keys: Sequence[str], hashes: Sequence[str]) -> List[int]:
+        """
+        Asigna ids a un lote de fragmentos.
+
+        Returns:
+            Posiciones (dentro del lote) de los fragmentos que hay que vectorizar
+            y pasar a `append`, en ese orden
+        """
+        ids = np.empty(len(hashes), dtype='int64')
+        missing = []
+        for i, entry in enumerate(zip(keys, hashes)):
+            pool = self._available.get(entry)
+            if pool:
+                ids[i] = pool.pop()
+                self.entries[ids[i]] = list(entry)
+            else:
+                ids[i] = len(self.entries)
+                self.entries.append(list(entry))
+                missing.append(i)
+        self._ids.append(ids)
+        return missing
+
+    def append(self, vectors: np.ndarray) -> None:
+        """Agrega vectores (L2-normalizados) de fragmentos nuevos, en el orden de `match`"""
+        if not len(vectors):
+            return
+        if self.index is None:
+            previous = self.store._read_previous(self.manifest, writable=True) if self.manifest else None
+            self.index = previous if previous is not None else faiss.IndexFlatIP(vectors.shape[1])
+        self.index.add(np.ascontiguousarray(vectors, dtype='float32'))
+        self.embedded += len(vectors)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        encoded = np.array(self.model.encode(texts, show_progress_bar=False)).astype('float32')
+        faiss.normalize_L2(encoded)
+        return encoded
+
+    def add(self, texts: Sequence[str], keys: Sequence[str],
+            hashes: Optional[Sequence[str]] = None) -> None:
+        """`match` + vectorizar + `append` de un lote, en el hilo actual"""
+        hashes = hashes if hashes is not None else [text_hash(t) for t in texts]
+        missing = self.match(keys, hashes)
+        if missing:
+            self.append(self.encode([texts[i] for i in missing]))
+
+    def commit(self, version: str, files: Optional[Dict[str, str]] = None) -> faiss.Index:
+        """
+        Confirma la versión: lápidas, reconstrucción si hace falta, archivos y manifiesto.
+
+        Returns:
+            Índice FAISS; `store.ids[i]` es el id del fragmento `i` (en el orden de los lotes)
+        """
+        store = self.store
+        ids = np.concatenate(self._ids) if self._ids else np.empty(0, dtype='int64')
+        live = np.flatnonzero([e is not None for e in self.entries])
+        removed = sum(1 for i, e in enumerate(self.previous_entries)
+                      if e is not None and self.entries[i] is None)
+        tombstones = len(self.entries) - len(live)
+        tier = choose_tier(len(live), store.target_recall, store.tier)
+        previous_tier = (self.manifest or {}).get('index', {}).get('tier', 'flat')
+
+        index = self.index
+        if self.manifest is None:
+            current_tier = "flat"       # los vectores se fueron agregando a un IndexFlatIP
+        else:
+            current_tier = previous_tier
+            if index is None:
+                index = store._read_previous(self.manifest)
+                if index is None:
+                    raise RuntimeError("No se pudo abrir el índice de la versión anterior")
+
+        if self.manifest is not None and current_tier == tier and \
+                tombstones / max(1, len(self.entries)) <= COMPACT_RATIO:
+            # Upsert: lo nuevo quedó al final del índice anterior
+            store.params = self.manifest.get('index', {'tier': 'flat'})
+            apply_params(index, store.params)
+            store.ids = ids
+            store.last_build = 'upsert'
+            changed = self.index is not None
+            index_file = store._index_path(version).name if changed else self.manifest['files']['index']
+            store.last_embedded, store.last_removed = self.embedded, removed
+            store._save(index if changed else None, index_file, self.entries, version, files,
+                        self.manifest)
+            return index
+
+        # Reconstrucción con los vectores vivos
+        if index is None:
+            raise RuntimeError("No hay fragmentos para indexar")
+        remap = np.full(len(self.entries), -1, dtype='int64')
+        remap[live] = np.arange(len(live))
+        if self.manifest is None and tier == "flat":
+            rebuilt, store.params = index, {'tier': "flat"}   # todo es nuevo: no hay lápidas
+        else:
+            rebuilt, store.params = build_index(_reconstruct(index, live), tier, store.target_recall)
+        store.ids = remap[ids]
+        store.last_build = 'full' if self.embedded == len(live) else 'incremental'
+        store.last_embedded, store.last_removed = self.embedded, removed
+        store._save(rebuilt, store._index_path(version).name,
+                    [self.entries[i] for i in live], version, files, self.manifest)
+        return rebuilt
+
+
+def _reconstruct(index: faiss.Index, ids: np.ndarray) -> np.ndarray:
+    """Vectores exactos de los ids dados (todos los niveles guardan los vectores completos)"""
+    if len(ids) == index.ntotal:
+        return index.reconstruct_n(0, index.ntotal)
+    return np.vstack([index.reconstruct(int(i)) for i in ids]) if len(ids) else \
+        np.empty((0, index.d), dtype='float32')
@@ -1,44 +1,57 @@
 # app/rag_engine_v2.py - Motor RAG completo con FAISS + Ollama Mistral
 import json
 import numpy as np
-import faiss
-from sentence_transformers import SentenceTransformer
-from typing import List, Dict, Any, Optional
+import threading
+from typing import List, Dict, Any, Optional, Callable
 from pathlib import Path
 
-from app.modules.chatbot.llm_wrapper import llm
+from app.batching import MicroBatcher
+from app.modules.chatbot.chunking import product_to_text
+from app.modules.chatbot.index_service import IndexSnapshot, get_product_index_service
+from app.modules.chatbot.lexical_index import reciprocal_rank_fusion
+from app.modules.chatbot.llm_wrapper import get_llm
+from app.modules.chatbot.semantic_cache import SemanticCache
 from app.modules.scraping.product_scraper import get_products_catalog
 
+# Candidatos por ranking (denso y léxico) antes de fusionar: top_k * factor, mínimo 20
+HYBRID_POOL_FACTOR = 4
+HYBRID_POOL_MIN = 20
+
 class RAGEngineV2:
     """
     Motor RAG (Retrieval-Augmented Generation) completo con:
-    - Búsqueda vectorial usando FAISS
+    - Búsqueda híbrida: vectorial (FAISS) + léxica (BM25), fusionadas con RRF
     - Embeddings con sentence-transformers
     - Generación con Ollama Mistral
     - Integración con sistema experto
+    - Caché semántica de respuestas (consultas parafraseadas)
     """
     
     def __init__(self, catalog_path: str = "data/products_catalog.json"):
         """Inicializa el motor RAG"""
         print("Inicializando RAG Engine V2...")
         
-        # Cargar catálogo de productos
-        self.products = self._load_catalog(catalog_path)
-        print(f"  Catálogo cargado: {len(self.products)} productos")
+        # Modelo, índice y productos compartidos con query.py (ver index_service.py): las
+        # posiciones de una búsqueda se leen del snapshot que la resolvió, no de una copia local
+        self.catalog_path = catalog_path
+        self.index_service = get_product_index_service()
+        print("  Creando índice vectorial...")
+        stats = self._create_index()
+        print(f"  Catálogo cargado: {stats['products']} productos")
+        print(f"  Índice FAISS listo ({stats['build']}, {stats['embedded']} productos vectorizados)")
         
-        # Inicializar modelo de embeddings
-        print("  Cargando modelo de embeddings...")
-        self.embedding_model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
-        print("  Modelo de embeddings listo")
+        # Caché semántica: consulta similar → misma respuesta, sin llamar al LLM
+        self.semantic_cache = SemanticCache.from_env(self.index_service.snapshot().index.d)
         
-        # Crear índice FAISS
-        print("  Creando índice vectorial...")
-        self.index, self.product_texts = self._create_index()
-        print("  Índice FAISS creado")
+        # Consultas concurrentes → un solo encode + index.search por lote
+        self.search_batcher = MicroBatcher(self._search_batch)
         
         # Referencia al motor experto (se inyecta después)
         self.expert_engine = None
         
+        # Funciones a llamar cuando se recarga el catálogo (ej: tablas precalculadas)
+        self._catalog_listeners: List[Callable[[], None]] = []
+        
         print("RAG Engine V2 inicializado correctamente\n")
     
     def _load_catalog(self, catalog_path: str) -> List[Dict]:
@@ -54,46 +67,49 @@ class RAGEngineV2:
             print(f"  Error cargando catálogo: {e}")
             return get_products_catalog()
     
-    def _create_index(self):
-        """Crea el índice FAISS con embeddings de productos"""
-        # Crear textos descriptivos de productos
-        product_texts = []
-        for product in self.products:
-            text = self._product_to_text(product)
-            product_texts.append(text)
-        
-        # Generar embeddings
-        embeddings = self.embedding_model.encode(product_texts, show_progress_bar=False)
-        embeddings = np.array(embeddings).astype('float32')
+    def _create_index(self) -> Dict[str, Any]:
+        """Indexa el catálogo en el servicio compartido (o lo carga de disco)"""
+        # Embeddings normalizados (similitud coseno); sólo se generan si cambiaron
+        return self.index_service.sync(self._load_catalog(self.catalog_path))
+    
+    def reload_catalog(self, catalog_path: Optional[str] = None) -> None:
+        """
+        Recarga el catálogo y reconstruye el índice.
         
-        # Normalizar para búsqueda por similitud coseno
-        faiss.normalize_L2(embeddings)
+        Invalida las respuestas cacheadas, que pueden mencionar productos
+        o datos que ya no están en el catálogo.
         
-        # Crear índice FAISS
-        dimension = embeddings.shape[1]
-        index = faiss.IndexFlatIP(dimension)  # Inner Product (cosine similarity)
-        index.add(embeddings)
+        Args:
+            catalog_path: Nuevo archivo de catálogo (por defecto el actual)
+        """
+        if catalog_path:
+            self.catalog_path = catalog_path
+        stats = self._create_index()
+        if self.semantic_cache is not None:
+            self.semantic_cache.clear()
+        llm = get_llm()
+        if llm.response_cache is not None:
+            llm.response_cache.clear()
+        print(f"Catálogo recargado: {stats['products']} productos")
+        for listener in self._catalog_listeners:
+            try:
+                listener()
+            except Exception as e:
+                print(f"Error actualizando datos derivados del catálogo: {e}")
+    
+    def add_catalog_listener(self, listener: Callable[[], None]) -> None:
+        """
+        Registra una función que se llama después de cada `reload_catalog`.
         
-        return index, product_texts
+        Args:
+            listener: Función sin argumentos (ej: recalcular una tabla precalculada)
+        """
+        self._catalog_listeners.append(listener)
     
-    def _product_to_text(self, product: Dict) -> str:
+    @staticmethod
+    def _product_to_text(product: Dict) -> str:
         """Convierte un producto a texto para embedding"""
-        parts = [
-            f"Producto: {product.get('model', '')}",
-            f"Familia: {product.get('family', '')}",
-            f"Tipo: {product.get('type', '')}",
-            f"Descripción: {product.get('description', '')}",
-        ]
-        
-        if product.get('features'):
-            parts.append(f"Características: {', '.join(product['features'])}")
-        
-        if product.get('applications'):
-            parts.append(f"Aplicaciones: {', '.join(product['applications'])}")
-        
-        parts.append(f"Potencia: {product.get('power_w', 0)} W")
-        
-        return " ".join(parts)
+        return product_to_text(product)
     
     def set_expert_engine(self, expert_engine):
         """Inyecta el motor experto para enriquecimiento mutuo"""
@@ -114,8 +130,22 @@ class RAGEngineV2:
         """
         print(f"\nRAG Query: '{question[:50]}...'")
         
-        # 1. Búsqueda vectorial
-        relevant_products = self.search_products(question, top_k)
+        llm = get_llm()
+        
+        # 1. Búsqueda híbrida por lotes (el embedding se reutiliza para la caché semántica;
+        #    es None si la consulta era un nombre de modelo exacto)
+        query_embedding, relevant_products = await self.search_batcher.submit((question, top_k))
+        
+        # Las respuestas con contexto experto o sobre precios dependen de algo
+        # más que la pregunta: no se cachean
+        use_cache = (self.semantic_cache is not None and query_embedding is not None
+                     and not expert_context and not llm.is_price_question(question))
+        if use_cache:
+            cached = self.semantic_cache.lookup(query_embedding)
+            if cached is not None and cached['top_k'] == top_k:
+                print("  Respuesta desde caché semántica")
+                return dict(cached['result'], cached=True)
+        
         print(f"  Encontrados {len(relevant_products)} productos relevantes")
         
         # 2. Filtrar por contexto experto si existe
@@ -123,25 +153,36 @@ class RAGEngineV2:
             relevant_products = self._filter_by_expert_context(relevant_products, expert_context)
             print(f"  Filtrados por contexto: {len(relevant_products)} productos")
         
-        # 3. Generar respuesta con Ollama Mistral
-        answer = llm.generate(question, relevant_products)
+        # 3. Generar respuesta con Ollama Mistral (asíncrono: no bloquea el event loop)
+        answer, is_fallback = await llm.agenerate_with_status(question, relevant_products)
         
         # 4. NO sugerir flujo experto en modo chat - mantener conversación fluida
         # El usuario puede cambiar de modo manualmente si lo desea
         
-        return {
+        result = {
             'answer': answer,
             'products': relevant_products[:2],  # Solo top 2 para no saturar
             'sources': [p['model'] for p in relevant_products[:2]],
             'expert_suggestion': None,  # No interrumpir el chat
             'context_used': expert_context is not None,
             'mode': 'rag',
-            'type': 'chat_response'  # Indicar que es respuesta de chat continuo
+            'type': 'chat_response',  # Indicar que es respuesta de chat continuo
+            'cached': False
         }
+        
+        # No cachear la respuesta de respaldo (Ollama caído o con error)
+        if use_cache and not is_fallback:
+            self.semantic_cache.put(query_embedding, {'top_k': top_k, 'result': result})
+        
+        return result
     
     def search_products(self, query_text: str, top_k: int = 5) -> List[Dict]:
         """
-        Búsqueda vectorial de productos usando FAISS
+        Búsqueda híbrida de productos: vectorial (FAISS) + léxica (BM25), fusionadas con RRF
+        
+        Si la consulta es exactamente un nombre de modelo del catálogo, no se
+        vectoriza: se devuelve ese producto primero, completado con los
+        resultados léxicos.
         
         Args:
             query_text: Texto de búsqueda
@@ -150,20 +191,128 @@ class RAGEngineV2:
         Returns:
             Lista de productos relevantes
         """
-        # Generar embedding de la consulta
-        query_embedding = self.embedding_model.encode([query_text])
-        query_embedding = np.array(query_embedding).astype('float32')
-        faiss.normalize_L2(query_embedding)
+        snapshot = self.index_service.snapshot()
+        exact = self._exact_model_results(query_text, top_k, snapshot)
+        if exact is not None:
+            return exact
+        _, positions, chunk_ids = self.index_service.search_passages(
+            self._embed_query(query_text), self._pool_size(top_k, snapshot), snapshot=snapshot)
+        return self._hybrid_results(query_text, positions[0], chunk_ids[0], top_k, snapshot)
+    
+    async def asearch_products(self, query_text: str, top_k: int = 5) -> List[Dict]:
+        """
+        Versión asíncrona de `search_products`: las consultas concurrentes se
+        vectorizan y buscan juntas en un solo lote.
+        """
+        _, products = await self.search_batcher.submit((query_text, top_k))
+        return products
+    
+    def _search_batch(self, items: List[tuple]) -> List[tuple]:
+        """
+        Procesa un lote de (consulta, top_k) con un solo encode y un solo index.search.
+        
+        Las consultas que son un nombre de modelo exacto no se vectorizan.
         
-        # Buscar en el índice
-        distances, indices = self.index.search(query_embedding, top_k)
+        Returns:
+            (embedding de la consulta o None, productos) por cada elemento, en orden
+        """
+        results: List[Optional[tuple]] = [None] * len(items)
+        snapshot = self.index_service.snapshot()  # una sola versión del índice para todo el lote
+        dense = []  # posiciones en `items` que necesitan búsqueda vectorial
+        for i, (query_text, top_k) in enumerate(items):
+            exact = self._exact_model_results(query_text, top_k, snapshot)
+            if exact is not None:
+                results[i] = (None, exact)
+            else:
+                dense.append(i)
+        
+        if dense:
+            embeddings = self._embed_queries([items[i][0] for i in dense])
+            pool = self._pool_size(max(items[i][1] for i in dense), snapshot)
+            _, positions, chunk_ids = self.index_service.search_passages(embeddings, pool,
+                                                                         snapshot=snapshot)
+            for row, i in enumerate(dense):
+                query_text, top_k = items[i]
+                results[i] = (embeddings[row:row + 1],
+                              self._hybrid_results(query_text, positions[row], chunk_ids[row],
+                                                   top_k, snapshot))
+        return results
+    
+    def _embed_queries(self, query_texts: List[str]) -> np.ndarray:
+        """
+        Genera los embeddings normalizados (L2) de varias consultas, forma (n, dimensión).
         
-        # Recuperar productos
+        Usa la caché de embeddings compartida: sólo se vectorizan las consultas nuevas.
+        """
+        return self.index_service.embed_queries(query_texts)
+    
+    def seed_query_embeddings(self, query_texts: List[str]) -> int:
+        """
+        Precalcula los embeddings de consultas conocidas (ej: `rag_query` de la base
+        de conocimiento) para que nunca paguen una pasada del modelo.
+        
+        Returns:
+            Cantidad de consultas precargadas
+        """
+        count = self.index_service.seed_queries(query_texts)
+        print(f"  Embeddings de consultas precargados: {count}")
+        return count
+    
+    def _embed_query(self, query_text: str) -> np.ndarray:
+        """Genera el embedding normalizado (L2) de una consulta, forma (1, dimensión)"""
+        return self._embed_queries([query_text])
+    
+    def _pool_size(self, top_k: int, snapshot: IndexSnapshot) -> int:
+        """Candidatos que aporta cada ranking a la fusión"""
+        return min(len(snapshot.products), max(top_k * HYBRID_POOL_FACTOR, HYBRID_POOL_MIN))
+    
+    def _exact_model_results(self, query_text: str, top_k: int,
+                             snapshot: IndexSnapshot) -> Optional[List[Dict]]:
+        """
+        Camino rápido: la consulta es un nombre de modelo del catálogo ("Diva", "Broen Plus 700").
+        
+        Returns:
+            Productos (los del modelo primero, luego los léxicos) o None si no coincide ningún modelo
+        """
+        positions = self.index_service.match_model(query_text, snapshot)
+        if not positions:
+            return None
+        lexical = [p for p, _ in self.index_service.lexical_search(
+            query_text, self._pool_size(top_k, snapshot), snapshot)]
+        ranked = positions + [p for p in lexical if p not in positions]
+        return self._collect_results(reciprocal_rank_fusion([positions, ranked])[:top_k], snapshot)
+    
+    def _hybrid_results(self, query_text: str, dense_positions: np.ndarray,
+                        chunk_ids: np.ndarray, top_k: int, snapshot: IndexSnapshot) -> List[Dict]:
+        """
+        Fusiona con RRF el ranking vectorial (ya calculado) y el ranking BM25 de una consulta.
+        
+        Los productos que vinieron por un pasaje (característica, ventaja,
+        especificación) lo llevan en 'matched_passage' para poder citarlo.
+        """
+        dense, passages = [], {}
+        for position, chunk_id in zip(dense_positions, chunk_ids):
+            if 0 <= position < len(snapshot.products):
+                dense.append(int(position))
+                chunk = self.index_service.passage(int(chunk_id), snapshot)
+                if chunk and chunk['kind'] != 'summary':
+                    passages[int(position)] = chunk['passage']
+        lexical = [p for p, _ in self.index_service.lexical_search(
+            query_text, len(dense) or top_k, snapshot)]
+        return self._collect_results(reciprocal_rank_fusion([dense, lexical])[:top_k], snapshot,
+                                     passages)
+    
+    def _collect_results(self, ranked: List[tuple], snapshot: IndexSnapshot,
+                         passages: Optional[Dict[int, str]] = None) -> List[Dict]:
+        """Recupera los productos de una lista de (posición, puntaje fusionado) del snapshot dado"""
         results = []
-        for idx, score in zip(indices[0], distances[0]):
-            if idx < len(self.products):
-                product = self.products[idx].copy()
+        for idx, score in ranked:
+            product = self.index_service.get(idx, snapshot)
+            if product is not None:
+                product = product.copy()
                 product['relevance_score'] = float(score)
+                if passages and idx in passages:
+                    product['matched_passage'] = passages[idx]
                 results.append(product)
         
         return results
@@ -219,10 +368,72 @@ class RAGEngineV2:
             'families': list(set([p.get('family', '') for p in products])),
             'avg_power': np.mean([p.get('power_w', 0) for p in products if p.get('power_w', 0) > 0])
         }
+    
+    async def get_context(self, query: str, filters: Optional[Dict] = None) -> Dict[str, Any]:
+        """Versión asíncrona de `build_context` (usada por el enriquecimiento del experto)"""
+        return self.build_context(query, filters)
+    
+    def build_context(self, query: str, filters: Optional[Dict] = None, top_k: int = 3) -> Dict[str, Any]:
+        """
+        Arma el contexto de enriquecimiento de un nodo del sistema experto
+        
+        Args:
+            query: Consulta del nodo (`rag_query` o `pregunta`)
+            filters: Campo → valor que deben contener los productos (ej: {'family': 'Calderas'})
+            top_k: Número de productos a incluir
+            
+        Returns:
+            Diccionario con productos y un resumen de una línea ('summary')
+        """
+        # Se recuperan más candidatos para que el filtro no deje la lista vacía
+        candidates = self.search_products(query, top_k=top_k * 4 if filters else top_k)
+        products = candidates
+        for field, value in (filters or {}).items():
+            value = str(value).lower()
+            products = [p for p in products if value in str(p.get(field, '')).lower()]
+        # Si el filtrado eliminó todos los productos, devolver los originales
+        products = (products or candidates)[:top_k]
+        
+        summary = ''
+        if products:
+            names = ", ".join(
+                f"{p.get('model', 'N/A')} ({p.get('family', '')})" if p.get('family') else p.get('model', 'N/A')
+                for p in products
+            )
+            summary = f"Productos relacionados: {names}."
+        
+        return {
+            'summary': summary,
+            'products': products,
+            'sources': [p.get('model') for p in products]
+        }
+
+# Instancia global (se crea en el primer uso, ver app/providers.py)
+_rag_engine: Optional[RAGEngineV2] = None
+_rag_engine_loaded = False
+_rag_engine_lock = threading.Lock()
+
+def get_rag_engine() -> Optional[RAGEngineV2]:
+    """
+    Devuelve la instancia global del motor RAG, creándola la primera vez.
+    
+    Returns:
+        Motor RAG o None si no se pudo inicializar (no se reintenta)
+    """
+    global _rag_engine, _rag_engine_loaded
+    if not _rag_engine_loaded:
+        with _rag_engine_lock:
+            if not _rag_engine_loaded:
+                try:
+                    _rag_engine = RAGEngineV2()
+                except Exception as e:
+                    print(f"Error inicializando RAG Engine V2: {e}")
+                    _rag_engine = None
+                _rag_engine_loaded = True
+    return _rag_engine
 
-# Instancia global (se inicializa cuando se importa)
-try:
-    rag_engine_v2 = RAGEngineV2()
-except Exception as e:
-    print(f"Error inicializando RAG Engine V2: {e}")
-    rag_engine_v2 = None
+def __getattr__(name: str):
+    # Compatibilidad: `from rag_engine_v2 import rag_engine_v2` sigue funcionando
+    if name == 'rag_engine_v2':
+        return get_rag_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
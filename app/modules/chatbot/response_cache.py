@@ -0,0 +1,226 @@
+"""
+response_cache.py - Caché de respuestas del LLM
+
+Muchas consultas son casi idénticas ("tengo frío", "Tengo frio!") y, con el
+mismo set de productos recuperados, generan un prompt idéntico. Esta caché
+guarda la respuesta ya post-procesada bajo un hash de:
+    pregunta normalizada + modelo + opciones de generación + prompt de sistema
+    + bloque de productos del prompt (modelos, descripciones, pasajes, en orden)
+
+Una respuesta cacheada cuesta una búsqueda en un dict en lugar de segundos de
+inferencia. Opcionalmente se persiste en un archivo SQLite local, de modo que
+sobrevive a reinicios y se comparte entre workers.
+
+Configuración por variables de entorno:
+    SOLDASUR_LLM_CACHE          "0" para desactivar la caché (activada por defecto)
+    SOLDASUR_LLM_CACHE_SIZE     Máximo de respuestas en memoria (2048)
+    SOLDASUR_LLM_CACHE_TTL      Segundos de validez de una respuesta (86400)
+    SOLDASUR_LLM_CACHE_DB       Archivo SQLite para persistir (vacío = sólo memoria)
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from app.cache import LRUCache
+
+DEFAULT_CACHE_SIZE = 2048
+DEFAULT_CACHE_TTL = 24 * 60 * 60
+
+_PUNCTUATION = re.compile(r"[¿?¡!.,;:\"'()]+")
+
+
+def normalize_question(question: str) -> str:
+    """
+    Normaliza una pregunta para compararla: minúsculas, sin tildes,
+    sin signos de puntuación y con los espacios colapsados.
+    """
+    text = unicodedata.normalize('NFKD', question or "").lower()
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = _PUNCTUATION.sub(" ", text)
+    return " ".join(text.split())
+
+
+def response_cache_key(question: str, model: str, options: Dict[str, Any],
+                       context: str = "",
+                       system_prompt: str = "") -> str:
+    """
+    Calcula la clave de caché de una generación.
+
+    Args:
+        question: Pregunta del usuario
+        model: Modelo de Ollama
+        options: Opciones de generación
+        context: Bloque del prompt con los productos (si cambia una descripción o
+            el pasaje recuperado, cambia la clave)
+        system_prompt: Prompt de sistema (cambiarlo invalida las respuestas guardadas)
+
+    Returns:
+        Hash SHA-256 en hexadecimal
+    """
+    payload = {
+        'question': normalize_question(question),
+        'model': model,
+        'options': options,
+        'context': hashlib.sha256(context.encode('utf-8')).hexdigest(),
+        'system': hashlib.sha256(system_prompt.encode('utf-8')).hexdigest(),
+    }
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    Caché de respuestas LRU + TTL en memoria, con persistencia opcional en SQLite.
+
+    Las lecturas buscan primero en memoria; si falla y hay archivo, en SQLite
+    (y la respuesta encontrada se promueve a memoria).
+    """
+
+    def __init__(self, max_entries: Optional[int] = DEFAULT_CACHE_SIZE,
+                 ttl: Optional[float] = DEFAULT_CACHE_TTL,
+                 path: Optional[str] = None,
+                 clock: Callable[[], float] = time.time):
+        """
+        Args:
+            max_entries: Máximo de respuestas (en memoria y en el archivo)
+            ttl: Segundos de validez de una respuesta desde que se generó
+            path: Archivo SQLite para persistir (None = sólo memoria)
+            clock: Reloj de pared (inyectable para pruebas)
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = str(path) if path else None
+        self.clock = clock
+        self._memory = LRUCache(max_entries=max_entries)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if self.path:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            with self._connection() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS responses ("
+                    " key TEXT PRIMARY KEY, answer TEXT NOT NULL, created REAL NOT NULL)"
+                )
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS responses_created ON responses(created)"
+                )
+
+    @classmethod
+    def from_env(cls) -> Optional["ResponseCache"]:
+        """Crea la caché configurada por variables de entorno (None si está desactivada)"""
+        if os.getenv('SOLDASUR_LLM_CACHE', '1').lower() in ('0', 'false', 'no', 'off'):
+            return None
+        size = os.getenv('SOLDASUR_LLM_CACHE_SIZE')
+        ttl = os.getenv('SOLDASUR_LLM_CACHE_TTL')
+        return cls(
+            max_entries=int(size) if size else DEFAULT_CACHE_SIZE,
+            ttl=float(ttl) if ttl else DEFAULT_CACHE_TTL,
+            path=os.getenv('SOLDASUR_LLM_CACHE_DB') or None,
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        """Conexión propia del hilo actual"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl is not None and self.clock() - created > self.ttl
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Busca una respuesta.
+
+        Returns:
+            Respuesta cacheada o None si no existe o venció
+        """
+        entry = self._memory.get(key)
+        if entry is not None:
+            answer, created = entry
+            if not self._expired(created):
+                with self._lock:
+                    self.hits += 1
+                return answer
+            self._memory.pop(key)
+
+        if self.path:
+            row = self._connection().execute(
+                "SELECT answer, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and not self._expired(row[1]):
+                self._memory.put(key, (row[0], row[1]))
+                with self._lock:
+                    self.hits += 1
+                    self.disk_hits += 1
+                return row[0]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, answer: str) -> None:
+        """Guarda una respuesta ya post-procesada"""
+        created = self.clock()
+        self._memory.put(key, (answer, created))
+        if not self.path:
+            return
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, answer, created) VALUES (?, ?, ?)",
+                (key, answer, created),
+            )
+            if self.ttl is not None:
+                conn.execute("DELETE FROM responses WHERE created < ?", (created - self.ttl,))
+            if self.max_entries is not None:
+                conn.execute(
+                    "DELETE FROM responses WHERE key NOT IN "
+                    "(SELECT key FROM responses ORDER BY created DESC LIMIT ?)",
+                    (self.max_entries,),
+                )
+
+    def clear(self) -> None:
+        """Descarta todas las respuestas (ej: tras actualizar el catálogo)"""
+        self._memory.clear()
+        if self.path:
+            conn = self._connection()
+            with conn:
+                conn.execute("DELETE FROM responses")
+
+    def __len__(self) -> int:
+        return len(self._memory)
+
+    def stats(self) -> Dict[str, Any]:
+        """Métricas de aciertos y fallos"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                'entries': len(self._memory),
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self._memory.evictions,
+                'persistent': self.path is not None,
+            }
+        if self.path:
+            stats['disk_entries'] = self._connection().execute(
+                "SELECT COUNT(*) FROM responses"
+            ).fetchone()[0]
+        return stats
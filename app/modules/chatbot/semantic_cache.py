@@ -0,0 +1,166 @@
+"""
+semantic_cache.py - Caché semántica de respuestas del RAG
+
+Guarda (embedding de la consulta → respuesta + productos) en un índice FAISS
+chico. Una consulta nueva cuyo coseno con una ya respondida supera el umbral
+reutiliza esa respuesta sin llamar al LLM, de modo que las paráfrasis
+("tengo frío en el living" / "en el living hace frío") también aciertan.
+
+Configuración por variables de entorno:
+    SOLDASUR_SEMANTIC_CACHE             "0" para desactivarla (activada por defecto)
+    SOLDASUR_SEMANTIC_CACHE_THRESHOLD   Coseno mínimo para reutilizar (0.92)
+    SOLDASUR_SEMANTIC_CACHE_SIZE        Máximo de respuestas guardadas (512)
+    SOLDASUR_SEMANTIC_CACHE_TTL         Segundos sin uso hasta vencer (3600)
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import faiss
+import numpy as np
+
+DEFAULT_THRESHOLD = 0.92
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_TTL = 60 * 60
+
+
+class SemanticCache:
+    """
+    Caché por similitud de embeddings, con desalojo LRU + TTL deslizante.
+
+    Los embeddings deben venir normalizados (L2), de modo que el producto
+    interno del índice sea la similitud coseno.
+    """
+
+    def __init__(self, dimension: int, threshold: float = DEFAULT_THRESHOLD,
+                 max_entries: int = DEFAULT_MAX_ENTRIES,
+                 ttl: Optional[float] = DEFAULT_TTL,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            dimension: Dimensión de los embeddings
+            threshold: Similitud coseno mínima para considerar un acierto
+            max_entries: Máximo de respuestas guardadas
+            ttl: Segundos sin uso hasta que una respuesta vence (None = no vence)
+            clock: Reloj monotónico (inyectable para pruebas)
+        """
+        self.dimension = dimension
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+        # id → (valor, último acceso), de la menos a la más recientemente usada
+        self._entries: "OrderedDict[int, Tuple[Any, float]]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @classmethod
+    def from_env(cls, dimension: int) -> Optional["SemanticCache"]:
+        """Crea la caché configurada por variables de entorno (None si está desactivada)"""
+        if os.getenv('SOLDASUR_SEMANTIC_CACHE', '1').lower() in ('0', 'false', 'no', 'off'):
+            return None
+        threshold = os.getenv('SOLDASUR_SEMANTIC_CACHE_THRESHOLD')
+        size = os.getenv('SOLDASUR_SEMANTIC_CACHE_SIZE')
+        ttl = os.getenv('SOLDASUR_SEMANTIC_CACHE_TTL')
+        return cls(
+            dimension,
+            threshold=float(threshold) if threshold else DEFAULT_THRESHOLD,
+            max_entries=int(size) if size else DEFAULT_MAX_ENTRIES,
+            ttl=float(ttl) if ttl else DEFAULT_TTL,
+        )
+
+    def _expired(self, last_access: float, now: float) -> bool:
+        return self.ttl is not None and now - last_access > self.ttl
+
+    def _remove(self, ids) -> None:
+        for entry_id in ids:
+            del self._entries[entry_id]
+        self.index.remove_ids(np.asarray(ids, dtype='int64'))
+
+    def _purge_expired(self, now: float) -> None:
+        if self.ttl is None:
+            return
+        expired = []
+        for entry_id, (_, last_access) in self._entries.items():
+            if not self._expired(last_access, now):
+                break
+            expired.append(entry_id)
+        if expired:
+            self._remove(expired)
+            self.expirations += len(expired)
+
+    def lookup(self, embedding: np.ndarray) -> Optional[Any]:
+        """
+        Busca una respuesta guardada para una consulta similar.
+
+        Args:
+            embedding: Embedding normalizado de la consulta, forma (1, dimension)
+
+        Returns:
+            Valor guardado o None si ninguna consulta supera el umbral
+        """
+        with self._lock:
+            now = self.clock()
+            self._purge_expired(now)
+            if not self._entries:
+                self.misses += 1
+                return None
+            scores, ids = self.index.search(embedding, 1)
+            entry_id, score = int(ids[0][0]), float(scores[0][0])
+            if entry_id < 0 or score < self.threshold:
+                self.misses += 1
+                return None
+            value = self._entries[entry_id][0]
+            self._entries[entry_id] = (value, now)
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            return value
+
+    def put(self, embedding: np.ndarray, value: Any) -> None:
+        """
+        Guarda una respuesta asociada al embedding de su consulta.
+
+        Args:
+            embedding: Embedding normalizado de la consulta, forma (1, dimension)
+            value: Respuesta a reutilizar
+        """
+        with self._lock:
+            now = self.clock()
+            self._purge_expired(now)
+            entry_id = self._next_id
+            self._next_id += 1
+            self.index.add_with_ids(embedding, np.asarray([entry_id], dtype='int64'))
+            self._entries[entry_id] = (value, now)
+            excess = len(self._entries) - self.max_entries
+            if excess > 0:
+                self._remove(list(self._entries)[:excess])
+                self.evictions += excess
+
+    def clear(self) -> None:
+        """Descarta todas las respuestas (ej: al recargar el catálogo)"""
+        with self._lock:
+            self._entries.clear()
+            self.index.reset()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de uso de la caché"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'threshold': self.threshold,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
@@ -0,0 +1,163 @@
+"""
+streaming_ingest.py - Lectura por lotes de CSV de productos para la ingesta
+
+Los feeds de proveedores pueden tener cientos de miles de filas: leer el CSV
+entero y armar los textos fila por fila no escala. `csv_batches` lee el CSV
+en bloques de `rows` filas (`pd.read_csv(chunksize=...)`) y arma el texto de
+resumen de cada producto con operaciones vectorizadas de pandas
+(`summary_texts`, idéntico a `chunking.product_to_text`). Sólo las filas que
+traen pasajes (características, ventajas) pasan por `product_chunks`.
+
+Cada lote (productos + fragmentos) lo consume `ProductIndexService.sync_stream`,
+que vectoriza en un hilo aparte mientras se lee el lote siguiente y agrega
+cada lote al índice, a SQLite y al snapshot columnar. `PipelineStats` mide
+tiempo y throughput por etapa.
+"""
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.modules.chatbot.chunking import field_value, product_chunks
+
+DEFAULT_CHUNK_ROWS = 5000     # filas de CSV por lote
+DEFAULT_ENCODE_BATCH = 256    # textos por llamada al modelo
+
+PASSAGE_COLUMNS = ('technical_features', 'advantages', 'specifications')
+
+
+class PipelineStats:
+    """Tiempo acumulado y elementos procesados por etapa (seguro entre hilos)"""
+
+    def __init__(self):
+        self._stages: Dict[str, List[float]] = {}   # etapa → [segundos, elementos]
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+
+    def add(self, name: str, seconds: float, items: int) -> None:
+        with self._lock:
+            totals = self._stages.setdefault(name, [0.0, 0])
+            totals[0] += seconds
+            totals[1] += items
+
+    @contextmanager
+    def stage(self, name: str, items: int):
+        """Mide el bloque `with` como parte de la etapa `name`"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start, items)
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        """{etapa: {'seconds', 'items', 'per_second'}} y el total transcurrido"""
+        with self._lock:
+            report = {
+                name: {'seconds': round(seconds, 3), 'items': items,
+                       'per_second': round(items / seconds, 1) if seconds else 0.0}
+                for name, (seconds, items) in self._stages.items()
+            }
+        report['total'] = {'seconds': round(time.perf_counter() - self._start, 3)}
+        return report
+
+
+def frame_records(df) -> List[Dict[str, Any]]:
+    """Filas de un DataFrame como diccionarios (NaN → None)"""
+    return [{k: (None if isinstance(v, float) and math.isnan(v) else v) for k, v in r.items()}
+            for r in df.to_dict(orient="records")]
+
+
+def _field(df, key: str):
+    """Columna con el criterio de `field_value` (vacío → variante `_en`); "" si falta"""
+    import pandas as pd
+    empty = pd.Series("", index=df.index, dtype=object)
+    value = df[key].astype(object) if key in df else empty
+    if f"{key}_en" in df:
+        missing = value.isna() | (value == "")
+        value = value.where(~missing, df[f"{key}_en"].astype(object))
+    # `field_value(...) or ''`: nulos y valores falsos se escriben vacíos
+    falsy = value.isna() | (value == "") | (value == 0)
+    return value.where(~falsy, "").astype(str)
+
+
+def _number(df, key: str):
+    """Valor formateado como en `_format_number` y máscara de "tiene dato distinto de 0" """
+    import pandas as pd
+    if key not in df:
+        return pd.Series("", index=df.index), pd.Series(False, index=df.index)
+    number = pd.to_numeric(df[key], errors="coerce").astype(float)
+    present = number.notna() & (number != 0)
+    integer = present & (number % 1 == 0)
+    text = number.astype(str)
+    text[integer] = number[integer].astype('int64').astype(str)
+    return text, present
+
+
+def summary_texts(df) -> List[str]:
+    """
+    Texto de resumen de cada fila, vectorizado (igual a `product_to_text` de la fila).
+    """
+    text = ("Producto: " + _field(df, 'model') + " Familia: " + _field(df, 'family')
+            + " Tipo: " + _field(df, 'type'))
+    category, subcategory = _field(df, 'category'), _field(df, 'subcategory')
+    both = (category != "") & (subcategory != "")
+    joined = (category + subcategory).where(~both, category + " / " + subcategory)
+    text = text.where(joined == "", text + " Categoría: " + joined)
+    text = text + " Descripción: " + _field(df, 'description')
+    for key, label, unit in (('power_w', "Potencia", "W"), ('liters', "Capacidad", "litros"),
+                             ('max_pressure_bar', "Presión máxima", "bar")):
+        value, present = _number(df, key)
+        text = text.where(~present, text + f" {label}: " + value + f" {unit}")
+    return text.tolist()
+
+
+def frame_chunks(df, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Fragmentos de un lote, en el orden de `chunk_catalog` (`product` = posición en el lote).
+    """
+    summaries = summary_texts(df)
+    with_passages = set()
+    for column in PASSAGE_COLUMNS:
+        if column in df:
+            with_passages.update(i for i, v in enumerate(df[column].tolist())
+                                 if v is not None and not (isinstance(v, float) and math.isnan(v))
+                                 and str(v).strip())
+    chunks = []
+    for position, (product, summary) in enumerate(zip(records, summaries)):
+        if position in with_passages:
+            chunks.extend(dict(chunk, product=position) for chunk in product_chunks(product))
+        else:
+            chunks.append({'kind': 'summary', 'passage': field_value(product, 'description') or '',
+                           'text': summary, 'product': position})
+    return chunks
+
+
+def csv_batches(path, rows: int = DEFAULT_CHUNK_ROWS, stats: Optional[PipelineStats] = None
+                ) -> Iterator[Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]]:
+    """
+    Lee un CSV de productos por lotes.
+
+    Args:
+        path: Ruta del CSV (una fila por producto)
+        rows: Filas por lote
+        stats: Acumula las etapas "parse" y "texts"
+
+    Yields:
+        (productos del lote, fragmentos del lote)
+    """
+    import pandas as pd
+    stats = stats or PipelineStats()
+    with pd.read_csv(path, chunksize=rows) as reader:
+        while True:
+            start = time.perf_counter()
+            try:
+                df = next(reader)
+            except StopIteration:
+                return
+            stats.add("parse", time.perf_counter() - start, len(df))
+            with stats.stage("texts", len(df)):
+                records = frame_records(df)
+                chunks = frame_chunks(df, records)
+            yield records, chunks
@@ -1,10 +1,12 @@
 from typing import Dict, Any, List, Optional
-import json
 from math import ceil
 from bisect import bisect_left
 from pathlib import Path
 from .models import RADIATOR_MODELS
 from .product_loader import get_product_loader
+from .knowledge_base import KnowledgeBase, DEFAULT_MAX_STEPS, TraversalError
+from .expressions import compile_action
+from .templates import TemplateRenderer
 
 
 class ExpertEngine:
@@ -13,28 +15,81 @@ class ExpertEngine:
     Maneja el flujo conversacional guiado basado en la base de conocimiento.
     """
     
-    def __init__(self, knowledge_base_path: str = "app/peisa_advisor_knowledge_base.json"):
+    def __init__(self, knowledge_base_path: str = "app/peisa_advisor_knowledge_base.json",
+                 max_steps: int = DEFAULT_MAX_STEPS):
         """
         Inicializa el motor experto.
         
         Args:
             knowledge_base_path: Ruta al archivo JSON de la base de conocimiento
+            max_steps: Máximo de nodos de cálculo encadenados por salto
         """
-        self.knowledge_base = []
+        self.knowledge_base = KnowledgeBase([], max_steps=max_steps)
         self.rag_engine = None  # Se inyectará después
         self.rag_enrichment_enabled = True
+        # Enriquecimiento RAG precalculado: id de nodo → resumen
+        self.enrichment_table: Dict[str, str] = {}
         self.product_loader = get_product_loader()  # Cargador de productos dinámico
+        self.template_renderer = TemplateRenderer()  # Plantillas compiladas por nodo
         
-        # Cargar base de conocimiento
+        # Cargar y compilar base de conocimiento (índice por ID, aristas validadas,
+        # acciones compiladas: una expresión inválida falla aquí y no por usuario)
         try:
-            with open(knowledge_base_path, "r", encoding="utf-8") as f:
-                self.knowledge_base = json.load(f)
+            self.knowledge_base = KnowledgeBase.from_file(
+                knowledge_base_path, EXPRESSION_FUNCTIONS, max_steps
+            )
         except FileNotFoundError:
             print(f"Advertencia: No se encontró {knowledge_base_path}")
     
-    def set_rag_engine(self, rag_engine):
-        """Inyecta el motor RAG para enriquecimiento"""
+    def set_rag_engine(self, rag_engine, seed_embeddings: bool = True):
+        """
+        Inyecta el motor RAG para enriquecimiento.
+        
+        Args:
+            rag_engine: Motor RAG
+            seed_embeddings: Precalcular los embeddings de las consultas de la
+                base de conocimiento, para que el enriquecimiento no vectorice
+        """
         self.rag_engine = rag_engine
+        if rag_engine is None:
+            self.enrichment_table = {}
+            return
+        if seed_embeddings:
+            rag_engine.seed_query_embeddings(self.knowledge_base.query_texts())
+        # La tabla de enriquecimiento depende del catálogo: recalcularla en cada recarga
+        rag_engine.add_catalog_listener(self.refresh_enrichment)
+        self.refresh_enrichment()
+    
+    def refresh_enrichment(self) -> int:
+        """
+        Precalcula el enriquecimiento RAG de todos los nodos `enrich_with_rag`.
+        
+        La consulta (`rag_query` o `pregunta`) y los filtros (`rag_filters`) de
+        cada nodo son fijos, así que el resultado sólo cambia con el catálogo.
+        Se llama al conectar el RAG y después de cada recarga del catálogo.
+        
+        Returns:
+            Cantidad de nodos precalculados
+        """
+        if not self.rag_engine:
+            self.enrichment_table = {}
+            return 0
+        
+        table = {}
+        for node in self.knowledge_base:
+            if not node.get('enrich_with_rag'):
+                continue
+            try:
+                result = self.rag_engine.build_context(
+                    self._rag_query(node), node.get('rag_filters', {})
+                )
+                table[node['id']] = result.get('summary', '')
+            except Exception as e:
+                print(f"Error precalculando enriquecimiento de '{node['id']}': {e}")
+        # Reemplazo atómico: las conversaciones en curso ven la tabla vieja o la nueva
+        self.enrichment_table = table
+        print(f"Enriquecimiento RAG precalculado para {len(table)} nodos")
+        return len(table)
     
     def get_node_by_id(self, node_id: str) -> Optional[Dict[str, Any]]:
         """
@@ -46,10 +101,7 @@ class ExpertEngine:
         Returns:
             Diccionario con los datos del nodo o None si no se encuentra
         """
-        for node in self.knowledge_base:
-            if node.get('id') == node_id:
-                return node
-        return None
+        return self.knowledge_base.get(node_id)
     
     async def process(self, conversation_id: str, expert_state: Dict[str, Any],
                      option_index: Optional[int] = None,
@@ -137,19 +189,28 @@ class ExpertEngine:
                                expert_state: Dict[str, Any]) -> Dict[str, Any]:
         """Obtiene el mensaje a mostrar para el nodo actual"""
         
-        # Nodo de cálculo: ejecutar y avanzar automáticamente
+        # Nodos de cálculo: ejecutar la cadena en un bucle y avanzar automáticamente
         if node.get('tipo') == 'calculo':
-            self._perform_calculation(node, context)
-            expert_state['current_node'] = node['siguiente']
-            next_node = self.get_node_by_id(node['siguiente'])
-            return await self._get_node_message(next_node, context, expert_state)
+            try:
+                node = self.knowledge_base.advance(node, context)
+            except TraversalError as e:
+                return {
+                    'error': str(e),
+                    'node_id': expert_state.get('current_node')
+                }
+            if not node:
+                return {
+                    'error': 'Nodo no encontrado',
+                    'node_id': expert_state.get('current_node')
+                }
+            expert_state['current_node'] = node['id']
         
         # Nodo con pregunta
-        elif 'pregunta' in node:
+        if 'pregunta' in node:
             response = {
                 'type': 'question',
                 'node_id': node['id'],
-                'text': self._replace_variables(node['pregunta'], context),
+                'text': self._replace_variables(node['pregunta'], context, (node['id'], 'pregunta')),
                 'variables': context
             }
             
@@ -171,7 +232,10 @@ class ExpertEngine:
             
             # Enriquecimiento RAG si está habilitado
             if self.rag_enrichment_enabled and node.get('enrich_with_rag') and self.rag_engine:
-                enrichment = await self._enrich_with_rag(node, context)
+                # Precalculado por nodo; sólo se consulta al RAG si falta en la tabla
+                enrichment = self.enrichment_table.get(node['id'])
+                if enrichment is None:
+                    enrichment = await self._enrich_with_rag(node, context)
                 if enrichment:
                     response['additional_info'] = enrichment
             
@@ -182,7 +246,7 @@ class ExpertEngine:
             response = {
                 'type': 'response',
                 'node_id': node['id'],
-                'text': self._replace_variables(node['texto'], context),
+                'text': self._replace_variables(node['texto'], context, (node['id'], 'texto')),
                 'variables': context
             }
             
@@ -231,12 +295,9 @@ class ExpertEngine:
             return None
         
         try:
-            # Construir query para el RAG basado en el nodo
-            query = node.get('rag_query', node.get('pregunta', ''))
-            
             # Obtener información relevante del RAG
             rag_result = await self.rag_engine.get_context(
-                query=query,
+                query=self._rag_query(node),
                 filters=node.get('rag_filters', {})
             )
             
@@ -246,6 +307,11 @@ class ExpertEngine:
             print(f"Error en enriquecimiento RAG: {e}")
             return None
     
+    @staticmethod
+    def _rag_query(node: Dict[str, Any]) -> str:
+        """Consulta para el RAG basada en el nodo"""
+        return node.get('rag_query', node.get('pregunta', ''))
+    
     async def suggest_next_step(self, context: Dict[str, Any]) -> Dict[str, Any]:
         """
         Sugiere el siguiente paso basado en el contexto actual.
@@ -285,7 +351,8 @@ class ExpertEngine:
                 'options': ['Sí, continuar', 'No, quiero modificar algo']
             }
     
-    def _replace_variables(self, text: str, context: Dict[str, Any]) -> str:
+    def _replace_variables(self, text: str, context: Dict[str, Any],
+                           key: Optional[Any] = None) -> str:
         """
         Reemplaza variables en el texto usando el contexto.
         Soporta tanto {{variable}} como templates Jinja2.
@@ -293,26 +360,12 @@ class ExpertEngine:
         Args:
             text: Texto con variables
             context: Contexto de variables
+            key: Clave de la plantilla cacheada (ej: (id_nodo, 'texto'))
             
         Returns:
             Texto con variables reemplazadas
         """
-        if not isinstance(text, str):
-            return text
-        
-        # Reemplazo simple de {{variable}}
-        for key, val in context.items():
-            if isinstance(val, (int, float, str)):
-                text = text.replace("{{"+key+"}}", str(val))
-        
-        # Intentar con Jinja2 para expresiones más complejas
-        try:
-            from jinja2 import Template
-            template = Template(text)
-            return template.render(**context)
-        except Exception as e:
-            # Si falla Jinja2, devolver el texto con reemplazo simple
-            return text
+        return self.template_renderer.render(text, context, key)
     
     def _perform_calculation(self, node: Dict[str, Any], context: Dict[str, Any]) -> None:
         """
@@ -322,47 +375,19 @@ class ExpertEngine:
             node: Nodo de tipo 'calculo'
             context: Contexto donde se guardan los resultados
         """
-        # Agregar parámetros al contexto
-        params = node.get("parametros", {})
-        for key, val in params.items():
-            context[key] = val
-        
-        # Ejecutar acciones (expresiones matemáticas)
-        for action in node.get("acciones", []):
-            self._exec_expression(action, context)
+        # Parámetros + acciones precompiladas al cargar la KB
+        self.knowledge_base.run_calculation(node, context)
     
     def _exec_expression(self, expr: str, context: Dict[str, Any]) -> None:
         """
-        Ejecuta una expresión matemática y guarda el resultado en el contexto.
+        Ejecuta una expresión suelta (fuera de la KB) y guarda el resultado en el contexto.
         
         Args:
             expr: Expresión a evaluar (ej: "carga_termica = superficie * potencia_m2")
             context: Contexto donde se guarda el resultado
         """
         try:
-            # Funciones especiales disponibles en expresiones
-            local_context = {
-                'filter_radiators': filter_radiators,
-                'format_radiator_recommendations': format_radiator_recommendations,
-                'recommend_boiler': recommend_boiler,
-                'recommend_floor_heating_kit': recommend_floor_heating_kit,
-                'recommend_radiator_from_catalog': recommend_radiator_from_catalog,
-                'recommend_towel_rack_from_catalog': recommend_towel_rack_from_catalog,
-                'format_towel_rack_recommendation': format_towel_rack_recommendation,
-                'load_product_catalog': load_product_catalog,
-                'ceil': ceil,
-                'context': context
-            }
-            
-            # Dividir la expresión en variable y valor
-            var, val_expr = [x.strip() for x in expr.split("=", 1)]
-            
-            # Reemplazar context['variable'] por simplemente variable
-            val_expr = val_expr.replace("context['", "").replace("']", "")
-            
-            # Evaluar la expresión con las variables del contexto
-            val = eval(val_expr, {"__builtins__": None}, {**context, **local_context})
-            context[var] = val
+            compile_action(expr, EXPRESSION_FUNCTIONS)(context)
         
         except Exception as e:
             print(f"Error evaluando expresión '{expr}': {e}")
@@ -457,6 +482,41 @@ def format_radiator_recommendations(model: Dict[str, Any],
         return f"Recomendación: {model.get('model', 'Producto PEISA')}"
 
 
+def calculate_boiler(total_heat_load: float, has_hot_water: bool = False) -> Dict[str, Any]:
+    """
+    Calcula la potencia de caldera necesaria según la documentación del sistema experto
+    
+    Args:
+        total_heat_load: Carga térmica total en kcal/h
+        has_hot_water: Si requiere agua caliente sanitaria
+    
+    Returns:
+        Diccionario con potencia recomendada y tipo de caldera
+    """
+    safety_factor = 1.2
+    hot_water_extra = 5000 if has_hot_water else 0  # kcal/h adicionales para ACS
+    
+    required_power = (total_heat_load * safety_factor) + hot_water_extra
+    
+    # Redondear a potencias estándar: 18000, 24000, 30000, 35000, 45000 kcal/h
+    standard_powers = [18000, 24000, 30000, 35000, 45000]
+    
+    selected_power = standard_powers[-1]  # Por defecto la máxima
+    for power in standard_powers:
+        if power >= required_power:
+            selected_power = power
+            break
+    
+    boiler_type = "Caldera mixta (calefacción + ACS)" if has_hot_water else "Caldera estándar (solo calefacción)"
+    
+    return {
+        'potencia_requerida': required_power,
+        'potencia_recomendada': selected_power,
+        'tipo_caldera': boiler_type,
+        'factor_seguridad': safety_factor
+    }
+
+
 def load_product_catalog(catalog_path: str = "data/products_catalog.json") -> List[Dict[str, Any]]:
     """
     Carga el catálogo de productos desde products_catalog.json.
@@ -774,3 +834,18 @@ def format_towel_rack_recommendation(model: Dict[str, Any]) -> str:
     except Exception as e:
         print(f"Error formateando toallero {model}: {e}")
         return f"Recomendación: {model.get('model', 'Toallero PEISA')}"
+
+
+# Funciones auxiliares disponibles en las acciones de la KB (se enlazan al compilar)
+EXPRESSION_FUNCTIONS = {
+    'filter_radiators': filter_radiators,
+    'format_radiator_recommendations': format_radiator_recommendations,
+    'recommend_boiler': recommend_boiler,
+    'recommend_floor_heating_kit': recommend_floor_heating_kit,
+    'recommend_radiator_from_catalog': recommend_radiator_from_catalog,
+    'recommend_towel_rack_from_catalog': recommend_towel_rack_from_catalog,
+    'format_towel_rack_recommendation': format_towel_rack_recommendation,
+    'load_product_catalog': load_product_catalog,
+    'calculate_boiler': calculate_boiler,
+    'ceil': ceil,
+}
@@ -0,0 +1,111 @@
+"""
+expressions.py - Compilación de acciones de nodos de cálculo
+
+Las `acciones` de los nodos `calculo` (ej: "carga_termica = superficie * potencia_m2")
+se parsean una sola vez con `ast`, se validan contra un conjunto acotado de
+construcciones y funciones auxiliares, y se compilan a objetos de código.
+Ejecutar una acción pasa a ser una llamada barata a `eval` sobre el contexto.
+"""
+
+import ast
+from typing import Dict, Any, Callable, Mapping, Optional
+
+
+class ExpressionError(ValueError):
+    """Expresión de la base de conocimiento inválida o no permitida"""
+
+
+# Construcciones sintácticas permitidas en el lado derecho de una acción
+_ALLOWED_NODES = (
+    ast.Expression, ast.Name, ast.Load, ast.Constant,
+    ast.BinOp, ast.UnaryOp, ast.BoolOp, ast.Compare, ast.IfExp,
+    ast.Call, ast.keyword, ast.Subscript, ast.Slice, ast.Attribute,
+    ast.Tuple, ast.List, ast.Dict,
+    ast.operator, ast.unaryop, ast.boolop, ast.cmpop,
+)
+
+
+class _ContextSubscriptRewriter(ast.NodeTransformer):
+    """Reescribe context['variable'] como una referencia directa a variable"""
+
+    def visit_Subscript(self, node: ast.Subscript) -> ast.AST:
+        self.generic_visit(node)
+        if (isinstance(node.value, ast.Name) and node.value.id == 'context'
+                and isinstance(node.slice, ast.Constant)
+                and isinstance(node.slice.value, str)):
+            return ast.copy_location(ast.Name(id=node.slice.value, ctx=ast.Load()), node)
+        return node
+
+
+class CompiledAction:
+    """Acción de cálculo compilada: asigna `target` evaluando `code` sobre el contexto"""
+
+    __slots__ = ('source', 'target', 'code', 'namespace')
+
+    def __init__(self, source: str, target: str, code, namespace: Dict[str, Any]):
+        self.source = source
+        self.target = target
+        self.code = code
+        self.namespace = namespace
+
+    def __call__(self, context: Dict[str, Any]) -> None:
+        """
+        Evalúa la acción y guarda el resultado en el contexto.
+
+        Las variables se resuelven primero en el contexto y luego en las
+        funciones auxiliares enlazadas al compilar.
+        """
+        context[self.target] = eval(self.code, self.namespace, context)
+
+
+def _validate(tree: ast.AST, functions: Mapping[str, Callable], source: str) -> None:
+    """Rechaza construcciones o llamadas fuera de la lista blanca"""
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES):
+            raise ExpressionError(
+                f"Construcción no permitida ({type(node).__name__}) en '{source}'"
+            )
+        if isinstance(node, ast.Name) and (node.id == 'context' or node.id.startswith('__')):
+            raise ExpressionError(f"Referencia no permitida '{node.id}' en '{source}'")
+        if isinstance(node, ast.Attribute) and node.attr.startswith('_'):
+            raise ExpressionError(f"Atributo no permitido '{node.attr}' en '{source}'")
+        if isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.func.id not in functions:
+                raise ExpressionError(f"Llamada a función no permitida en '{source}'")
+
+
+def compile_action(source: str, functions: Optional[Mapping[str, Callable]] = None,
+                   filename: str = "<kb>") -> CompiledAction:
+    """
+    Compila una acción de la forma "variable = expresión".
+
+    Args:
+        source: Texto de la acción
+        functions: Funciones auxiliares permitidas en la expresión
+        filename: Nombre usado en los tracebacks (ej: "<kb:recomendar_modelos>")
+
+    Returns:
+        Acción compilada lista para ejecutar sobre un contexto
+
+    Raises:
+        ExpressionError: Si la acción es sintácticamente inválida o no está permitida
+    """
+    functions = dict(functions or {})
+    try:
+        module = ast.parse(source.strip(), mode='exec')
+    except SyntaxError as e:
+        raise ExpressionError(f"Expresión inválida '{source}': {e.msg}") from e
+
+    if (len(module.body) != 1 or not isinstance(module.body[0], ast.Assign)
+            or len(module.body[0].targets) != 1
+            or not isinstance(module.body[0].targets[0], ast.Name)):
+        raise ExpressionError(f"Se esperaba 'variable = expresión' en '{source}'")
+
+    assign = module.body[0]
+    expression = ast.Expression(body=_ContextSubscriptRewriter().visit(assign.value))
+    ast.fix_missing_locations(expression)
+    _validate(expression, functions, source)
+
+    namespace = {'__builtins__': {}, **functions}
+    code = compile(expression, filename, 'eval')
+    return CompiledAction(source, assign.targets[0].id, code, namespace)
@@ -0,0 +1,223 @@
+"""
+knowledge_base.py - Base de conocimiento compilada del sistema experto
+
+Este módulo carga peisa_advisor_knowledge_base.json una sola vez y lo
+compila en un grafo indexado por ID, de modo que cada salto del flujo
+conversacional cueste O(1) sin importar la cantidad de nodos.
+"""
+
+import json
+from typing import Dict, Any, List, Optional, Iterator, Tuple, Callable, Mapping
+
+from .expressions import CompiledAction, ExpressionError, compile_action
+
+
+# Máximo de nodos de cálculo encadenados que se recorren en un solo salto
+DEFAULT_MAX_STEPS = 100
+
+
+class KnowledgeBaseError(ValueError):
+    """Error de validación al compilar la base de conocimiento"""
+
+
+class TraversalError(RuntimeError):
+    """Una cadena de nodos de cálculo superó el máximo de pasos permitido"""
+
+
+class KnowledgeBase:
+    """
+    Grafo compilado de la base de conocimiento.
+
+    Mantiene:
+    - Índice hash id → nodo
+    - Aristas sucesoras precalculadas (siguiente y opciones)
+    - Validación en carga de destinos `siguiente` inexistentes
+    - Acciones de los nodos `calculo` compiladas a código
+    """
+
+    def __init__(self, nodes: List[Dict[str, Any]],
+                 functions: Optional[Mapping[str, Callable]] = None,
+                 max_steps: int = DEFAULT_MAX_STEPS):
+        """
+        Compila la lista de nodos.
+
+        Args:
+            nodes: Lista de nodos tal como aparece en el JSON
+            functions: Funciones auxiliares disponibles en las `acciones`
+            max_steps: Máximo de nodos de cálculo encadenados por salto
+
+        Raises:
+            KnowledgeBaseError: Si hay IDs duplicados, destinos inexistentes
+                o acciones inválidas
+        """
+        self.nodes = list(nodes)
+        self.functions = dict(functions or {})
+        self.max_steps = max_steps
+        self._index: Dict[str, Dict[str, Any]] = {}
+        self._successors: Dict[str, Tuple[str, ...]] = {}
+        self._actions: Dict[str, Tuple[CompiledAction, ...]] = {}
+
+        for node in self.nodes:
+            node_id = node.get('id')
+            if node_id is None:
+                raise KnowledgeBaseError(f"Nodo sin 'id': {node}")
+            if node_id in self._index:
+                raise KnowledgeBaseError(f"ID de nodo duplicado: '{node_id}'")
+            self._index[node_id] = node
+
+        for node in self.nodes:
+            self._successors[node['id']] = self._compile_edges(node)
+            if node.get('tipo') == 'calculo':
+                self._actions[node['id']] = self._compile_actions(node)
+
+        self._validate()
+
+    @classmethod
+    def from_file(cls, path: str,
+                  functions: Optional[Mapping[str, Callable]] = None,
+                  max_steps: int = DEFAULT_MAX_STEPS) -> "KnowledgeBase":
+        """
+        Carga y compila la base de conocimiento desde un archivo JSON.
+
+        Args:
+            path: Ruta al archivo JSON
+            functions: Funciones auxiliares disponibles en las `acciones`
+            max_steps: Máximo de nodos de cálculo encadenados por salto
+
+        Returns:
+            Base de conocimiento compilada
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f), functions, max_steps)
+
+    def _compile_actions(self, node: Dict[str, Any]) -> Tuple[CompiledAction, ...]:
+        """Compila las acciones de un nodo de cálculo"""
+        try:
+            return tuple(
+                compile_action(action, self.functions, filename=f"<kb:{node['id']}>")
+                for action in node.get('acciones', [])
+            )
+        except ExpressionError as e:
+            raise KnowledgeBaseError(f"Nodo '{node['id']}': {e}") from e
+
+    @staticmethod
+    def _compile_edges(node: Dict[str, Any]) -> Tuple[str, ...]:
+        """Obtiene los IDs sucesores de un nodo (sin repetir, en orden)"""
+        targets = []
+        if node.get('siguiente'):
+            targets.append(node['siguiente'])
+        for option in node.get('opciones', []):
+            if option.get('siguiente'):
+                targets.append(option['siguiente'])
+        return tuple(dict.fromkeys(targets))
+
+    def _validate(self) -> None:
+        """Verifica que todas las aristas apunten a nodos existentes"""
+        dangling = [
+            f"{node_id} → {target}"
+            for node_id, targets in self._successors.items()
+            for target in targets
+            if target not in self._index
+        ]
+        if dangling:
+            raise KnowledgeBaseError(
+                "Destinos 'siguiente' inexistentes: " + ", ".join(dangling)
+            )
+
+    def get(self, node_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Busca un nodo por su ID.
+
+        Args:
+            node_id: ID del nodo
+
+        Returns:
+            Nodo o None si no existe
+        """
+        return self._index.get(node_id)
+
+    def successors(self, node_id: str) -> Tuple[str, ...]:
+        """
+        Devuelve los IDs de los nodos alcanzables en un salto.
+
+        Args:
+            node_id: ID del nodo de origen
+
+        Returns:
+            Tupla de IDs sucesores (vacía si el nodo es terminal o no existe)
+        """
+        return self._successors.get(node_id, ())
+
+    def run_calculation(self, node: Dict[str, Any], context: Dict[str, Any]) -> None:
+        """
+        Ejecuta un nodo de cálculo: copia sus parámetros y aplica sus acciones compiladas.
+
+        Args:
+            node: Nodo de tipo 'calculo'
+            context: Contexto donde se guardan los resultados
+        """
+        context.update(node.get('parametros', {}))
+
+        for action in self._actions.get(node['id'], ()):
+            try:
+                action(context)
+            except Exception as e:
+                print(f"Error evaluando expresión '{action.source}': {e}")
+                raise
+
+    def advance(self, node: Optional[Dict[str, Any]], context: Dict[str, Any],
+                max_steps: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        Recorre iterativamente una cadena de nodos de cálculo.
+
+        Ejecuta cada nodo `calculo` y sigue su `siguiente` hasta llegar a un
+        nodo que requiere mostrarse al usuario.
+
+        Args:
+            node: Nodo de partida
+            context: Contexto donde se guardan los resultados
+            max_steps: Máximo de cálculos encadenados (por defecto `self.max_steps`)
+
+        Returns:
+            Primer nodo que no es de cálculo (o None si la cadena apunta a un nodo inexistente)
+
+        Raises:
+            TraversalError: Si la cadena supera `max_steps` (ej: un ciclo de cálculos)
+        """
+        limit = self.max_steps if max_steps is None else max_steps
+        steps = 0
+        while node is not None and node.get('tipo') == 'calculo':
+            if steps >= limit:
+                raise TraversalError(
+                    f"Se superó el máximo de {limit} cálculos encadenados en '{node['id']}'"
+                )
+            self.run_calculation(node, context)
+            node = self._index.get(node.get('siguiente'))
+            steps += 1
+        return node
+
+    def query_texts(self) -> List[str]:
+        """
+        Textos de consulta fijos de la base (`rag_query` o `pregunta` de cada nodo).
+
+        Son las consultas que usa el enriquecimiento RAG; sirven para
+        precalcular sus embeddings al arrancar.
+
+        Returns:
+            Textos sin repetir, en orden de aparición
+        """
+        texts = []
+        for node in self.nodes:
+            for field in ('rag_query', 'pregunta'):
+                if isinstance(node.get(field), str) and node[field].strip():
+                    texts.append(node[field])
+        return list(dict.fromkeys(texts))
+
+    def __contains__(self, node_id: str) -> bool:
+        return node_id in self._index
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self.nodes)
+
+    def __len__(self) -> int:
+        return len(self.nodes)
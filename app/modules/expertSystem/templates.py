@@ -0,0 +1,91 @@
+"""
+templates.py - Caché de plantillas para los textos de la base de conocimiento
+
+Los textos `pregunta`/`texto` de cada nodo se compilan una sola vez en un
+entorno Jinja2 compartido y se guardan en un LRU indexado por nodo. Los textos
+sin marcadores se devuelven tal cual, sin pasar por Jinja2.
+"""
+
+from collections import OrderedDict
+from typing import Dict, Any, Hashable, Optional, Tuple
+
+from jinja2 import Environment, Template
+
+# Delimitadores que indican que el texto necesita renderizarse
+_MARKERS = ("{{", "{%", "{#")
+
+
+def _simple_replace(text: str, context: Dict[str, Any]) -> str:
+    """Reemplazo simple de {{variable}} (respaldo si Jinja2 falla)"""
+    for key, val in context.items():
+        if isinstance(val, (int, float, str)):
+            text = text.replace("{{" + key + "}}", str(val))
+    return text
+
+
+class TemplateRenderer:
+    """
+    Renderiza textos de nodos con plantillas Jinja2 compiladas y cacheadas.
+
+    La caché es un LRU acotado; la clave suele ser (id_nodo, campo).
+    """
+
+    def __init__(self, max_templates: int = 1024):
+        """
+        Args:
+            max_templates: Cantidad máxima de plantillas compiladas en memoria
+        """
+        self.environment = Environment(autoescape=False)
+        self.max_templates = max_templates
+        self._cache: "OrderedDict[Hashable, Tuple[str, Optional[Template]]]" = OrderedDict()
+
+    def _get_template(self, key: Hashable, text: str) -> Optional[Template]:
+        """Obtiene la plantilla compilada de la caché o la compila (None si no compila)"""
+        cached = self._cache.get(key)
+        if cached is not None and cached[0] == text:
+            self._cache.move_to_end(key)
+            return cached[1]
+
+        try:
+            template = self.environment.from_string(text)
+        except Exception as e:
+            print(f"Error en template Jinja2: {e}")
+            template = None
+
+        self._cache[key] = (text, template)
+        self._cache.move_to_end(key)
+        if len(self._cache) > self.max_templates:
+            self._cache.popitem(last=False)
+        return template
+
+    def render(self, text: str, context: Dict[str, Any], key: Optional[Hashable] = None) -> str:
+        """
+        Reemplaza variables en el texto usando el contexto.
+
+        Args:
+            text: Texto con variables ({{variable}} o expresiones Jinja2)
+            context: Contexto de variables
+            key: Clave de caché (ej: (id_nodo, 'pregunta')); por defecto el propio texto
+
+        Returns:
+            Texto renderizado
+        """
+        if not isinstance(text, str) or not any(marker in text for marker in _MARKERS):
+            return text
+
+        template = self._get_template(text if key is None else key, text)
+        if template is None:
+            return _simple_replace(text, context)
+
+        try:
+            return template.render(**context)
+        except Exception as e:
+            print(f"Error en template Jinja2: {e}")
+            return _simple_replace(text, context)
+
+    def clear(self) -> None:
+        """Vacía la caché (ej: al recargar la base de conocimiento)"""
+        self._cache.clear()
+
+    def __len__(self) -> int:
+        return len(self._cache)
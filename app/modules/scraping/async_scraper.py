@@ -0,0 +1,250 @@
+# app/modules/scraping/async_scraper.py - Scraping concurrente del catálogo PEISA
+"""
+Descarga el listado de /productos y las fichas de cada producto con un único
+`httpx.AsyncClient` (conexiones keep-alive reutilizadas) en lugar de un
+`requests.get` + `time.sleep` por producto:
+
+    - concurrencia acotada (`asyncio.Semaphore`)
+    - cortesía por host: token bucket de `rate` pedidos por segundo
+    - reintentos con backoff exponencial + jitter ante errores de red, 429 y 5xx
+      (respeta `Retry-After`)
+    - cada producto se entrega al `sink` apenas se parsea su ficha
+      (ej: `CatalogWriter.add`), sin esperar al resto
+
+El parseo del HTML es el de product_scraper.py (`parse_product_listing`,
+`parse_product_detail`).
+
+Configuración por variables de entorno:
+    SOLDASUR_SCRAPER_CONCURRENCY   Pedidos simultáneos (4)
+    SOLDASUR_SCRAPER_RATE          Pedidos por segundo por host (3)
+    SOLDASUR_SCRAPER_RETRIES       Reintentos por pedido (3)
+"""
+import asyncio
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional
+
+import httpx
+
+from app.modules.scraping.product_scraper import (
+    DEFAULT_BASE_URL, HEADERS, empty_technical_data, parse_product_detail, parse_product_listing,
+)
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_RATE = 3.0        # pedidos por segundo por host
+DEFAULT_RETRIES = 3
+BACKOFF_BASE = 0.5        # segundos antes del primer reintento
+BACKOFF_MAX = 30.0
+TIMEOUT = 10.0
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+Sink = Callable[[int, Dict], None]
+
+
+class TokenBucket:
+    """Token bucket: `rate` pedidos por segundo con ráfagas de hasta `burst`"""
+
+    def __init__(self, rate: float, burst: float = 1.0):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Espera hasta tener un token y lo consume"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """Vacía el bucket para que nadie pida a este host durante `seconds` (ej: Retry-After)"""
+        # Sin actualizar `_updated`, el próximo `acquire` sumaría el tiempo anterior a la pausa
+        self._updated = time.monotonic()
+        self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+class HostRateLimiter:
+    """Un `TokenBucket` por host"""
+
+    def __init__(self, rate: float, burst: float = 1.0):
+        self.rate, self.burst = rate, burst
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    def bucket(self, url: str) -> TokenBucket:
+        host = httpx.URL(url).host
+        if host not in self._buckets:
+            self._buckets[host] = TokenBucket(self.rate, self.burst)
+        return self._buckets[host]
+
+    async def acquire(self, url: str) -> None:
+        await self.bucket(url).acquire()
+
+
+def _retry_after(response: Optional[httpx.Response]) -> Optional[float]:
+    """Segundos pedidos por el servidor en `Retry-After` (número o fecha HTTP)"""
+    value = response.headers.get('Retry-After') if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+async def fetch(client: httpx.AsyncClient, url: str, limiter: HostRateLimiter,
+                retries: int = DEFAULT_RETRIES) -> httpx.Response:
+    """
+    GET respetando el límite del host, con reintentos y backoff exponencial.
+
+    Reintenta errores de red, 429 y 5xx; otros códigos de error se lanzan
+    sin reintentar.
+
+    Raises:
+        httpx.HTTPError: Si el último intento también falla
+    """
+    for attempt in range(retries + 1):
+        await limiter.acquire(url)
+        response = None
+        try:
+            response = await client.get(url)
+            response.raise_for_status()
+            return response
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code not in RETRY_STATUS or attempt == retries:
+                raise
+        except httpx.TransportError:
+            if attempt == retries:
+                raise
+
+        delay = _retry_after(response)
+        if delay is not None:
+            delay = min(delay, BACKOFF_MAX)    # un Retry-After enorme no frena el scraping entero
+        print(f"         🔁 Reintento {attempt + 1}/{retries} de {url} "
+              f"en {delay if delay is not None else BACKOFF_BASE * 2 ** attempt:.1f}s")
+        if delay is not None:
+            # Retry-After frena a todo el host: el próximo `acquire` espera la pausa
+            limiter.bucket(url).pause(delay)
+        else:
+            await asyncio.sleep(min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0))
+
+
+def _env_number(name: str, default, cast):
+    value = os.getenv(name)
+    try:
+        return cast(value) if value else default
+    except ValueError:
+        return default
+
+
+async def scrape_products(sink: Sink, base_url: str = DEFAULT_BASE_URL,
+                          concurrency: Optional[int] = None, rate: Optional[float] = None,
+                          retries: Optional[int] = None,
+                          transport: Optional[httpx.AsyncBaseTransport] = None) -> int:
+    """
+    Recorre el listado y las fichas de producto, entregando cada producto a `sink`.
+
+    Args:
+        sink: Recibe (posición en el listado, producto) a medida que se completan
+        base_url: Sitio a recorrer
+        concurrency: Pedidos simultáneos (por defecto SOLDASUR_SCRAPER_CONCURRENCY)
+        rate: Pedidos por segundo por host (por defecto SOLDASUR_SCRAPER_RATE)
+        retries: Reintentos por pedido (por defecto SOLDASUR_SCRAPER_RETRIES)
+        transport: Transporte httpx alternativo (ej: `httpx.MockTransport`)
+
+    Returns:
+        Cantidad de productos entregados
+
+    Raises:
+        httpx.HTTPError: Si no se pudo leer el listado
+    """
+    concurrency = concurrency or _env_number('SOLDASUR_SCRAPER_CONCURRENCY', DEFAULT_CONCURRENCY, int)
+    rate = rate or _env_number('SOLDASUR_SCRAPER_RATE', DEFAULT_RATE, float)
+    if retries is None:
+        retries = _env_number('SOLDASUR_SCRAPER_RETRIES', DEFAULT_RETRIES, int)
+    base_url = base_url.rstrip('/')
+    limiter = HostRateLimiter(rate, burst=min(concurrency, rate))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(headers=HEADERS, timeout=TIMEOUT, limits=limits,
+                                 follow_redirects=True, transport=transport) as client:
+        products_url = f"{base_url}/productos"
+        print(f"  📡 Conectando a {products_url}...")
+        response = await fetch(client, products_url, limiter, retries)
+        print("  ✅ Página cargada correctamente")
+
+        products = parse_product_listing(response.content, base_url)
+        print(f"\n  📦 Procesando {len(products)} productos "
+              f"({concurrency} en paralelo, {rate:g} pedidos/s)...")
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def detail(position: int, product: Dict):
+            product_url = product.get('url')
+            if product_url:
+                async with semaphore:
+                    try:
+                        page = await fetch(client, product_url, limiter, retries)
+                        technical_data = parse_product_detail(page.content)
+                    except Exception as e:
+                        print(f"         ⚠️  Error obteniendo ficha técnica de {product_url}: {e}")
+                        technical_data = empty_technical_data()
+                product.update(technical_data)
+            return position, product
+
+        done = 0
+        for next_done in asyncio.as_completed([detail(i, p) for i, p in enumerate(products)]):
+            position, product = await next_done
+            sink(position, product)
+            done += 1
+            print(f"  ✓ [{done}/{len(products)}] {product['model']} - {product.get('category', '')}")
+
+    return done
+
+
+def run_scraper(sink: Sink, **kwargs) -> int:
+    """
+    Versión sincrónica de `scrape_products` (mismos argumentos).
+
+    Si el hilo ya tiene un event loop corriendo (ej: llamado desde FastAPI),
+    el scraping corre en un hilo aparte con su propio loop.
+
+    Returns:
+        Cantidad de productos entregados (0 si no se pudo leer el listado)
+    """
+    print("🌐 Iniciando scraping de PEISA...")
+    start = time.perf_counter()
+    try:
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            done = asyncio.run(scrape_products(sink, **kwargs))
+        else:
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                done = executor.submit(asyncio.run, scrape_products(sink, **kwargs)).result()
+    except httpx.HTTPError as e:
+        print(f"❌ Error de conexión: {e}")
+        print("⚠️  No se pudo conectar al sitio web de PEISA")
+        return 0
+    except Exception as e:
+        print(f"❌ Error inesperado: {e}")
+        import traceback
+        traceback.print_exc()
+        return 0
+
+    print(f"\n✅ Scraping completado: {done} productos extraídos "
+          f"en {time.perf_counter() - start:.1f}s")
+    return done
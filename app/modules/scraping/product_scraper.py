@@ -2,11 +2,18 @@
 import json
 import requests
 from bs4 import BeautifulSoup
-from typing import List, Dict
+from typing import List, Dict, Optional
 import re
-import time
 
-def scrape_peisa_products() -> List[Dict]:
+DEFAULT_BASE_URL = "https://peisa.com.ar"
+
+# Headers para simular navegador
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+def scrape_peisa_products(base_url: str = DEFAULT_BASE_URL, concurrency: Optional[int] = None,
+                          rate: Optional[float] = None) -> List[Dict]:
     """
     Realiza scraping REAL del sitio web de PEISA para obtener productos actualizados.
     URL: https://peisa.com.ar/productos
@@ -17,111 +24,93 @@ def scrape_peisa_products() -> List[Dict]:
     - Productos con nombre, tipo y descripción
     - Ficha técnica completa de cada producto
     
+    Las fichas se descargan en paralelo con un cliente httpx compartido
+    (ver async_scraper.py): concurrencia acotada, límite de pedidos por
+    segundo por host y reintentos con backoff.
+    
+    Args:
+        base_url: Sitio a recorrer (ej: un servidor local de prueba)
+        concurrency: Pedidos simultáneos (por defecto SOLDASUR_SCRAPER_CONCURRENCY)
+        rate: Pedidos por segundo por host (por defecto SOLDASUR_SCRAPER_RATE)
+        
     Returns:
-        Lista de productos extraídos del sitio web
+        Lista de productos extraídos del sitio web, en el orden del listado
     """
-    print("🌐 Iniciando scraping de PEISA...")
-    products = []
+    from app.modules.scraping.async_scraper import run_scraper
     
-    try:
-        # URL base de productos PEISA
-        base_url = "https://peisa.com.ar"
-        products_url = f"{base_url}/productos"
-        
-        # Headers para simular navegador
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        
-        print(f"  📡 Conectando a {products_url}...")
-        response = requests.get(products_url, headers=headers, timeout=10)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.content, 'html.parser')
-        print("  ✅ Página cargada correctamente")
-        
-        # Buscar todos los productos en la página
-        # Estructura: <a href="/productos/[nombre]"><article>...</article></a>
-        all_product_links = soup.find_all('a', href=re.compile(r'/productos/[^/]+$'))
-        all_product_cards = [link for link in all_product_links if link.find('article')]
+    found = []
+    run_scraper(lambda order, product: found.append((order, product)),
+                base_url=base_url, concurrency=concurrency, rate=rate)
+    products = [product for _, product in sorted(found, key=lambda item: item[0])]
+    
+    # Si no se encontraron productos, retornar lista vacía
+    if not products:
+        print("⚠️  No se encontraron productos en el sitio web")
+        return []
+    
+    return products
+
+def parse_product_listing(html, base_url: str = DEFAULT_BASE_URL) -> List[Dict]:
+    """
+    Extrae los productos (información básica) de la página de listado.
+    
+    Args:
+        html: HTML de /productos
+        base_url: URL base del sitio (para armar las URLs de producto)
         
-        print(f"  🔍 Total de productos encontrados en la página: {len(all_product_cards)}")
+    Returns:
+        Productos con modelo, en el orden de la página
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    
+    # Buscar todos los productos en la página
+    # Estructura: <a href="/productos/[nombre]"><article>...</article></a>
+    all_product_links = soup.find_all('a', href=re.compile(r'/productos/[^/]+$'))
+    all_product_cards = [link for link in all_product_links if link.find('article')]
+    
+    print(f"  🔍 Total de productos encontrados en la página: {len(all_product_cards)}")
+    
+    # Extraer categorías para organizar
+    for category_elem in soup.find_all('h1'):
+        category_name = category_elem.get_text(strip=True)
         
-        # Extraer categorías para organizar
-        categories = soup.find_all('h1')
-        current_category = "Sin categoría"
-        current_subcategory = ""
+        # Buscar subcategoría (texto rojo después del h1)
+        subcategory_elem = category_elem.find_next_sibling()
+        subcategory = ""
+        if subcategory_elem and 'text-peisared' in str(subcategory_elem.get('class', [])):
+            subcategory = subcategory_elem.get_text(strip=True)
         
-        for category_elem in categories:
-            category_name = category_elem.get_text(strip=True)
+        print(f"\n  📂 Categoría: {category_name}")
+        if subcategory:
+            print(f"     └─ Subcategoría: {subcategory}")
+    
+    products = []
+    for idx, card in enumerate(all_product_cards, 1):
+        try:
+            # Intentar determinar categoría del producto buscando el h1 más cercano antes del producto
+            product_category = "Sin categoría"
+            product_subcategory = ""
             
-            # Buscar subcategoría (texto rojo después del h1)
-            subcategory_elem = category_elem.find_next_sibling()
-            subcategory = ""
-            if subcategory_elem and 'text-peisared' in str(subcategory_elem.get('class', [])):
-                subcategory = subcategory_elem.get_text(strip=True)
+            # Buscar hacia atrás en el HTML para encontrar el h1 más cercano
+            prev_elem = card
+            while prev_elem:
+                prev_elem = prev_elem.find_previous(['h1', 'p'])
+                if prev_elem and prev_elem.name == 'h1':
+                    product_category = prev_elem.get_text(strip=True)
+                    # Buscar subcategoría después del h1
+                    next_elem = prev_elem.find_next_sibling()
+                    if next_elem and 'text-peisared' in str(next_elem.get('class', [])):
+                        product_subcategory = next_elem.get_text(strip=True)
+                    break
             
-            print(f"\n  📂 Categoría: {category_name}")
-            if subcategory:
-                print(f"     └─ Subcategoría: {subcategory}")
-        
-        # Procesar todos los productos encontrados
-        print(f"\n  📦 Procesando {len(all_product_cards)} productos...")
-        
-        for idx, card in enumerate(all_product_cards, 1):
-            try:
-                # Intentar determinar categoría del producto buscando el h1 más cercano antes del producto
-                product_category = "Sin categoría"
-                product_subcategory = ""
+            # Extraer información básica del producto
+            product = extract_product_info(card, base_url, product_category, product_subcategory)
+            if product and product.get('model'):
+                products.append(product)
                 
-                # Buscar hacia atrás en el HTML para encontrar el h1 más cercano
-                prev_elem = card
-                while prev_elem:
-                    prev_elem = prev_elem.find_previous(['h1', 'p'])
-                    if prev_elem and prev_elem.name == 'h1':
-                        product_category = prev_elem.get_text(strip=True)
-                        # Buscar subcategoría después del h1
-                        next_elem = prev_elem.find_next_sibling()
-                        if next_elem and 'text-peisared' in str(next_elem.get('class', [])):
-                            product_subcategory = next_elem.get_text(strip=True)
-                        break
-                
-                # Extraer información básica del producto
-                product = extract_product_info(card, base_url, product_category, product_subcategory)
-                
-                if product and product.get('model'):
-                    # Extraer características técnicas y ventajas de la página de detalle
-                    product_url = product.get('url')
-                    if product_url:
-                        technical_data = scrape_product_detail(product_url, headers)
-                        product.update(technical_data)
-                    
-                    products.append(product)
-                    print(f"  ✓ [{idx}/{len(all_product_cards)}] {product['model']} - {product_category}")
-                    
-                # Pequeña pausa para no sobrecargar el servidor
-                time.sleep(0.3)
-                    
-            except Exception as e:
-                print(f"  ⚠️  Error procesando producto {idx}: {e}")
-                continue
-        
-        print(f"\n✅ Scraping completado: {len(products)} productos extraídos")
-        
-    except requests.RequestException as e:
-        print(f"❌ Error de conexión: {e}")
-        print("⚠️  No se pudo conectar al sitio web de PEISA")
-        return []
-    except Exception as e:
-        print(f"❌ Error inesperado: {e}")
-        import traceback
-        traceback.print_exc()
-        return []
-    
-    # Si no se encontraron productos, retornar lista vacía
-    if not products:
-        print("⚠️  No se encontraron productos en el sitio web")
-        return []
+        except Exception as e:
+            print(f"  ⚠️  Error procesando producto {idx}: {e}")
+            continue
     
     return products
 
@@ -197,15 +186,10 @@ def extract_product_info(card, base_url: str, category: str = "", subcategory: s
     return product
 
 
-def scrape_product_detail(product_url: str, headers: dict) -> Dict:
+def scrape_product_detail(product_url: str, headers: dict = HEADERS) -> Dict:
     """
-    Extrae la ficha técnica completa de un producto individual.
-    
-    Extrae:
-    - Descripción completa del producto
-    - Características técnicas (lista de bullets)
-    - Ventajas (lista de bullets)
-    - Potencia, dimensiones, etc.
+    Descarga y extrae la ficha técnica de un producto individual (un solo
+    pedido, sin concurrencia; el scraping completo usa async_scraper.py).
     
     Args:
         product_url: URL completa del producto
@@ -214,131 +198,151 @@ def scrape_product_detail(product_url: str, headers: dict) -> Dict:
     Returns:
         Diccionario con datos técnicos adicionales
     """
-    technical_data = {
+    try:
+        response = requests.get(product_url, headers=headers, timeout=10)
+        response.raise_for_status()
+        return parse_product_detail(response.content)
+    except Exception as e:
+        print(f"         ⚠️  Error obteniendo ficha técnica: {e}")
+        return empty_technical_data()
+
+
+def empty_technical_data() -> Dict:
+    """Ficha técnica vacía (la de un producto cuya página no se pudo leer)"""
+    return {
         'technical_features': [],
         'advantages': [],
         'specifications': {}
     }
+
+
+def parse_product_detail(html) -> Dict:
+    """
+    Extrae la ficha técnica completa de la página de un producto.
     
-    try:
-        response = requests.get(product_url, headers=headers, timeout=10)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.content, 'html.parser')
+    Extrae:
+    - Descripción completa del producto
+    - Características técnicas (lista de bullets)
+    - Ventajas (lista de bullets)
+    - Potencia, dimensiones, etc.
+    
+    Args:
+        html: HTML de la página del producto
         
-        # Extraer descripción completa del producto
-        # La descripción está en el primer párrafo después del subtítulo (h2)
-        # Buscar el h2 con el subtítulo y luego el párrafo siguiente
+    Returns:
+        Diccionario con datos técnicos adicionales
+    """
+    technical_data = empty_technical_data()
+    
+    soup = BeautifulSoup(html, 'html.parser')
+    
+    # Extraer descripción completa del producto
+    # La descripción está en el primer párrafo después del subtítulo (h2)
+    # Buscar el h2 con el subtítulo y luego el párrafo siguiente
+    subtitle = soup.find('h2')
+    if subtitle:
+        # Buscar el siguiente párrafo después del h2
+        next_p = subtitle.find_next('p')
+        if next_p:
+            desc_text = next_p.get_text(strip=True)
+            # Separar la descripción de las ventajas si están juntas
+            # Buscar donde empieza "Ventajas" o "VentajasX" (sin espacio)
+            if 'Ventajas' in desc_text:
+                # Dividir en la palabra "Ventajas"
+                desc_text = desc_text.split('Ventajas')[0].strip()
+            
+            # Verificar que sea una descripción válida (más de 50 caracteres)
+            if len(desc_text) > 50:
+                technical_data['description'] = desc_text
+    
+    # Si no se encontró con el método anterior, buscar en todo el contenido
+    if 'description' not in technical_data:
+        # Buscar todos los párrafos en el área principal
+        paragraphs = soup.find_all('p')
+        for p in paragraphs:
+            text = p.get_text(strip=True)
+            
+            # Separar la descripción de las ventajas si están juntas
+            if 'Ventajas' in text:
+                text = text.split('Ventajas')[0].strip()
+            
+            # La descripción es un párrafo largo que no contiene palabras clave de secciones
+            if (len(text) > 80 and 
+                'Características' not in text and
+                'garantía' not in text and
+                'PUNTOS DE VENTA' not in text):
+                technical_data['description'] = text
+                break
+    
+    # Extraer ventajas (sección "Ventajas")
+    # Primero intentar extraer de una lista <ul> después de un <h3>Ventajas</h3>
+    ventajas_section = soup.find('h3', string=re.compile(r'Ventajas', re.I))
+    if ventajas_section:
+        ventajas_list = ventajas_section.find_next('ul')
+        if ventajas_list:
+            technical_data['advantages'] = [
+                li.get_text(strip=True) for li in ventajas_list.find_all('li')
+            ]
+    
+    # Si no se encontraron ventajas en una lista <ul>, buscar en el texto del párrafo
+    if not technical_data['advantages']:
+        # Buscar el párrafo que contiene "Ventajas"
         subtitle = soup.find('h2')
         if subtitle:
-            # Buscar el siguiente párrafo después del h2
             next_p = subtitle.find_next('p')
             if next_p:
-                desc_text = next_p.get_text(strip=True)
-                # Separar la descripción de las ventajas si están juntas
-                # Buscar donde empieza "Ventajas" o "VentajasX" (sin espacio)
-                if 'Ventajas' in desc_text:
-                    # Dividir en la palabra "Ventajas"
-                    desc_text = desc_text.split('Ventajas')[0].strip()
-                
-                # Verificar que sea una descripción válida (más de 50 caracteres)
-                if len(desc_text) > 50:
-                    technical_data['description'] = desc_text
-        
-        # Si no se encontró con el método anterior, buscar en todo el contenido
-        if 'description' not in technical_data:
-            # Buscar todos los párrafos en el área principal
-            paragraphs = soup.find_all('p')
-            for p in paragraphs:
-                text = p.get_text(strip=True)
-                
-                # Separar la descripción de las ventajas si están juntas
-                if 'Ventajas' in text:
-                    text = text.split('Ventajas')[0].strip()
-                
-                # La descripción es un párrafo largo que no contiene palabras clave de secciones
-                if (len(text) > 80 and 
-                    'Características' not in text and
-                    'garantía' not in text and
-                    'PUNTOS DE VENTA' not in text):
-                    technical_data['description'] = text
-                    break
-        
-        # Extraer ventajas (sección "Ventajas")
-        # Primero intentar extraer de una lista <ul> después de un <h3>Ventajas</h3>
-        ventajas_section = soup.find('h3', string=re.compile(r'Ventajas', re.I))
-        if ventajas_section:
-            ventajas_list = ventajas_section.find_next('ul')
-            if ventajas_list:
-                technical_data['advantages'] = [
-                    li.get_text(strip=True) for li in ventajas_list.find_all('li')
-                ]
-        
-        # Si no se encontraron ventajas en una lista <ul>, buscar en el texto del párrafo
-        if not technical_data['advantages']:
-            # Buscar el párrafo que contiene "Ventajas"
-            subtitle = soup.find('h2')
-            if subtitle:
-                next_p = subtitle.find_next('p')
-                if next_p:
-                    full_text = next_p.get_text(strip=True)
-                    # Si el párrafo contiene "Ventajas", extraer la parte de ventajas
-                    if 'Ventajas' in full_text:
-                        ventajas_text = full_text.split('Ventajas', 1)[1] if 'Ventajas' in full_text else ''
-                        if ventajas_text:
-                            # Dividir por puntos seguidos de mayúscula o por saltos de línea
-                            ventajas_items = []
-                            # Dividir por punto seguido de mayúscula
-                            parts = re.split(r'\.(?=[A-Z])', ventajas_text)
-                            for part in parts:
-                                part = part.strip()
-                                if len(part) > 10:  # Filtrar fragmentos muy cortos
-                                    # Agregar el punto final si no lo tiene
-                                    if not part.endswith('.'):
-                                        part += '.'
-                                    ventajas_items.append(part)
-                            
-                            if ventajas_items:
-                                technical_data['advantages'] = ventajas_items
-        
-        # Extraer características técnicas (sección "Características Técnicas" o "Características técnicas")
-        # Buscar cualquier encabezado que contenga "características" y "técnicas"
-        caracteristicas_section = soup.find(['h2', 'h3', 'h4'], string=re.compile(r'Características\s+técnicas', re.I))
-        if caracteristicas_section:
-            caracteristicas_list = caracteristicas_section.find_next('ul')
-            if caracteristicas_list:
-                technical_data['technical_features'] = [
-                    li.get_text(strip=True) for li in caracteristicas_list.find_all('li')
-                ]
-        
-        # Extraer especificaciones de cualquier lista de bullets visible
-        all_lists = soup.find_all('ul')
-        for ul in all_lists:
-            items = [li.get_text(strip=True) for li in ul.find_all('li')]
-            # Buscar especificaciones técnicas en formato "Clave: Valor"
-            for item in items:
-                if ':' in item:
-                    key, value = item.split(':', 1)
-                    technical_data['specifications'][key.strip()] = value.strip()
-        
-        # Extraer potencia si está en especificaciones
-        for key, value in technical_data['specifications'].items():
-            if 'potencia' in key.lower():
-                power_match = re.search(r'(\d+)\s*(w|kw|kcal)', value, re.I)
-                if power_match:
-                    power_value = int(power_match.group(1))
-                    unit = power_match.group(2).lower()
-                    if unit == 'kw':
-                        power_value *= 1000
-                    elif unit == 'kcal':
-                        power_value = int(power_value * 1.163)
-                    technical_data['power_w'] = power_value
-        
-        # Pequeña pausa
-        time.sleep(0.2)
-        
-    except Exception as e:
-        print(f"         ⚠️  Error obteniendo ficha técnica: {e}")
+                full_text = next_p.get_text(strip=True)
+                # Si el párrafo contiene "Ventajas", extraer la parte de ventajas
+                if 'Ventajas' in full_text:
+                    ventajas_text = full_text.split('Ventajas', 1)[1] if 'Ventajas' in full_text else ''
+                    if ventajas_text:
+                        # Dividir por puntos seguidos de mayúscula o por saltos de línea
+                        ventajas_items = []
+                        # Dividir por punto seguido de mayúscula
+                        parts = re.split(r'\.(?=[A-Z])', ventajas_text)
+                        for part in parts:
+                            part = part.strip()
+                            if len(part) > 10:  # Filtrar fragmentos muy cortos
+                                # Agregar el punto final si no lo tiene
+                                if not part.endswith('.'):
+                                    part += '.'
+                                ventajas_items.append(part)
+                        
+                        if ventajas_items:
+                            technical_data['advantages'] = ventajas_items
+    
+    # Extraer características técnicas (sección "Características Técnicas" o "Características técnicas")
+    # Buscar cualquier encabezado que contenga "características" y "técnicas"
+    caracteristicas_section = soup.find(['h2', 'h3', 'h4'], string=re.compile(r'Características\s+técnicas', re.I))
+    if caracteristicas_section:
+        caracteristicas_list = caracteristicas_section.find_next('ul')
+        if caracteristicas_list:
+            technical_data['technical_features'] = [
+                li.get_text(strip=True) for li in caracteristicas_list.find_all('li')
+            ]
+    
+    # Extraer especificaciones de cualquier lista de bullets visible
+    all_lists = soup.find_all('ul')
+    for ul in all_lists:
+        items = [li.get_text(strip=True) for li in ul.find_all('li')]
+        # Buscar especificaciones técnicas en formato "Clave: Valor"
+        for item in items:
+            if ':' in item:
+                key, value = item.split(':', 1)
+                technical_data['specifications'][key.strip()] = value.strip()
+    
+    # Extraer potencia si está en especificaciones
+    for key, value in technical_data['specifications'].items():
+        if 'potencia' in key.lower():
+            power_match = re.search(r'(\d+)\s*(w|kw|kcal)', value, re.I)
+            if power_match:
+                power_value = int(power_match.group(1))
+                unit = power_match.group(2).lower()
+                if unit == 'kw':
+                    power_value *= 1000
+                elif unit == 'kcal':
+                    power_value = int(power_value * 1.163)
+                technical_data['power_w'] = power_value
     
     return technical_data
 
@@ -424,87 +428,139 @@ def get_products_catalog(use_scraping: bool = True) -> List[Dict]:
             return scrape_peisa_products()
 
 
-def save_catalog(filename: str = "data/products_catalog.json", use_scraping: bool = True):
+class CatalogWriter:
+    """
+    Fusiona productos con el catálogo JSON existente (por URL) a medida que llegan.
+    
+    Los productos nuevos se agregan en el orden del listado (`position`), no en
+    el que terminan de descargarse; `close` escribe el archivo de forma atómica
+    (temporal + renombre), así un scraping cortado no deja el catálogo a medias.
+    
+    Uso:
+        writer = CatalogWriter("data/products_catalog.json")
+        writer.add(posición, producto)
+        productos = writer.close()
+    """
+    
+    def __init__(self, filename: str = "data/products_catalog.json"):
+        import os
+        self.filename = filename
+        self.added_count = 0
+        self.updated_count = 0
+        self._new = []  # (posición, producto)
+        
+        # Cargar catálogo existente si existe
+        self.products = {}
+        if os.path.exists(filename):
+            try:
+                with open(filename, 'r', encoding='utf-8') as f:
+                    existing_list = json.load(f)
+                    # Indexar por URL para búsqueda rápida
+                    self.products = {p.get('url'): p for p in existing_list if p.get('url')}
+                    print(f"📂 Catálogo existente cargado: {len(self.products)} productos")
+            except Exception as e:
+                print(f"⚠️  Error cargando catálogo existente: {e}")
+    
+    def add(self, position: int, product: Dict) -> None:
+        """Actualiza el producto si su URL ya estaba; si no, lo deja para agregar"""
+        product_url = product.get('url')
+        if product_url in self.products:
+            # Actualizar producto existente
+            self.products[product_url].update(product)
+            self.updated_count += 1
+        else:
+            # Agregar nuevo producto
+            self._new.append((position, product))
+            self.added_count += 1
+    
+    def close(self) -> List[Dict]:
+        """Guarda el catálogo y retorna la lista de productos guardados"""
+        import os
+        for _, product in sorted(self._new, key=lambda item: item[0]):
+            self.products[product.get('url')] = product
+        self._new = []
+        
+        # Convertir diccionario de vuelta a lista
+        final_products = list(self.products.values())
+        
+        # Guardar en JSON
+        directory = os.path.dirname(self.filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{self.filename}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(final_products, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.filename)
+        return final_products
+
+
+def save_catalog(filename: str = "data/products_catalog.json", use_scraping: bool = True,
+                 base_url: str = DEFAULT_BASE_URL):
     """
     Guarda el catálogo en un archivo JSON, actualizando productos existentes.
     
+    Con scraping, cada producto se fusiona en el catálogo apenas se descarga
+    su ficha (ver `CatalogWriter`).
+    
     Args:
         filename: Ruta donde guardar el archivo
         use_scraping: Si True, intenta scraping real de PEISA
+        base_url: Sitio a recorrer si se hace scraping
         
     Returns:
         Lista de productos guardados
     """
-    import os
-    os.makedirs(os.path.dirname(filename), exist_ok=True)
-    
     print(f"\n{'='*60}")
     print(f"🚀 SCRAPER DE PRODUCTOS PEISA")
     print(f"{'='*60}\n")
     
-    # Cargar catálogo existente si existe
-    existing_products = {}
-    if os.path.exists(filename):
-        try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                existing_list = json.load(f)
-                # Indexar por URL para búsqueda rápida
-                existing_products = {p.get('url'): p for p in existing_list if p.get('url')}
-                print(f"📂 Catálogo existente cargado: {len(existing_products)} productos")
-        except Exception as e:
-            print(f"⚠️  Error cargando catálogo existente: {e}")
-    
-    # Obtener productos del scraping
-    new_products = get_products_catalog(use_scraping=use_scraping)
-    
-    # Actualizar o agregar productos
-    updated_count = 0
-    added_count = 0
-    
-    for product in new_products:
-        product_url = product.get('url')
-        if product_url in existing_products:
-            # Actualizar producto existente
-            existing_products[product_url].update(product)
-            updated_count += 1
-        else:
-            # Agregar nuevo producto
-            existing_products[product_url] = product
-            added_count += 1
+    writer = CatalogWriter(filename)
     
-    # Convertir diccionario de vuelta a lista
-    final_products = list(existing_products.values())
+    if use_scraping:
+        from app.modules.scraping.async_scraper import run_scraper
+        run_scraper(writer.add, base_url=base_url)
+    else:
+        for position, product in enumerate(get_products_catalog(use_scraping=False)):
+            writer.add(position, product)
     
-    # Guardar en JSON
-    with open(filename, 'w', encoding='utf-8') as f:
-        json.dump(final_products, f, ensure_ascii=False, indent=2)
+    final_products = writer.close()
     
     print(f"\n{'='*60}")
     print(f"✅ Catálogo guardado exitosamente")
     print(f"📁 Archivo: {filename}")
     print(f"📦 Total productos: {len(final_products)}")
-    print(f"   ├─ ✨ Nuevos: {added_count}")
-    print(f"   └─ 🔄 Actualizados: {updated_count}")
+    print(f"   ├─ ✨ Nuevos: {writer.added_count}")
+    print(f"   └─ 🔄 Actualizados: {writer.updated_count}")
     print(f"{'='*60}\n")
     
     return final_products
 
 
 if __name__ == "__main__":
+    import os
     import sys
     
+    # Uso como script: la raíz del repo en el path para importar async_scraper
+    repo_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+    if repo_root not in sys.path:
+        sys.path.insert(0, repo_root)
+    
     # Verificar si se pasa argumento --no-scraping
     use_scraping = "--no-scraping" not in sys.argv
+    # --base-url URL: recorrer otro sitio (ej: un servidor local de prueba)
+    base_url = DEFAULT_BASE_URL
+    if "--base-url" in sys.argv[:-1]:
+        base_url = sys.argv[sys.argv.index("--base-url") + 1]
     
     if use_scraping:
-        print("🌐 Modo: SCRAPING REAL de https://peisa.com.ar/productos")
+        print(f"🌐 Modo: SCRAPING REAL de {base_url}/productos")
         print("   - Actualiza productos existentes")
         print("   - Agrega productos nuevos")
     else:
         print("📋 Modo: Cargar desde archivo existente (sin scraping)")
     
     # Ejecutar scraping y guardar
-    products = save_catalog(use_scraping=use_scraping)
+    products = save_catalog(use_scraping=use_scraping, base_url=base_url)
     
     # Mostrar resumen
     print(f"\n📊 RESUMEN DEL CATÁLOGO:")
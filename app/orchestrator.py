@@ -10,6 +10,9 @@ from typing import Dict, Any, Optional, List
 from enum import Enum
 import re
 
+from app.cache import deep_sizeof
+from app.session_store import SessionStore, create_session_store
+
 
 class IntentType(Enum):
     """Tipos de intención del usuario"""
@@ -221,22 +224,28 @@ class ConversationOrchestrator:
     proporcionando una experiencia unificada.
     """
     
-    def __init__(self, expert_engine, rag_engine):
+    def __init__(self, expert_engine, rag_engine, contexts: Optional[SessionStore] = None):
         """
         Args:
             expert_engine: Instancia del motor experto
             rag_engine: Instancia del motor RAG
+            contexts: Almacén de contextos (por defecto en memoria, LRU + TTL)
         """
         self.expert_engine = expert_engine
         self.rag_engine = rag_engine
         self.intent_classifier = IntentClassifier()
-        self.contexts: Dict[str, UnifiedContext] = {}
+        if contexts is None:
+            # Los UnifiedContext son objetos vivos: se mantienen en memoria del proceso
+            contexts = create_session_store('memory', sizeof=lambda ctx: deep_sizeof(ctx.to_dict()))
+        self.contexts: SessionStore = contexts
     
     def get_or_create_context(self, conversation_id: str) -> UnifiedContext:
         """Obtiene o crea un contexto unificado para la conversación"""
-        if conversation_id not in self.contexts:
-            self.contexts[conversation_id] = UnifiedContext(conversation_id)
-        return self.contexts[conversation_id]
+        context = self.contexts.get(conversation_id)
+        if context is None:
+            context = UnifiedContext(conversation_id)
+            self.contexts[conversation_id] = context
+        return context
     
     async def process_message(self, conversation_id: str, message: str, 
                              option_index: Optional[int] = None,
@@ -253,6 +262,18 @@ class ConversationOrchestrator:
         Returns:
             Dict con la respuesta y metadatos
         """
+        result = await self._route_message(conversation_id, message, option_index, input_values)
+        
+        # Guardar el contexto actualizado (renueva su TTL y su tamaño en el almacén)
+        context = self.contexts.get(conversation_id)
+        if context is not None:
+            self.contexts[conversation_id] = context
+        return result
+    
+    async def _route_message(self, conversation_id: str, message: str,
+                             option_index: Optional[int] = None,
+                             input_values: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Clasifica la intención del mensaje y lo enruta al motor correspondiente"""
         context = self.get_or_create_context(conversation_id)
         context.session_metadata['interaction_count'] += 1
         
@@ -351,8 +372,9 @@ class ConversationOrchestrator:
     
     async def _handle_product_search(self, conversation_id: str, message: str) -> Dict[str, Any]:
         """Maneja búsqueda de productos"""
-        # Usar el RAG para búsqueda de productos
-        result = await self.rag_engine.search_products(message)
+        # Usar el RAG para búsqueda de productos (búsqueda por lotes, no bloquea el event loop)
+        products = await self.rag_engine.asearch_products(message)
+        result = {'products': products, 'sources': [p.get('model') for p in products]}
         result['mode'] = ConversationMode.RAG.value
         result['mode_label'] = 'Búsqueda de Productos'
         return result
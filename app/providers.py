@@ -0,0 +1,147 @@
+"""
+providers.py - Inicialización diferida de los componentes pesados
+
+El LLM (ollama), el motor RAG (sentence-transformers + torch + FAISS) y la
+búsqueda de productos (`query/query.py`) se crean recién cuando se usan por
+primera vez. Así, los procesos que sólo atienden el flujo experto (`/start`,
+`/reply`) y las herramientas de línea de comandos arrancan en milisegundos.
+
+Para que el primer chat no pague la carga, la API llama a `warmup()` al
+arrancar (ver `app/main.py`) y registra cuánto tarda cada fase.
+
+Configuración por variables de entorno:
+    SOLDASUR_WARMUP     Componentes a precargar al arrancar, separados por coma
+                        ("llm,search" por defecto; "0" o vacío = ninguno)
+"""
+
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+DEFAULT_WARMUP = "llm,search"
+
+
+class LazyProvider:
+    """Crea un componente en el primer `get()` (una sola vez, seguro entre hilos)"""
+
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        """
+        Args:
+            name: Nombre del componente (para logs y métricas)
+            factory: Función que crea el componente
+        """
+        self.name = name
+        self.factory = factory
+        self.load_seconds: Optional[float] = None
+        self._value: Any = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def get(self) -> Any:
+        """Devuelve el componente, creándolo si todavía no existe"""
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    start = time.perf_counter()
+                    self._value = self.factory()
+                    self.load_seconds = time.perf_counter() - start
+                    self._loaded = True
+                    print(f"  [{self.name}] listo en {self.load_seconds:.2f}s")
+        return self._value
+
+    def warmup(self) -> float:
+        """
+        Crea el componente por adelantado.
+
+        Returns:
+            Segundos que tardó la carga (0 si ya estaba cargado)
+        """
+        already_loaded = self._loaded
+        self.get()
+        return 0.0 if already_loaded else self.load_seconds
+
+
+def _load_llm():
+    from app.modules.chatbot.llm_wrapper import get_llm
+    return get_llm()
+
+
+def _load_rag_engine():
+    from app.modules.chatbot.rag_engine_v2 import get_rag_engine
+    return get_rag_engine()
+
+
+def _load_product_search():
+    from query import query
+    query.warmup()
+    return query.search_filtered
+
+
+llm_provider = LazyProvider('llm', _load_llm)
+rag_provider = LazyProvider('rag', _load_rag_engine)
+search_provider = LazyProvider('search', _load_product_search)
+
+PROVIDERS: Dict[str, LazyProvider] = {
+    provider.name: provider for provider in (llm_provider, rag_provider, search_provider)
+}
+
+
+def get_llm():
+    """Instancia global de OllamaLLM"""
+    return llm_provider.get()
+
+
+def get_rag_engine():
+    """Instancia global de RAGEngineV2 (None si no se pudo inicializar)"""
+    return rag_provider.get()
+
+
+def get_product_search() -> Callable:
+    """Función `search_filtered(question, top_k)` del índice de productos"""
+    return search_provider.get()
+
+
+def get_product_search_batch() -> Callable:
+    """Función `search_filtered_batch(questions, top_k)` del índice de productos"""
+    search_provider.get()
+    from query import query
+    return query.search_filtered_batch
+
+
+def warmup_names() -> Iterable[str]:
+    """Componentes a precargar según SOLDASUR_WARMUP"""
+    value = os.getenv('SOLDASUR_WARMUP', DEFAULT_WARMUP).strip().lower()
+    if value in ('', '0', 'false', 'no', 'off'):
+        return []
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+def warmup(names: Optional[Iterable[str]] = None) -> Dict[str, float]:
+    """
+    Precarga componentes y mide cada fase.
+
+    Un componente que falla se informa y no impide cargar los demás
+    (se volverá a intentar en su primer uso).
+
+    Args:
+        names: Componentes a precargar (por defecto SOLDASUR_WARMUP)
+
+    Returns:
+        Segundos por componente
+    """
+    timings = {}
+    for name in (warmup_names() if names is None else names):
+        provider = PROVIDERS.get(name)
+        if provider is None:
+            print(f"  Componente de warmup desconocido: '{name}'")
+            continue
+        try:
+            timings[name] = round(provider.warmup(), 3)
+        except Exception as e:
+            print(f"  [{name}] error en warmup: {e}")
+    return timings
@@ -0,0 +1,327 @@
+"""
+session_store.py - Almacenes de sesiones de conversación
+
+Define la interfaz `SessionStore` y dos implementaciones:
+- `InMemorySessionStore`: en memoria del proceso, acotada (LRU + TTL + tope de
+  memoria). También sirve como implementación falsa para pruebas.
+- `SQLiteSessionStore`: compartida entre procesos mediante un archivo SQLite
+  embebido, para correr `uvicorn app.main:app --workers N`.
+
+Configuración por variables de entorno:
+    SOLDASUR_SESSION_BACKEND    "memory" (por defecto) o "sqlite"
+    SOLDASUR_SESSION_DB         Archivo SQLite compartido (data/sessions.db)
+    SOLDASUR_SESSION_TTL        Segundos de inactividad hasta expirar (1800)
+    SOLDASUR_MAX_SESSIONS       Máximo de sesiones vivas (10000)
+    SOLDASUR_SESSION_MAX_MB     Memoria máxima estimada en MB (256)
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from app.cache import LRUCache, deep_sizeof
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - msgpack es opcional, JSON como respaldo
+    msgpack = None
+
+DEFAULT_SESSION_TTL = 30 * 60
+DEFAULT_MAX_SESSIONS = 10_000
+DEFAULT_MAX_MB = 256
+DEFAULT_SESSION_DB = "data/sessions.db"
+
+
+def encode_session(value: Any) -> bytes:
+    """Serializa una sesión de forma compacta (msgpack, o JSON si no está instalado)"""
+    if msgpack is not None:
+        return msgpack.packb(value, use_bin_type=True)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def decode_session(data: bytes) -> Any:
+    """Deserializa una sesión guardada con `encode_session`"""
+    if msgpack is not None:
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+    return json.loads(data.decode("utf-8"))
+
+
+class SessionStore(ABC):
+    """
+    Interfaz de un almacén de sesiones.
+
+    Las sesiones se leen con `get`/`store[id]` y se guardan explícitamente con
+    `put`/`store[id] = valor` después de modificarlas, para que cualquier
+    backend (en memoria o compartido entre procesos) vea el último estado.
+    """
+
+    @abstractmethod
+    def get(self, session_id: str) -> Optional[Any]:
+        """Obtiene una sesión (None si no existe o expiró)"""
+
+    @abstractmethod
+    def put(self, session_id: str, value: Any) -> None:
+        """Guarda (o reemplaza) una sesión"""
+
+    @abstractmethod
+    def delete(self, session_id: str) -> None:
+        """Elimina una sesión si existe"""
+
+    @abstractmethod
+    def stats(self) -> Dict[str, Any]:
+        """Contadores del almacén (sesiones vivas, desalojos, memoria)"""
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """Cantidad de sesiones vivas"""
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+    def __getitem__(self, session_id: str) -> Any:
+        value = self.get(session_id)
+        if value is None:
+            raise KeyError(session_id)
+        return value
+
+    def __setitem__(self, session_id: str, value: Any) -> None:
+        self.put(session_id, value)
+
+    def __delitem__(self, session_id: str) -> None:
+        self.delete(session_id)
+
+
+class InMemorySessionStore(SessionStore):
+    """
+    Almacén de sesiones en memoria del proceso, con desalojo LRU + TTL.
+
+    Cuenta la memoria estimada de cada sesión al guardarla y desaloja las
+    menos usadas cuando se supera `max_sessions` o `max_bytes`.
+
+    Con `serialize=True` guarda cada sesión serializada, igual que un backend
+    compartido: las modificaciones que no se guardan con `put` se pierden.
+    Así se comporta como implementación falsa fiel de `SQLiteSessionStore`.
+    """
+
+    def __init__(self, ttl: Optional[float] = DEFAULT_SESSION_TTL,
+                 max_sessions: Optional[int] = DEFAULT_MAX_SESSIONS,
+                 max_bytes: Optional[int] = DEFAULT_MAX_MB * 1024 * 1024,
+                 sizeof: Callable[[Any], int] = deep_sizeof,
+                 serialize: bool = False,
+                 **cache_kwargs):
+        """
+        Args:
+            ttl: Segundos de inactividad hasta que una sesión expira
+            max_sessions: Máximo de sesiones vivas
+            max_bytes: Memoria máxima estimada para todas las sesiones
+            sizeof: Función que estima el tamaño de una sesión
+            serialize: Guardar las sesiones serializadas (copia independiente)
+            **cache_kwargs: Opciones extra de `LRUCache` (ej: `clock`)
+        """
+        self.serialize = serialize
+        self._cache = LRUCache(max_entries=max_sessions, ttl=ttl, max_bytes=max_bytes,
+                               sizeof=len if serialize else sizeof, **cache_kwargs)
+
+    def get(self, session_id: str) -> Optional[Any]:
+        value = self._cache.get(session_id)
+        if value is not None and self.serialize:
+            return decode_session(value)
+        return value
+
+    def put(self, session_id: str, value: Any) -> None:
+        self._cache.put(session_id, encode_session(value) if self.serialize else value)
+
+    def delete(self, session_id: str) -> None:
+        self._cache.pop(session_id)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._cache
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def stats(self) -> Dict[str, Any]:
+        self._cache.purge_expired()
+        cache_stats = self._cache.stats()
+        return {
+            'backend': 'memory',
+            'live_sessions': cache_stats['entries'],
+            'bytes': cache_stats['bytes'],
+            'evictions': cache_stats['evictions'],
+            'expirations': cache_stats['expirations'],
+            'hits': cache_stats['hits'],
+            'misses': cache_stats['misses'],
+        }
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Almacén de sesiones compartido entre procesos sobre un archivo SQLite.
+
+    Cada worker abre sus propias conexiones (una por hilo) al mismo archivo en
+    modo WAL, de modo que una sesión creada en un worker se puede continuar en
+    otro. Aplica el mismo desalojo LRU + TTL usando la marca de último acceso.
+    Los contadores de desalojos son por proceso; las sesiones vivas y los bytes
+    se leen de la base compartida.
+    """
+
+    def __init__(self, path: str = DEFAULT_SESSION_DB,
+                 ttl: Optional[float] = DEFAULT_SESSION_TTL,
+                 max_sessions: Optional[int] = DEFAULT_MAX_SESSIONS,
+                 max_bytes: Optional[int] = DEFAULT_MAX_MB * 1024 * 1024,
+                 clock: Callable[[], float] = time.time):
+        """
+        Args:
+            path: Ruta del archivo SQLite compartido
+            ttl: Segundos de inactividad hasta que una sesión expira
+            max_sessions: Máximo de sesiones vivas
+            max_bytes: Tamaño máximo serializado de todas las sesiones
+            clock: Reloj de pared compartido entre procesos (inyectable para pruebas)
+        """
+        self.path = str(path)
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self.evictions = 0
+        self.expirations = 0
+        self._local = threading.local()
+
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " id TEXT PRIMARY KEY, data BLOB NOT NULL,"
+                " last_access REAL NOT NULL, size INTEGER NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS sessions_last_access ON sessions(last_access)"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        """Conexión propia del hilo actual (sqlite3 no comparte conexiones entre hilos)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _expired(self, last_access: float, now: float) -> bool:
+        return self.ttl is not None and now - last_access > self.ttl
+
+    def get(self, session_id: str) -> Optional[Any]:
+        conn = self._connection()
+        now = self.clock()
+        row = conn.execute(
+            "SELECT data, last_access FROM sessions WHERE id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        if self._expired(row[1], now):
+            with conn:
+                conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            self.expirations += 1
+            return None
+        with conn:
+            conn.execute("UPDATE sessions SET last_access = ? WHERE id = ?", (now, session_id))
+        return decode_session(row[0])
+
+    def put(self, session_id: str, value: Any) -> None:
+        data = encode_session(value)
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (id, data, last_access, size) VALUES (?, ?, ?, ?)",
+                (session_id, data, self.clock(), len(data)),
+            )
+            self._enforce_limits(conn)
+
+    def _enforce_limits(self, conn: sqlite3.Connection) -> None:
+        """Descarta sesiones vencidas y desaloja las menos usadas (dentro de la transacción)"""
+        if self.ttl is not None:
+            cursor = conn.execute(
+                "DELETE FROM sessions WHERE last_access < ?", (self.clock() - self.ttl,)
+            )
+            self.expirations += max(cursor.rowcount, 0)
+
+        count, total = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM sessions"
+        ).fetchone()
+        excess = 0
+        if self.max_sessions is not None and count > self.max_sessions:
+            excess = count - self.max_sessions
+        if self.max_bytes is not None and total > self.max_bytes:
+            # Nunca desalojar la sesión más reciente (la que se acaba de guardar)
+            freed = oldest = 0
+            for (size,) in conn.execute(
+                    "SELECT size FROM sessions ORDER BY last_access LIMIT ?", (count - 1,)):
+                if total - freed <= self.max_bytes:
+                    break
+                freed += size
+                oldest += 1
+            excess = max(excess, oldest)
+        if excess:
+            cursor = conn.execute(
+                "DELETE FROM sessions WHERE id IN "
+                "(SELECT id FROM sessions ORDER BY last_access LIMIT ?)", (excess,)
+            )
+            self.evictions += max(cursor.rowcount, 0)
+
+    def delete(self, session_id: str) -> None:
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def __len__(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        count, total = self._connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM sessions"
+        ).fetchone()
+        return {
+            'backend': 'sqlite',
+            'live_sessions': count,
+            'bytes': total,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+
+def _env_number(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def create_session_store(backend: Optional[str] = None, **overrides) -> SessionStore:
+    """
+    Crea el almacén de sesiones configurado por variables de entorno.
+
+    Args:
+        backend: "memory" o "sqlite" (por defecto SOLDASUR_SESSION_BACKEND)
+        **overrides: Parámetros que reemplazan a los de entorno
+
+    Returns:
+        Almacén de sesiones listo para usar
+    """
+    backend = (backend or os.getenv('SOLDASUR_SESSION_BACKEND', 'memory')).lower()
+    options = {
+        'ttl': _env_number('SOLDASUR_SESSION_TTL', DEFAULT_SESSION_TTL),
+        'max_sessions': int(_env_number('SOLDASUR_MAX_SESSIONS', DEFAULT_MAX_SESSIONS)),
+        'max_bytes': int(_env_number('SOLDASUR_SESSION_MAX_MB', DEFAULT_MAX_MB) * 1024 * 1024),
+    }
+    if backend == 'sqlite':
+        options['path'] = os.getenv('SOLDASUR_SESSION_DB', DEFAULT_SESSION_DB)
+        options.update(overrides)
+        return SQLiteSessionStore(**options)
+    if backend != 'memory':
+        raise ValueError(f"Backend de sesiones desconocido: '{backend}'")
+    options.update(overrides)
+    return InMemorySessionStore(**options)
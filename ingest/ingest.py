@@ -1,80 +1,75 @@
 """
-ingest.py – crea índice FAISS + catálogo SQLite a partir de un CSV
+ingest.py – indexa productos en el servicio de índice compartido (FAISS + SQLite)
+
+Acepta un CSV (una fila por producto) o el catálogo JSON. El resultado es el
+mismo índice y la misma base de metadatos que usan `query.py` y el RAG
+(embeddings/products-*.faiss, embeddings/products-*.db y el snapshot columnar
+embeddings/products-*.columns, ver
+app/modules/chatbot/index_service.py). La ingesta es incremental: compara con
+la anterior por clave estable de producto (id / sku / url) y hash de cada
+fragmento, vectoriza sólo lo nuevo o modificado y deja lápidas en lo quitado;
+la versión nueva se confirma de una vez con el manifiesto.
+
+Los CSV se leen por lotes (`--chunk-rows`) con textos armados en forma
+vectorizada; un hilo vectoriza cada lote mientras se lee el siguiente, y al
+final se informa el throughput de cada etapa (ver
+app/modules/chatbot/streaming_ingest.py).
 
 Uso:
-    python ingest.py data/processed/products_mock.csv
+    python ingest.py data/products_catalog.json
+    python ingest.py data/processed/products_mock.csv [--chunk-rows 5000] [--batch-size 256]
 Requisitos:
-    pip install sentence-transformers faiss-cpu pandas tqdm
+    pip install sentence-transformers faiss-cpu pandas
+    (opcional, SOLDASUR_EMBEDDING_BACKEND=onnx-int8: pip install onnx onnxruntime)
 """
-import sys, os, sqlite3, faiss
-import pandas as pd
-from tqdm import tqdm
-from sentence_transformers import SentenceTransformer
+import sys, os, time, argparse
 from pathlib import Path
 
-MODEL_NAME = "sentence-transformers/distiluse-base-multilingual-cased-v2"
-
 SCRIPT_DIR = Path(__file__).resolve().parent
-DB_PATH    = SCRIPT_DIR.parent / "embeddings" / "products.db"
-INDEX_PATH = SCRIPT_DIR.parent / "embeddings" / "products.faiss"
-
-# ────────────────────────────────────────────────────────────────────────────
-def normalize_text(row) -> str:
-    """Concatena campos semánticos + numéricos para el embedding."""
-    parts = [
-        str(row.get("type_en")  or row.get("type")),
-        str(row.get("family_en")or row.get("family")),
-        str(row.get("model_en") or row.get("model")),
-        str(row.get("description_en") or row.get("description")),
-        f"{row.get('power_w', '')} watts",
-        f"{row.get('liters', '')} liters",
-        f"{row.get('max_pressure_bar', '')} bar",
-        str(row.get("category", "")),
-    ]
-    return " ".join(p for p in parts if p and p != "nan").strip()
+if str(SCRIPT_DIR.parent) not in sys.path:      # uso como script: python ingest/ingest.py
+    sys.path.insert(0, str(SCRIPT_DIR.parent))
 
-def build_sqlite(df, path=DB_PATH):
-    if os.path.exists(path):
-        os.remove(path)
-    conn = sqlite3.connect(path)
-    df.to_sql("products", conn, index=False)
-    conn.close()
-
-def build_faiss(embeddings, path=INDEX_PATH):
-    dim   = embeddings.shape[1]
-    index = faiss.IndexFlatIP(dim)          # cosine ≈ dot-product sobre vectores L2
-    index.add(embeddings)
-    faiss.write_index(index, str(path))
+from app.modules.chatbot.index_service import get_product_index_service, load_products
+from app.modules.chatbot.streaming_ingest import (DEFAULT_CHUNK_ROWS, DEFAULT_ENCODE_BATCH,
+                                                  PipelineStats, csv_batches)
 
 # ────────────────────────────────────────────────────────────────────────────
-def main(csv_path):
-    if not os.path.exists(csv_path):
-        print(f"CSV {csv_path} not found")
+def main(source_path, chunk_rows=DEFAULT_CHUNK_ROWS, encode_batch=DEFAULT_ENCODE_BATCH):
+    if not os.path.exists(source_path):
+        print(f"File {source_path} not found")
         return
 
-    print("Loading CSV …")
-    df    = pd.read_csv(csv_path)
-    texts = [normalize_text(r) for _, r in df.iterrows()]
-
-    print(f"Generating embeddings with {MODEL_NAME} …")
-    model      = SentenceTransformer(MODEL_NAME)
-    embeddings = model.encode(
-        texts,
-        show_progress_bar=True,
-        batch_size=64,
-        normalize_embeddings=True        # ⬅️  L2 = 1 desde aquí
-    ).astype("float32")
-
-    print("Saving SQLite database …")
-    build_sqlite(df)
-
-    print("Building FAISS index …")
-    build_faiss(embeddings)
+    service = get_product_index_service()
+    pipeline = PipelineStats()
+    start = time.perf_counter()
+    if source_path.lower().endswith(".csv"):
+        # CSV: por lotes, vectorizando en otro hilo mientras se lee el lote siguiente
+        print(f"Streaming {source_path} ({chunk_rows} rows per chunk) with {service.model_name} …")
+        stats = service.sync_stream(csv_batches(source_path, chunk_rows, pipeline),
+                                    encode_batch, pipeline)
+    else:
+        print(f"Loading {source_path} …")
+        products = load_products(source_path)
+        print(f"Indexing {len(products)} products with {service.model_name} …")
+        stats = service.sync(products)
+    elapsed = time.perf_counter() - start
 
-    print(f"Done! Saved\n  • {DB_PATH}\n  • {INDEX_PATH}")
+    print(f"Done in {elapsed:.1f}s ({stats['products']} products, {stats['chunks']} chunks, "
+          f"{stats['build']}, {stats['embedded']} embedded, {stats['removed']} removed, "
+          f"index {service.index_store.params})\n"
+          f"  • {service.metadata_path(stats['version'])}\n"
+          f"  • {service.columns_path(stats['version'])}\n"
+          f"  • {service.index_store.manifest_path}")
+    for stage, report in pipeline.report().items():
+        if stage != "total":
+            print(f"  {stage:<8}{report['seconds']:>9.2f}s {report['per_second']:>12,.0f} /s")
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python ingest.py <csv_file>")
-        sys.exit(1)
-    main(sys.argv[1])
+    ap = argparse.ArgumentParser(description="Indexa productos (catálogo JSON o CSV)")
+    ap.add_argument("source", help="catalog.json | products.csv")
+    ap.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS,
+                    help="filas de CSV por lote")
+    ap.add_argument("--batch-size", type=int, default=DEFAULT_ENCODE_BATCH,
+                    help="textos por llamada al modelo")
+    args = ap.parse_args()
+    main(args.source, args.chunk_rows, args.batch_size)
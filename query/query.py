@@ -1,23 +1,23 @@
 """
 query.py – busca en el índice FAISS y aplica filtrado estructurado.
 
+Modelo, índice y metadatos son los del servicio compartido con el RAG
+(app/modules/chatbot/index_service.py).
+
 Uso:
     python query.py "¿Tienen calderas de más de 17000 W?" [-k 5]
 """
 
-import sys, argparse, re, sqlite3, faiss, numpy as np
-from sentence_transformers import SentenceTransformer
+import sys, argparse, re, numpy as np
 from pathlib import Path
-from rich.table import Table
-from rich import print
 
 SCRIPT_DIR = Path(__file__).resolve().parent
-DB_PATH    = SCRIPT_DIR.parent / "embeddings" / "products.db"
-INDEX_PATH = SCRIPT_DIR.parent / "embeddings" / "products.faiss"
-MODEL_NAME = "sentence-transformers/distiluse-base-multilingual-cased-v2"
+if str(SCRIPT_DIR.parent) not in sys.path:      # uso como script: python query/query.py
+    sys.path.insert(0, str(SCRIPT_DIR.parent))
+
+from app.modules.chatbot.index_service import get_product_index_service
 
 TOP_K_DEFAULT = 3
-SEARCH_POOL_K = 80           # se recuperan más, luego se filtra
 
 # ────────────────────────────────────────────────────────────────────────────
 def _extract_watts(text: str) -> float | None:
@@ -26,58 +26,106 @@ def _extract_watts(text: str) -> float | None:
     if not m:
         return None
     val = float(m.group(1).replace(",", "."))
-    factor = m.group(2).lower()
-    if factor == "kw":
+    factor = m.group(2).lower()          # prefijo antes de la “w”
+    if factor == "k":
         val *= 1_000
-    elif factor == "mw":
+    elif factor == "m":
         val *= 1_000_000
     return val
 
-def _embed(text: str, model):
-    return model.encode([text], normalize_embeddings=True).astype("float32")
+_HIT_FIELDS = ("type", "family", "model", "description",
+               "dimentions", "power_w", "liters", "max_pressure_bar")
 
-def _fetch_rows(conn, ids):
-    ph = ",".join("?" * len(ids))
-    sql = f"""
-        SELECT rowid, type, family, model, description,
-               dimentions, power_w, liters, max_pressure_bar
-        FROM products WHERE rowid IN ({ph})
+def _fetch_rows(columns, positions):
+    """
+    posición → registro, indexando el snapshot columnar mapeado en memoria
+    (ver app/modules/chatbot/columnar_store.py): sin SQL ni copia por worker.
     """
-    rows = conn.execute(sql, ids).fetchall()
-    return {r[0]: r[1:] for r in rows}
+    return {i: columns.row(i, _HIT_FIELDS) for i in positions if 0 <= i < len(columns)}
+
+def _load_resources():
+    """
+    Servicio de índice + versión cargada (ver `IndexSnapshot`): las posiciones
+    que devuelve la búsqueda se leen del snapshot columnar de esa misma
+    versión, aunque otro hilo sincronice el catálogo en el medio.
+    """
+    service = get_product_index_service()
+    return service, service.snapshot()
+
+def warmup():
+    """Precarga los recursos (y el modelo) para que la primera búsqueda no pague la carga."""
+    service, _ = _load_resources()
+    service.model
 
 # ────────────────────────────────────────────────────────────────────────────
+def _question_filters(question):
+    """Filtros implícitos en la pregunta: tipo “caldera” y potencia mínima."""
+    return ("caldera" if "caldera" in question.lower() else None,
+            _extract_watts(question))
+
 def search_filtered(question: str, top_k: int = TOP_K_DEFAULT):
     """
     Devuelve una lista de dicts con los mejores productos,
     aplicando filtro por potencia y tipo “caldera” si procede.
+    El filtro se aplica dentro de FAISS: si hay `top_k` productos que lo
+    cumplen, se devuelven `top_k`.
     """
-    watts_req   = _extract_watts(question)
-    want_boiler = "caldera" in question.lower()
+    return search_filtered_batch([question], top_k)[0]
+
+def search_filtered_batch(questions, top_k=TOP_K_DEFAULT):
+    """
+    Versión por lotes de `search_filtered`: un solo `encode` para todas las
+    preguntas y un `index.search` por cada combinación de filtros distinta
+    (ver app/batching.py).
+
+    `top_k` puede ser un entero o una lista con un valor por pregunta.
+    Devuelve una lista de resultados por pregunta, en el mismo orden.
+    """
+    if not questions:
+        return []
+    top_ks = [top_k] * len(questions) if isinstance(top_k, int) else list(top_k)
 
     # recursos singleton
-    global _IDX, _MODEL, _CONN
-    if "_IDX" not in globals():
-        _MODEL = SentenceTransformer(MODEL_NAME)
-        _IDX   = faiss.read_index(str(INDEX_PATH))
-        _CONN  = sqlite3.connect(str(DB_PATH))
+    service, snapshot = _load_resources()
+
+    embeddings = service.embed_queries(questions)
 
-    D, I = _IDX.search(_embed(question, _MODEL), SEARCH_POOL_K)
+    groups = {}   # filtros → posiciones de las preguntas
+    for q, question in enumerate(questions):
+        groups.setdefault(_question_filters(question), []).append(q)
 
-    valid_idxs = [i for i in I[0] if i != -1]
-    rows = _fetch_rows(_CONN, [int(i)+1 for i in I[0]])  # FAISS usa índices 0-based, SQLite rowid es 1-based
+    hits = [None] * len(questions)
+    for (type_contains, min_power), positions in groups.items():
+        k = max(top_ks[q] for q in positions)
+        D, I = service.search(embeddings[positions], k, type_contains=type_contains,
+                              min_power=min_power, snapshot=snapshot)
+        for row, q in enumerate(positions):
+            hits[q] = (D[row], I[row])
+
+    positions = sorted({int(i) for _, idxs in hits for i in idxs if i != -1})
+    rows = _fetch_rows(snapshot.columns, positions)
+
+    return [
+        _filter_hits(question, *hits[q], rows, k)
+        for q, (question, k) in enumerate(zip(questions, top_ks))
+    ]
+
+def _filter_hits(question, dists, idxs, rows, top_k):
+    """Arma los resultados de una pregunta (re-verifica el filtro contra los metadatos)."""
+    boiler_req, watts_req = _question_filters(question)
 
     resultados = []
-    for idx, dist in zip(valid_idxs, D[0]):
-        rowid = int(idx) + 1  # FAISS usa índices 0-based, SQLite rowid es 1-based
-        if rowid not in rows:
+    for idx, dist in zip(idxs, dists):
+        if idx == -1:
+            continue
+        if int(idx) not in rows:
             continue
         (
             typ, fam, mod, desc,
             dims, pwr, lts, pbar
-        ) = rows[rowid]
+        ) = rows[int(idx)]
 
-        if want_boiler and typ.lower() != "caldera":
+        if boiler_req and boiler_req not in (typ or "").lower():   # "CALDERA MURAL", ...
             continue
         if watts_req and (pwr or 0) < watts_req:
             continue
@@ -100,6 +148,8 @@ def search_filtered(question: str, top_k: int = TOP_K_DEFAULT):
 # ────────────────────────────────────────────────────────────────────────────
 def _cli():
     import argparse
+    from rich.table import Table
+    from rich import print
     ap = argparse.ArgumentParser()
     ap.add_argument("question")
     ap.add_argument("-k", "--top_k", type=int, default=TOP_K_DEFAULT)
@@ -0,0 +1,192 @@
+"""
+benchmark_embeddings.py - compara los backends de embeddings (torch vs ONNX int8)
+
+Para cada backend mide, en un proceso aparte (RSS limpio):
+    - tiempo de carga
+    - RSS del proceso después de cargar y vectorizar
+    - latencia de una consulta (p50 / p95)
+    - throughput vectorizando el catálogo por lotes (textos/s)
+
+Y contra el backend de referencia (torch) informa la paridad:
+    - coseno entre los vectores de cada texto (media / mínimo / p5)
+    - coincidencia del top-k de productos recuperados para cada consulta
+
+Uso:
+    python scripts/benchmark_embeddings.py
+    python scripts/benchmark_embeddings.py --model sentence-transformers/distiluse-base-multilingual-cased-v2
+    python scripts/benchmark_embeddings.py --runs 200 --json resultados.json
+
+Requisitos:
+    pip install sentence-transformers onnx onnxruntime
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+CATALOG_PATH = ROOT_DIR / "data" / "products_catalog.json"
+DEFAULT_MODEL = "paraphrase-multilingual-MiniLM-L12-v2"
+QUESTIONS = [
+    "tengo frío en el living",
+    "necesito calefacción para toda la casa",
+    "¿qué caldera me recomendás para 120 m2?",
+    "quiero agua caliente para una familia de 4",
+    "radiador eléctrico para el baño",
+    "toallero para baño chico",
+    "piso radiante para un departamento",
+    "caldera doble servicio con wifi",
+    "climatizar la pileta",
+    "¿qué opciones tengo para calentar un ambiente chico?",
+]
+
+
+def _rss_mb() -> float:
+    """RSS actual del proceso en MB (Linux: /proc; otros: pico vía resource)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _catalog_texts():
+    from app.modules.chatbot.chunking import chunk_catalog
+    with open(CATALOG_PATH, encoding="utf-8") as f:
+        products = json.load(f)
+    # mismos fragmentos que se indexan en el servicio de índice
+    return [chunk["text"] for chunk in chunk_catalog(products)]
+
+
+def _run_backend(backend, model_name, texts, runs, batch_size, queue):
+    """Corre en un proceso hijo: mide un backend y devuelve sus vectores."""
+    try:
+        _measure_backend(backend, model_name, texts, runs, batch_size, queue)
+    except Exception as e:  # el padre no debe quedar esperando
+        queue.put({"backend": backend, "error": f"{type(e).__name__}: {e}"})
+
+
+def _measure_backend(backend, model_name, texts, runs, batch_size, queue):
+    from app.embeddings import create_embedding_backend
+
+    start = time.perf_counter()
+    model = create_embedding_backend(model_name, backend)
+    load_s = time.perf_counter() - start
+    if model.name != backend:
+        queue.put({"backend": backend, "error": f"no disponible (se cargó {model.name})"})
+        return
+
+    model.encode(QUESTIONS[:2], normalize_embeddings=True)  # calentamiento
+    latencies = []
+    for i in range(runs):
+        t = time.perf_counter()
+        model.encode([QUESTIONS[i % len(QUESTIONS)]], normalize_embeddings=True)
+        latencies.append((time.perf_counter() - t) * 1000)
+
+    t = time.perf_counter()
+    catalog = model.encode(texts, batch_size=batch_size, normalize_embeddings=True)
+    throughput = len(texts) / (time.perf_counter() - t)
+    questions = model.encode(QUESTIONS, normalize_embeddings=True)
+
+    queue.put({
+        "backend": backend,
+        "load_s": round(load_s, 2),
+        "rss_mb": round(_rss_mb(), 1),
+        "latency_p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "latency_p95_ms": round(float(np.percentile(latencies, 95)), 2),
+        "throughput_texts_s": round(throughput, 1),
+        "catalog": catalog.tolist(),
+        "questions": questions.tolist(),
+    })
+
+
+def measure(backend, model_name, texts, runs, batch_size):
+    ctx = mp.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_run_backend,
+                       args=(backend, model_name, texts, runs, batch_size, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+
+def parity(reference, candidate, top_k=5):
+    """Coseno por texto y coincidencia de top-k entre dos backends."""
+    ref_cat, cand_cat = np.array(reference["catalog"]), np.array(candidate["catalog"])
+    ref_q, cand_q = np.array(reference["questions"]), np.array(candidate["questions"])
+
+    cosines = np.concatenate([(ref_cat * cand_cat).sum(1), (ref_q * cand_q).sum(1)])
+    ref_top = np.argsort(-(ref_q @ ref_cat.T), axis=1)[:, :top_k]
+    cand_top = np.argsort(-(cand_q @ cand_cat.T), axis=1)[:, :top_k]
+    overlap = [len(set(a) & set(b)) / top_k for a, b in zip(ref_top, cand_top)]
+    top1 = float(np.mean(ref_top[:, 0] == cand_top[:, 0]))
+
+    return {
+        "cosine_mean": round(float(cosines.mean()), 4),
+        "cosine_min": round(float(cosines.min()), 4),
+        "cosine_p5": round(float(np.percentile(cosines, 5)), 4),
+        f"top{top_k}_overlap": round(float(np.mean(overlap)), 3),
+        "top1_agreement": round(top1, 3),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    ap.add_argument("--model", default=DEFAULT_MODEL)
+    ap.add_argument("--backends", default="torch,onnx-int8",
+                    help="lista separada por comas; el primero es la referencia")
+    ap.add_argument("--runs", type=int, default=100, help="consultas para medir latencia")
+    ap.add_argument("--batch-size", type=int, default=32)
+    ap.add_argument("--json", help="guardar los resultados en este archivo")
+    args = ap.parse_args()
+
+    texts = _catalog_texts()
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    print(f"Modelo: {args.model}, {len(texts)} textos de catálogo, {len(QUESTIONS)} consultas\n")
+
+    results = [measure(b, args.model, texts, args.runs, args.batch_size) for b in backends]
+    reference = results[0]
+
+    header = f"{'backend':<12}{'carga s':>9}{'RSS MB':>9}{'p50 ms':>9}{'p95 ms':>9}{'textos/s':>10}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        if "error" in r:
+            print(f"{r['backend']:<12}{r['error']}")
+            continue
+        print(f"{r['backend']:<12}{r['load_s']:>9}{r['rss_mb']:>9}{r['latency_p50_ms']:>9}"
+              f"{r['latency_p95_ms']:>9}{r['throughput_texts_s']:>10}")
+
+    report = {"model": args.model, "backends": [], "parity": {}}
+    for r in results:
+        report["backends"].append({k: v for k, v in r.items() if k not in ("catalog", "questions")})
+        if r is reference or "error" in r or "error" in reference:
+            continue
+        report["parity"][r["backend"]] = parity(reference, r)
+
+    for name, p in report["parity"].items():
+        print(f"\nParidad {name} vs {reference['backend']}:")
+        for k, v in p.items():
+            print(f"  {k:<16}{v}")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"\nResultados guardados en {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+benchmark_index.py - compara los niveles de índice (flat vs HNSW vs IVF-PQ)
+
+Para cada nivel mide, sobre los mismos vectores:
+    - tiempo de construcción (entrenamiento incluido) y tamaño en disco
+    - parámetros de búsqueda calibrados (efSearch / nprobe + k_factor)
+    - recall@k contra la verdad exacta (flat)
+    - latencia por consulta (p50 / p95) y QPS por lotes
+
+Vectores:
+    - por defecto, los del índice persistido de productos (embeddings/)
+    - con --synthetic N, N vectores al azar agrupados en clusters (simula un
+      corpus de repuestos / manuales de ese tamaño)
+
+Uso:
+    python scripts/benchmark_index.py
+    python scripts/benchmark_index.py --synthetic 200000 --dim 384 --target-recall 0.95
+    python scripts/benchmark_index.py --synthetic 50000 --tiers hnsw,ivfpq --json resultados.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from app.modules.chatbot.index_tiers import (TIERS, build_index, calibration_queries,
+                                             choose_tier, exact_neighbors, recall_at_k)
+
+
+def _persisted_vectors():
+    from app.modules.chatbot.index_service import get_product_index_service
+    service = get_product_index_service()
+    service.ensure_loaded()
+    return service.index.reconstruct_n(0, service.index.ntotal)
+
+
+def _synthetic_vectors(count, dim, seed=0):
+    """Vectores normalizados alrededor de √n centros (los embeddings reales también se agrupan)."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, int(np.sqrt(count))), dim)).astype("float32")
+    labels = rng.integers(0, len(centers), count)
+    vectors = centers[labels] + 0.6 * rng.normal(size=(count, dim)).astype("float32")
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def measure(tier, vectors, queries, truth, k, target_recall):
+    start = time.perf_counter()
+    index, params = build_index(vectors, tier, target_recall)
+    build_s = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "index.faiss")
+        faiss.write_index(index, path)
+        size_mb = os.path.getsize(path) / 1e6
+
+    index.search(queries[:8], k)  # calentamiento
+    latencies = []
+    for q in queries:
+        t = time.perf_counter()
+        index.search(q[None, :], k)
+        latencies.append((time.perf_counter() - t) * 1000)
+    t = time.perf_counter()
+    _, found = index.search(queries, k)
+    qps = len(queries) / (time.perf_counter() - t)
+
+    return {
+        "tier": tier,
+        "build_s": round(build_s, 2),
+        "size_mb": round(size_mb, 1),
+        "param": {n: params[n] for n in ("efSearch", "nprobe", "k_factor") if n in params},
+        f"recall@{k}": round(recall_at_k(found, truth), 4),
+        "latency_p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "latency_p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "qps_batch": round(qps, 1),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    ap.add_argument("--synthetic", type=int, help="usar N vectores sintéticos")
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--tiers", default=",".join(TIERS))
+    ap.add_argument("--target-recall", type=float, default=0.95)
+    ap.add_argument("--queries", type=int, default=500)
+    ap.add_argument("-k", type=int, default=10)
+    ap.add_argument("--json", help="guardar los resultados en este archivo")
+    args = ap.parse_args()
+
+    vectors = (_synthetic_vectors(args.synthetic, args.dim) if args.synthetic
+               else np.ascontiguousarray(_persisted_vectors(), dtype="float32"))
+    k = min(args.k, len(vectors))
+    queries = calibration_queries(vectors, args.queries, seed=1)  # distintas a las de calibración
+    truth = exact_neighbors(vectors, queries, k)
+    print(f"{len(vectors)} vectores de dimensión {vectors.shape[1]}, {len(queries)} consultas, "
+          f"nivel automático: {choose_tier(len(vectors), args.target_recall, 'auto')}\n")
+
+    results = [measure(t.strip(), vectors, queries, truth, k, args.target_recall)
+               for t in args.tiers.split(",") if t.strip()]
+
+    header = (f"{'nivel':<8}{'build s':>9}{'MB':>8}{'param':>24}{'recall':>9}"
+              f"{'p50 ms':>9}{'p95 ms':>9}{'QPS':>10}")
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        param = ",".join(f"{n}={v}" for n, v in r["param"].items()) or "-"
+        print(f"{r['tier']:<8}{r['build_s']:>9}{r['size_mb']:>8}{param:>24}{r[f'recall@{k}']:>9}"
+              f"{r['latency_p50_ms']:>9}{r['latency_p95_ms']:>9}{r['qps_batch']:>10}")
+
+    if args.json:
+        report = {"vectors": len(vectors), "dim": int(vectors.shape[1]), "k": k,
+                  "target_recall": args.target_recall, "results": results}
+        Path(args.json).write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"\nResultados guardados en {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+"""Configuración común de pytest: la raíz del repo en el path para importar `app`."""
+
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
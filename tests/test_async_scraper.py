@@ -0,0 +1,98 @@
+"""Scraper asíncrono contra un sitio simulado con `httpx.MockTransport`."""
+
+import asyncio
+import time
+
+import httpx
+
+from app.modules.scraping import async_scraper
+from app.modules.scraping.async_scraper import TokenBucket, scrape_products
+from app.modules.scraping.product_scraper import CatalogWriter
+
+BASE_URL = "https://peisa.test"
+PRODUCTS = 4
+TIMEOUT = 5     # una pausa sin acotar haría fallar el test en lugar de colgarlo
+
+
+def listing_html(count=PRODUCTS):
+    cards = "".join(
+        f'<a href="/productos/p{i}"><article><div class="text-peisared-600">CALDERA</div>'
+        f'<h4>Modelo {i}</h4><p>Desc {i}</p></article></a>'
+        for i in range(count)
+    )
+    return ('<html><body><h1>Calderas centrales</h1><p class="text-peisared-600">De potencia</p>'
+            f'{cards}</body></html>')
+
+
+def detail_html(i):
+    return f"<html><body><h1>Modelo {i}</h1><p>Ficha del modelo {i}</p></body></html>"
+
+
+def scrape(handler, sink, **kwargs):
+    kwargs = dict(dict(concurrency=PRODUCTS, rate=1000, retries=2), **kwargs)
+    scraping = scrape_products(sink, base_url=BASE_URL,
+                               transport=httpx.MockTransport(handler), **kwargs)
+    return asyncio.run(asyncio.wait_for(scraping, TIMEOUT))
+
+
+def test_pause_blocks_the_host_after_an_idle_bucket():
+    async def run():
+        bucket = TokenBucket(rate=100)
+        await asyncio.sleep(0.1)        # tiempo ocioso antes de la pausa
+        bucket.pause(0.1)
+        start = time.monotonic()
+        await bucket.acquire()
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) >= 0.08
+
+
+def test_retries_429_with_retry_after_and_5xx(monkeypatch):
+    monkeypatch.setattr(async_scraper, 'BACKOFF_BASE', 0.01)
+    monkeypatch.setattr(async_scraper, 'BACKOFF_MAX', 0.05)
+    calls = []
+
+    def handler(request):
+        path = request.url.path
+        calls.append(path)
+        if path == "/productos":
+            if calls.count(path) == 1:
+                # Retry-After se acota a BACKOFF_MAX: el test no espera una hora
+                return httpx.Response(429, headers={'Retry-After': "3600"})
+            return httpx.Response(200, text=listing_html())
+        i = int(path.rsplit("p", 1)[1])
+        if i == 1 and calls.count(path) == 1:
+            return httpx.Response(503)
+        return httpx.Response(200, text=detail_html(i))
+
+    products = {}
+    done = scrape(handler, lambda position, product: products.update({position: product}))
+
+    assert done == PRODUCTS
+    assert calls.count("/productos") == 2
+    assert calls.count("/productos/p1") == 2
+    assert [products[i]['model'] for i in range(PRODUCTS)] == [f"Modelo {i}" for i in range(PRODUCTS)]
+
+
+def test_catalog_writer_keeps_listing_order(tmp_path):
+    async def handler(request):
+        path = request.url.path
+        if path == "/productos":
+            return httpx.Response(200, text=listing_html())
+        i = int(path.rsplit("p", 1)[1])
+        await asyncio.sleep(0.02 * (PRODUCTS - i))     # los primeros del listado terminan últimos
+        return httpx.Response(200, text=detail_html(i))
+
+    writer = CatalogWriter(str(tmp_path / "catalog.json"))
+    completed = []
+
+    def sink(position, product):
+        completed.append(position)
+        writer.add(position, product)
+
+    scrape(handler, sink)
+    saved = writer.close()
+
+    assert completed != sorted(completed)
+    assert [p['model'] for p in saved] == [f"Modelo {i}" for i in range(PRODUCTS)]
+    assert writer.added_count == PRODUCTS
@@ -0,0 +1,134 @@
+"""Ingesta incremental de ProductIndexService con un backend de embeddings de prueba."""
+
+import hashlib
+import json
+
+import numpy as np
+import pandas as pd
+
+from app.embeddings import EmbeddingBackend
+from app.modules.chatbot import rag_engine_v2
+from app.modules.chatbot.index_service import ProductIndexService, load_products
+from app.modules.chatbot.streaming_ingest import csv_batches
+
+DIMENSION = 16
+
+
+class StubBackend(EmbeddingBackend):
+    """Vectores deterministas derivados del hash del texto; registra lo vectorizado"""
+
+    name = "torch"  # mismos vectores que el backend por defecto: no re-etiqueta el índice
+
+    def __init__(self, model_name: str):
+        super().__init__(model_name)
+        self.encoded = []
+
+    @property
+    def dimension(self) -> int:
+        return DIMENSION
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False, normalize_embeddings=False):
+        self.encoded.extend(texts)
+        vectors = np.stack([
+            np.random.default_rng(int(hashlib.sha256(t.encode()).hexdigest()[:16], 16))
+            .standard_normal(DIMENSION) for t in texts
+        ]).astype('float32')
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_products(count=10):
+    return [{
+        'model': f"Modelo {i}",
+        'description': f"Caldera de prueba número {i}",
+        'category': "Calderas",
+        'type': "CALDERA MURAL",
+        'family': "Calderas",
+        'url': f"https://example.com/productos/p{i}",
+        'power_w': 1000 * (i + 1),
+    } for i in range(count)]
+
+
+def make_service(directory):
+    service = ProductIndexService(model_name="stub", directory=directory, backend="torch")
+    service._model = StubBackend(service.model_name)
+    return service
+
+
+def test_modified_product_is_the_only_one_reembedded(tmp_path):
+    service = make_service(tmp_path)
+    products = make_products()
+    service.sync(products)
+    service.model.encoded.clear()
+
+    products[3] = dict(products[3], description="Caldera renovada")
+    result = service.sync(products)
+
+    assert result['build'] == 'upsert'
+    assert result['embedded'] == len(service.model.encoded) > 0
+    assert all("Modelo 3" in text for text in service.model.encoded)
+    assert result['removed'] == result['embedded']
+
+
+def test_deleted_product_is_masked_by_tombstones(tmp_path):
+    service = make_service(tmp_path)
+    products = make_products()
+    service.sync(products)
+    deleted = [t for t, c in zip(service.texts, service.chunks) if c['product'] == 5]
+
+    result = service.sync(products[:5] + products[6:])
+
+    assert result['build'] == 'upsert'
+    assert result['embedded'] == 0
+    assert result['removed'] == len(deleted)
+    assert service.stats()['tombstones'] == len(deleted)
+    _, positions = service.search(service.model.encode(deleted), k=len(products))
+    found = [service.get(int(p))['model'] for p in positions.ravel() if p >= 0]
+    assert "Modelo 5" not in found
+    assert len(set(found)) == len(products) - 1
+
+
+def test_sync_and_sync_stream_commit_the_same_version(tmp_path):
+    csv = tmp_path / "products.csv"
+    pd.DataFrame(make_products()).to_csv(csv, index=False)
+
+    batch = make_service(tmp_path / "batch")
+    stream = make_service(tmp_path / "stream")
+    batch_result = batch.sync(load_products(csv))
+    stream_result = stream.sync_stream(csv_batches(csv, rows=3))
+
+    assert batch_result['version'] == stream_result['version']
+    manifests = [json.loads(s.index_store.manifest_path.read_text(encoding='utf-8'))
+                 for s in (batch, stream)]
+    assert manifests[0]['catalog_hash'] == manifests[1]['catalog_hash'] == batch_result['version']
+    assert manifests[0]['entries'] == manifests[1]['entries']
+
+
+def test_snapshot_resolves_positions_of_its_own_version(tmp_path):
+    service = make_service(tmp_path)
+    products = make_products()
+    service.sync(products)
+    snapshot = service.snapshot()
+    query = service.model.encode([t for t, c in zip(service.texts, service.chunks) if c['product'] == 7])
+
+    service.sync(products[1:])     # otra versión: las posiciones se corren una
+    _, positions = service.search(query, k=1, snapshot=snapshot)
+
+    position = int(positions[0, 0])
+    assert snapshot.products[position]['model'] == "Modelo 7"
+    assert snapshot.columns.row(position, ("model",))[0] == "Modelo 7"
+    assert service.get(position)['model'] == "Modelo 8"
+
+
+def test_rag_engine_reads_products_from_the_shared_index(tmp_path, monkeypatch):
+    service = make_service(tmp_path / "index")
+    monkeypatch.setattr(rag_engine_v2, 'get_product_index_service', lambda: service)
+    catalog = tmp_path / "catalog.json"
+    products = make_products()
+    catalog.write_text(json.dumps(products), encoding='utf-8')
+    engine = rag_engine_v2.RAGEngineV2(str(catalog))
+    question = "Caldera de prueba número 7"
+
+    service.sync(products[1:])     # otro proceso de ingesta re-sincroniza el servicio compartido
+
+    assert engine.search_products(question, top_k=1)[0]['model'] == "Modelo 7"
+    assert engine._search_batch([(question, 1)])[0][1][0]['model'] == "Modelo 7"
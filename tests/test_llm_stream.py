@@ -0,0 +1,138 @@
+"""Paridad entre `OllamaLLM.astream` y `generate` (post-procesamiento, caché, corte)."""
+
+import asyncio
+import threading
+
+import pytest
+
+from app.modules.chatbot.llm_wrapper import OllamaLLM
+from app.modules.chatbot.response_cache import ResponseCache
+
+CONTEXT = [{'model': 'Prima Tec Smart', 'family': 'Calderas', 'description': 'Caldera mural'}]
+
+
+class FakeStream:
+    """Stream de Ollama que entrega el texto en fragmentos y registra si se cerró"""
+
+    def __init__(self, text, size):
+        self.parts = [text[i:i + size] for i in range(0, len(text), size)]
+        self.consumed = 0
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.consumed == len(self.parts):
+            raise StopAsyncIteration
+        self.consumed += 1
+        return {'response': self.parts[self.consumed - 1]}
+
+    async def aclose(self):
+        self.closed = True
+
+
+class FakeAsyncClient:
+    def __init__(self, text, size=7):
+        self.text, self.size = text, size
+        self.streams = []
+
+    async def generate(self, stream=False, **kwargs):
+        if not stream:
+            return {'response': self.text}
+        self.streams.append(FakeStream(self.text, self.size))
+        return self.streams[-1]
+
+
+def make_llm(text, size=7, cache=None):
+    llm = OllamaLLM(response_cache=cache if cache is not None else ResponseCache())
+    llm.async_client = FakeAsyncClient(text, size)
+    return llm
+
+
+def collect(llm, question="Necesito calefacción para mi casa"):
+    async def run():
+        return [part async for part in llm.astream(question, CONTEXT)]
+    return asyncio.run(run())
+
+
+def sentence(i, words=11):
+    return " ".join(f"palabra{i}_{w}" for w in range(words - 1)) + " final."
+
+
+LONG = " ".join(sentence(i) for i in range(8))                 # 88 palabras: se recorta a 3 oraciones
+SHORT = "Te recomiendo la Prima Tec Smart porque calefacciona toda la casa. ¡Ideal! Tiene control wifi!"
+CASES = [
+    LONG,
+    SHORT,
+    "Hola. " + LONG,                                          # oración corta descartada al recortar
+    " ".join(sentence(i, 30) for i in range(4)),              # 3 oraciones que no entran en 70 palabras
+    "Sale $ 1.234 USD pero " + LONG,                          # sanitización de precios
+    "La potencia es de 24.5 kW en modo calefacción y agua. " + " ".join(["muy"] * 80),
+    "Una respuesta sin puntuación " + " ".join(["larga"] * 90),
+    "Respuesta corta con cierre raro!)",
+]
+
+
+@pytest.mark.parametrize("text", CASES)
+@pytest.mark.parametrize("size", [1, 5, 64])
+def test_stream_matches_postprocess(text, size):
+    llm = make_llm(text, size)
+    assert "".join(collect(llm)) == llm._postprocess(text)
+
+
+def test_long_answer_is_truncated_like_generate():
+    llm = make_llm(LONG)
+    streamed = "".join(collect(llm))
+    assert streamed == llm._truncate_to_brief(LONG)
+    assert streamed.count(" final.") == 3
+
+
+def test_stream_closes_ollama_generation_once_determined():
+    llm = make_llm(LONG, size=3)
+    collect(llm)
+    stream = llm.async_client.streams[0]
+    assert stream.closed
+    assert stream.consumed < len(stream.parts)
+
+
+def test_short_answer_is_streamed_before_the_end():
+    llm = make_llm(SHORT, size=3)
+    parts = collect(llm)
+    assert len(parts) > 1
+    assert llm.async_client.streams[0].closed
+
+
+def test_streamed_answer_in_cache_matches_generate():
+    llm = make_llm(LONG)
+    streamed = "".join(collect(llm))
+
+    # `agenerate` lee la misma clave: debe obtener la respuesta ya recortada
+    fresh = make_llm(LONG)
+    expected = asyncio.run(fresh.agenerate("Necesito calefacción para mi casa", CONTEXT))
+    llm.async_client.text = "otra respuesta"
+    assert asyncio.run(llm.agenerate("Necesito calefacción para mi casa", CONTEXT)) == expected == streamed
+
+
+def test_sync_fallback_runs_outside_the_event_loop(monkeypatch):
+    llm = make_llm(SHORT)
+    llm.async_client = None
+    threads = []
+
+    def generate_with_status(*args):
+        threads.append(threading.get_ident())
+        return "Respuesta.", False
+
+    monkeypatch.setattr(llm, 'generate_with_status', generate_with_status)
+    monkeypatch.setattr(llm, 'generate', lambda *args: generate_with_status(*args)[0])
+
+    async def run():
+        loop_thread = threading.get_ident()
+        answer = await llm.agenerate_with_status("Necesito calefacción", CONTEXT)
+        streamed = [part async for part in llm.astream("Necesito calefacción", CONTEXT)]
+        return loop_thread, answer, streamed
+
+    loop_thread, answer, streamed = asyncio.run(run())
+    assert answer == ("Respuesta.", False)
+    assert streamed == ["Respuesta."]
+    assert len(threads) == 2 and loop_thread not in threads